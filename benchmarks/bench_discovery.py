@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+"""How long discovery takes to enumerate a /24, against simulated cameras on loopback.
+
+Cameras answer on a handful of 127.0.0.x addresses, everything else in 127.0.0.0/24 stays quiet,
+which is the common case on a real network too. "first" is when the first camera turned up, "all"
+when the last one did and "done" when the search gave up on the rest.
+Run from the repository root: python3 benchmarks/bench_discovery.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.discovery import scan  # noqa: E402
+from ptz.simulator import SimulatedCamera  # noqa: E402
+
+ADDRESSES = ["127.0.0.%d" % host for host in (10, 11, 12, 50, 99, 128, 200, 254)]
+SCENARIOS = [
+    ("probe, 256 in flight", dict(broadcast_address=None)),
+    ("probe, 64 in flight", dict(broadcast_address=None, parallel=64)),
+    ("probe, 2ms latency", dict(broadcast_address=None)),
+    ("probe + broadcast", dict(broadcast_address="127.0.0.10", wait=0.25)),
+]
+
+
+def run(options):
+    arrivals = []
+    start = time.perf_counter()
+    found = scan("127.0.0.0/24", lambda camera: arrivals.append(time.perf_counter() - start), **options)
+    return len(found), arrivals, time.perf_counter() - start
+
+
+def main():
+    print("%-24s %6s %9s %9s %9s" % ("scenario", "found", "first", "all", "done"))
+    for name, options in SCENARIOS:
+        latency = 0.002 if "latency" in name else 0.0
+        simulators = [SimulatedCamera(address, 52381, latency=latency, discovery_port=52380)
+                      for address in ADDRESSES]
+        for simulator in simulators:
+            simulator.start()
+        try:
+            count, arrivals, elapsed = run(options)
+        finally:
+            for simulator in simulators:
+                simulator.close()
+        print("%-24s %6d %7.1fms %7.1fms %7.1fms" % (name, count, min(arrivals, default=0) * 1000,
+                                                      max(arrivals, default=0) * 1000, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""Encoding cost per command: the old list/deepcopy framing versus template + struct.pack_into.
+
+Run from the repository root: python3 benchmarks/bench_encoding.py
+"""
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.commands import commands  # noqa: E402
+from ptz.protocol import HEADER, MAX_PAYLOAD, VISCA_COMMAND  # noqa: E402
+
+NUMBER = 20000
+
+SAMPLE_ARGS = {
+    "set preset x": 3,
+    "recall preset x": 3,
+    "pan absolute position": {"speed": 0.5, "pan": -0x0800, "tilt": 0x0200},
+    "pan relative position": {"pan_speed": 0.5, "tilt_speed": 0.25, "pan": 0x0100, "tilt": -0x80},
+    "move": {"speed": 0.5, "postfix": [0x01, 0x03, 0xFF]},
+    "zoom tele var": {"speed": 0.5},
+    "zoom wide var": {"speed": 0.5},
+    "zoom direct": 0x2000,
+    "focus direct": 0x1800,
+    "focus far var": {"speed": 0.5},
+    "focus near var": {"speed": 0.5},
+    "ae mode": "Manual",
+    "wb mode": "Indoor",
+    "gain set": 0x05,
+    "shutter set": 0x07,
+    "fstop set": 0x0C,
+    "ex_ae_comp set": 0x07,
+}
+
+
+def legacy_encode(command, args, sequence_number):
+    # What every send used to cost: a deep-copied list payload, then a deep-copied header list
+    # grown with extend() and converted to bytes.
+    data = bytearray(copy.deepcopy(list(command.data)))
+    if command.arg_lambda is not None:
+        command.arg_lambda(data, command.argument_offset, args)
+    prep_cmd = copy.deepcopy([0x01, 0x00])
+    prep_cmd.extend(bytearray([0x00, int(len(data))]))
+    prep_cmd.extend(bytearray(sequence_number.to_bytes(length=4, byteorder="big", signed=False)))
+    prep_cmd.extend(data)
+    return bytes(prep_cmd)
+
+
+def template_encode(buffer, view, command, args, sequence_number):
+    size = command.encode_into(buffer, HEADER.size, args)
+    HEADER.pack_into(buffer, 0, VISCA_COMMAND, size, sequence_number)
+    return view[:HEADER.size + size]
+
+
+def main():
+    buffer = bytearray(HEADER.size + MAX_PAYLOAD)
+    view = memoryview(buffer)
+
+    print("%-26s %12s %12s %8s" % ("command", "legacy ns", "template ns", "speedup"))
+    for name, command in commands.items():
+        args = SAMPLE_ARGS.get(name)
+        assert legacy_encode(command, args, 42) == bytes(template_encode(buffer, view, command, args, 42))
+
+        legacy = timeit.timeit(lambda: legacy_encode(command, args, 42), number=NUMBER) / NUMBER * 1e9
+        template = timeit.timeit(lambda: template_encode(buffer, view, command, args, 42), number=NUMBER) / NUMBER * 1e9
+        print("%-26s %12.0f %12.0f %7.1fx" % (name, legacy, template, legacy / template))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+"""Start-up cost of the headless package and CLI versus the Qt application module.
+
+Each case runs in a fresh interpreter, the best of several runs is reported.
+Run from the repository root: python3 benchmarks/bench_import.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RUNS = 10
+
+CASES = [
+    ("bare interpreter", ["-c", "pass"]),
+    ("import ptz", ["-c", "import ptz"]),
+    ("import ptz.cli", ["-c", "import ptz.cli"]),
+    ("python -m ptz list", ["-m", "ptz", "list"]),
+    ("import main (PyQt5)", ["-c", "import main"]),
+]
+
+
+def best_of(args):
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    for name, args in CASES:
+        elapsed = best_of(args)
+        if elapsed is None:
+            print("%-22s %10s" % (name, "failed"))
+        else:
+            print("%-22s %8.1f ms" % (name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
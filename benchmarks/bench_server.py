@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""How the control server copes with many clients, against a simulated camera on loopback.
+
+"connect" is the time for every client to connect and get its first state snapshot, "fan-out"
+the time from one state change until every client has read it, and "sends" the time for every
+client to get an ACK for a command of its own, which the server pipelines two at a time into the
+camera's buffer.
+Run from the repository root: python3 benchmarks/bench_server.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.camera import CameraPool  # noqa: E402
+from ptz.server import ControlServer  # noqa: E402
+from ptz.simulator import SimulatedCamera  # noqa: E402
+
+ADDRESS = "127.0.0.20"
+CLIENTS = (10, 100, 500)
+
+
+async def read_until(reader, accept):
+    while True:
+        message = json.loads(await reader.readline())
+        if accept(message):
+            return message
+
+
+async def connect(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b'{"op": "subscribe"}\n')
+    await read_until(reader, lambda message: message.get("event") == "state")
+    return reader, writer
+
+
+async def send(reader, writer, number):
+    writer.write((json.dumps({"id": number, "op": "send", "name": "brighter", "wait": "ack"}) + "\n").encode())
+    return await read_until(reader, lambda message: message.get("id") == number)
+
+
+async def run(count, port, camera):
+    started = time.perf_counter()
+    clients = await asyncio.gather(*(connect(port) for _ in range(count)))
+    connected = time.perf_counter() - started
+
+    started = time.perf_counter()
+    camera.state.update({"zoom": count})
+    await asyncio.gather(*(read_until(reader, lambda message: message.get("values", {}).get("zoom") == count)
+                           for reader, writer in clients))
+    fan_out = time.perf_counter() - started
+
+    started = time.perf_counter()
+    replies = await asyncio.gather(*(send(reader, writer, number) for number, (reader, writer) in enumerate(clients)))
+    sends = time.perf_counter() - started
+    errors = sum("error" in reply for reply in replies)
+
+    for reader, writer in clients:
+        writer.close()
+    return connected, fan_out, sends, errors
+
+
+def main():
+    simulator = SimulatedCamera(ADDRESS, 52381, execution_time=0.001)
+    simulator.start()
+    pool = CameraPool(port=0)
+    camera = pool.add(ADDRESS)
+    pool.start()
+    server = ControlServer(pool, port=0)
+    server.start()
+    try:
+        print("%8s %10s %10s %10s %7s" % ("clients", "connect", "fan-out", "sends", "errors"))
+        for count in CLIENTS:
+            connected, fan_out, sends, errors = asyncio.run(run(count, server.port, camera))
+            print("%8d %8.1fms %8.1fms %8.1fms %7d" % (count, connected * 1000, fan_out * 1000, sends * 1000, errors))
+    finally:
+        server.close()
+        pool.close()
+        simulator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""Throughput and round trip times of ViscaEngine against simulated cameras.
+
+Every scenario runs COUNT commands per camera, pipelined two at a time like a real camera's
+command buffer, with the simulators on threads of this same process. The RTTs come from the
+engine's own metrics (ACK from the last (re)transmission, completion from the first), so they're
+bucketed to within about 20%. "drops" are datagrams the simulated network lost in either
+direction, "retx" retransmissions per command, "failed" the commands that ran out of retries or
+never completed and "seqerr" the sequence errors (``0F 01``) the cameras answered, each one a
+retransmission overtaken by a newer command and sent again under a new sequence number.
+Run from the repository root: python3 benchmarks/bench_simulator.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.engine import ViscaEngine  # noqa: E402
+from ptz.metrics import Histogram  # noqa: E402
+from ptz.simulator import SimulatedCamera  # noqa: E402
+
+COUNT = 500
+EXECUTION_TIME = 0.001
+IMPAIRED = dict(latency=0.002, jitter=0.001, loss=0.01)
+
+SCENARIOS = [
+    ("1 camera, ideal", 1, dict()),
+    ("1 camera, 2ms +/-1ms, 1% loss", 1, IMPAIRED),
+    ("8 cameras, ideal", 8, dict()),
+    ("8 cameras, 2ms +/-1ms, 1% loss", 8, IMPAIRED),
+]
+
+
+def merged(engines, timing):
+    """One histogram of ``timing`` over every engine's metrics."""
+    histogram = Histogram()
+    for engine in engines:
+        part = getattr(engine.metrics.command("brighter"), timing)
+        histogram.counts = [a + b for a, b in zip(histogram.counts, part.counts)]
+        histogram.count += part.count
+        histogram.sum += part.sum
+        histogram.maximum = max(histogram.maximum, part.maximum)
+    return histogram
+
+
+async def drive(engine):
+    async def one():
+        try:
+            await engine.send("brighter")
+        except Exception:
+            return False
+        return True
+
+    return await asyncio.gather(*(one() for _ in range(COUNT)))
+
+
+async def scenario(cameras, impairments):
+    simulators = [SimulatedCamera("127.0.0.1", 0, execution_time=EXECUTION_TIME, seed=index, **impairments)
+                  for index in range(cameras)]
+    for simulator in simulators:
+        simulator.start()
+
+    engines = [ViscaEngine("127.0.0.1", simulator.port, local_port=0, ack_timeout=0.05, completion_timeout=0.5)
+               for simulator in simulators]
+    try:
+        for engine in engines:
+            await engine.open()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(drive(engine) for engine in engines))
+        elapsed = time.perf_counter() - start
+    finally:
+        for engine in engines:
+            engine.close()
+        for simulator in simulators:
+            simulator.close()
+
+    stats = [simulator.stats() for simulator in simulators]
+    datagrams = sum(s["received"] + s["acks"] + s["completions"] + s["errors"] for s in stats)
+    dropped = sum(s["dropped in"] + s["dropped out"] for s in stats)
+    commands = COUNT * cameras
+    completed = sum(sum(result) for result in results)
+    return {
+        "rate": completed / elapsed,
+        "ack": merged(engines, "ack").summary(),
+        "completion": merged(engines, "completion").summary(),
+        "drops": dropped / max(1, datagrams),
+        "retx": sum(engine.metrics.command("brighter").retransmits for engine in engines) / commands,
+        "failed": (commands - completed) / commands,
+        "sequence errors": sum(s["sequence errors"] for s in stats),
+    }
+
+
+def milliseconds(summary, key):
+    return summary[key] * 1000 if summary["count"] else float("nan")
+
+
+def main():
+    print("%-32s %9s %8s %8s %8s %8s %7s %7s %7s %6s" % ("scenario", "cmds/s", "ack p50", "ack p99", "cmp p50",
+                                                        "cmp p99", "drops", "retx", "failed", "seqerr"))
+    for name, cameras, impairments in SCENARIOS:
+        result = asyncio.run(scenario(cameras, impairments))
+        print("%-32s %9.0f %6.2fms %6.2fms %6.2fms %6.2fms %6.2f%% %6.2f%% %6.2f%% %6d" % (
+            name, result["rate"],
+            milliseconds(result["ack"], "p50"), milliseconds(result["ack"], "p99"),
+            milliseconds(result["completion"], "p50"), milliseconds(result["completion"], "p99"),
+            result["drops"] * 100, result["retx"] * 100, result["failed"] * 100, result["sequence errors"]))
+
+
+if __name__ == '__main__':
+    main()
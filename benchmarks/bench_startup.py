@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""Time from launching the Qt application to its first painted frame.
+
+The cold case has no compiled UI cache, so main.ui is parsed with uic.loadUi; the warm cases
+build the window from the cached main_ui.py the cold run leaves behind.
+Needs a display, or QT_QPA_PLATFORM=offscreen.
+Run from the repository root: python3 benchmarks/bench_startup.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RUNS = 10
+MARKER = "first frame"
+
+DRIVER = """
+import os
+from PyQt5.QtCore import QEvent, QObject
+import main
+
+
+class FirstFrame(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            print("%s", flush=True)
+            os._exit(0)
+        return False
+
+
+app = main.App(["127.0.0.1"])
+first_frame = FirstFrame()
+app.ui.installEventFilter(first_frame)
+app.main()
+""" % MARKER
+
+
+def first_frame():
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", DRIVER], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, universal_newlines=True)
+    for line in process.stdout:
+        if line.strip() == MARKER:
+            elapsed = time.perf_counter() - start
+            break
+    else:
+        elapsed = None
+    process.stdout.close()
+    process.wait()
+    return elapsed
+
+
+def report(name, times):
+    times = [elapsed for elapsed in times if elapsed is not None]
+    if not times:
+        print("%-28s %10s" % (name, "failed"))
+    else:
+        print("%-28s %8.1f ms best %8.1f ms median" % (name, min(times) * 1000,
+                                                       sorted(times)[len(times) // 2] * 1000))
+
+
+def main():
+    cache = os.path.join(ROOT, "main_ui.py")
+    if os.path.exists(cache):
+        os.remove(cache)
+    report("cold (uic.loadUi)", [first_frame()])
+
+    # The cold run compiles the cache once its window is up
+    deadline = time.monotonic() + 5
+    while not os.path.exists(cache) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    report("warm (compiled main_ui.py)", [first_frame() for _ in range(RUNS)])
+
+
+if __name__ == '__main__':
+    main()
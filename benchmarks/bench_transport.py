@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""Sends per second: a throwaway socket per datagram versus one persistent Transport.
+
+Run from the repository root: python3 benchmarks/bench_transport.py
+"""
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.transport import Transport  # noqa: E402
+
+COUNT = 20000
+PAYLOAD = bytes([0x01, 0x00, 0x00, 0x09, 0x00, 0x00, 0x00, 0x01,
+                 0x81, 0x01, 0x06, 0x01, 0x0C, 0x0A, 0x03, 0x01, 0xFF])
+
+
+def per_datagram_socket(address):
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(PAYLOAD, address)
+    return COUNT / (time.perf_counter() - start)
+
+
+def persistent_transport(address):
+    transport = Transport(address[0], address[1], local_port=0, bind_address="127.0.0.1")
+    try:
+        start = time.perf_counter()
+        for _ in range(COUNT):
+            transport.send(PAYLOAD)
+        return COUNT / (time.perf_counter() - start)
+    finally:
+        transport.close()
+
+
+def main():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    address = sink.getsockname()
+
+    before = per_datagram_socket(address)
+    after = persistent_transport(address)
+    sink.close()
+
+    print("socket per datagram  : %10.0f sends/s" % before)
+    print("persistent transport : %10.0f sends/s" % after)
+    print("speedup              : %10.2fx" % (after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,547 +1,610 @@
 #!/usr/bin/python3
+import importlib.util
 import os
 import signal
 import sys
-import copy
-import socket
+import threading
 import time
-import binascii
 from PyQt5 import uic
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import (QCoreApplication, QObject, QRunnable, QThread,
-                          QThreadPool, pyqtSignal, pyqtSlot)
-from PyQt5.uic.properties import QtCore
+from PyQt5.QtGui import QFontDatabase, QKeySequence
+from PyQt5.QtWidgets import (QAbstractSpinBox, QApplication, QComboBox, QCompleter, QInputDialog, QLineEdit,
+                             QMainWindow, QPlainTextEdit, QPushButton, QShortcut, QWidget)
+from PyQt5.QtCore import QEvent, QObject, QStringListModel, Qt, QTimer, pyqtSignal
+
+from ptz.camera import CameraPool
+from ptz.commands import DIRECTIONS, FOCUS, PAN_TILT, PRIORITY_STOP, SETTINGS, ZOOM, commands
+from ptz.hold import HoldMotion
+from ptz.metrics import format_table
+from ptz.state import InquiryPoller
+from ptz.worker import CommandWorker
 
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-
-class Command:
-    data = []
-    arg_lambda = None
-
-    def __init__(self, data, argument_lambda=None):
-        self.data = data
-        self.arg_lambda = argument_lambda
-
-    def get_command(self, args):
-        if self.arg_lambda is not None:
-            return self.arg_lambda(self, args)
-
-        return self.data
-
-
-def preset(self, args):
-    self.data[5] = args
-    return self.data
-
-
-def pan_relative_lambda(self, args):
-    data = copy.deepcopy(self.data)
-    # 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xFF
-    # VV WW 0Y 0Y 0Y 0Y 0Z 0Z 0Z 0Z FF
-
-    speed_pan = int(args["speed"] * 0x17) + 1
-    speed_tilt = int(args["speed"] * 0x13) + 1
-
-    data.extend([speed_pan, speed_tilt])  # half speed | between 0x01 and 0x18, 0x01 and 0x14
-    data.extend([0x0A, 0x0A, 0x0A, 0x0A, 0x0A, 0x0A, 0x0A, 0x0A, 0xFF])
-    return data
-
-
-def oneshot_ptz_lambda(self, args):
-    data = copy.deepcopy(self.data)
-    # 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xFF
-    # VV WW 0Y 0Y 0Y 0Y 0Z 0Z 0Z 0Z FF
-
-    speed_pan = int(args["speed"] * 0x17) + 1
-    speed_tilt = int(args["speed"] * 0x13) + 1
-
-    data.extend([speed_pan, speed_tilt])  # half speed | between 0x01 and 0x18, 0x01 and 0x14
-    data.extend(args["postfix"])
-    return data
-
-
-def zoom_tele_variable(self, args):
-    speed = int(args["speed"] * 6) + 1
-
-    self.data[4] = 0x20 + speed
-
-    return self.data
-
-
-def zoom_wide_variable(self, args):
-    speed = int(args["speed"] * 6) + 1
-
-    self.data[4] = 0x30 + speed
-
-    return self.data
-
-
-def exposure_command(self, args):
-    data = copy.deepcopy(self.data)
-
-    data[6] = int(args / 16)
-    data[7] = args & 0x0F
-
-    return data
-
-
-def ae_mode_lambda(self, args):
-    modes = {
-        "Full Auto": 0x00,
-        "Manual": 0x03,
-        "Tv": 0x0A,
-        "Av": 0x0B,
-        "Brightness": 0x0D
-    }
-
-    new_data = copy.deepcopy(self.data)
-    new_data[4] = modes[args]
-
-    return new_data
-
-
-def wb_mode_lambda(self, args):
-    modes = {
-        "Auto": 0x00,
-        "Indoor": 0x01,
-        "Outdoor": 0x02,
-        "One Push": 0x03,  # Mode Set
-        "Auto Tracking": 0x04,
-        "Manual": 0x05
-    }
-
-    new_data = copy.deepcopy(self.data)
-    new_data[4] = modes[args]
-
-    return new_data
-
-
-class Camera(QRunnable):
-    address = "192.168.0.100"
-    port = 52381
-    current_sequence_number = 0
-    sequence_callback = None
-    ui = None
-    receive_socket = None
-
-    commands = dict()
-
-    commands["backlight on"] = Command([0x81, 0x01, 0x04, 0x33, 0x03, 0xFF])
-    commands["backlight off"] = Command([0x81, 0x01, 0x04, 0x33, 0x02, 0xFF])
-    commands["set preset x"] = Command([0x81, 0x01, 0x04, 0x3F, 0x01, 0x00, 0xFF], argument_lambda=preset)
-    commands["recall preset x"] = Command([0x81, 0x01, 0x04, 0x3F, 0x02, 0x00, 0xFF], argument_lambda=preset)
-    commands["home"] = Command([0x81, 0x01, 0x06, 0x04, 0xFF])
-    commands["pan relative position"] = Command(
-        [0x81, 0x01, 0x06, 0x03], argument_lambda=pan_relative_lambda)
-    commands["move"] = Command([0x81, 0x01, 0x06, 0x01], argument_lambda=oneshot_ptz_lambda)
-    commands["stop"] = Command([0x81, 0x01, 0x06, 0x01, 0x01, 0x01, 0x03, 0x03, 0xFF])
-    commands["osd on"] = Command([0x81, 0x01, 0x7E, 0x01, 0x18, 0x02, 0xFF])
-    commands["osd off"] = Command([0x81, 0x01, 0x7E, 0x01, 0x18, 0x03, 0xFF])
-    commands["low latency on"] = Command([0x81, 0x01, 0x7E, 0x01, 0x5A, 0x02, 0xFF])
-    commands["low latency off"] = Command([0x81, 0x01, 0x7E, 0x01, 0x5A, 0x03, 0xFF])
-    commands["zoom stop"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF])
-    commands["digital zoom on"] = Command([0x81, 0x01, 0x04, 0x06, 0x02, 0xFF])
-    commands["digital zoom off"] = Command([0x81, 0x01, 0x04, 0x06, 0x03, 0xFF])
-    commands["zoom tele std"] = Command([0x81, 0x01, 0x04, 0x07, 0x02, 0xFF])
-    commands["zoom wide std"] = Command([0x81, 0x01, 0x04, 0x07, 0x03, 0xFF])
-    commands["zoom tele var"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF], argument_lambda=zoom_tele_variable)
-    commands["zoom wide var"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF], argument_lambda=zoom_wide_variable)
-    commands["ae mode"] = Command([0x81, 0x01, 0x04, 0x39, 0x00, 0xFF],
-                                  argument_lambda=ae_mode_lambda)
-    commands["brighter"] = Command([0x81, 0x01, 0x04, 0x0D, 0x02, 0xFF])
-    commands["darker"] = Command([0x81, 0x01, 0x04, 0x0D, 0x03, 0xFF])
-
-    commands["af mode auto"] = Command([0x81, 0x01, 0x04, 0x38, 0x02, 0xFF])
-    commands["af mode manual"] = Command([0x81, 0x01, 0x04, 0x38, 0x03, 0xFF])
-    commands["af mode auto/manual"] = Command([0x81, 0x01, 0x04, 0x38, 0x10, 0xFF])
-    commands["af mode one push trigger"] = Command([0x81, 0x01, 0x04, 0x18, 0x01, 0xFF])
-    commands["focus far var"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF], argument_lambda=zoom_tele_variable)
-    commands["focus near var"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF], argument_lambda=zoom_wide_variable)
-    commands["focus stop"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF])
-    commands["wb mode"] = Command([0x81, 0x01, 0x04, 0x35, 0x00, 0xFF], argument_lambda=wb_mode_lambda)
-    commands["wb mode trigger"] = Command([0x81, 0x01, 0x04, 0x10, 0x05, 0xFF])
-    commands["red gain up"] = Command([0x81, 0x01, 0x04, 0x03, 0x02, 0xFF])
-    commands["red gain down"] = Command([0x81, 0x01, 0x04, 0x03, 0x03, 0xFF])
-    commands["red gain reset"] = Command([0x81, 0x01, 0x04, 0x03, 0x00, 0xFF])
-    commands["blue gain up"] = Command([0x81, 0x01, 0x04, 0x04, 0x02, 0xFF])
-    commands["blue gain down"] = Command([0x81, 0x01, 0x04, 0x04, 0x03, 0xFF])
-    commands["blue gain reset"] = Command([0x81, 0x01, 0x04, 0x04, 0x00, 0xFF])
-    commands["gain set"] = Command([0x81, 0x01, 0x04, 0x4C, 0x00, 0x00, 0x00, 0x00, 0xFF],
-                                   argument_lambda=exposure_command)
-    commands["shutter set"] = Command([0x81, 0x01, 0x04, 0x4A, 0x00, 0x00, 0x00, 0x00, 0xFF],
-                                      argument_lambda=exposure_command)
-    commands["fstop set"] = Command([0x81, 0x01, 0x04, 0x4B, 0x00, 0x00, 0x00, 0x00, 0xFF],
-                                    argument_lambda=exposure_command)
-    commands["ex_ae_comp set"] = Command([0x81, 0x01, 0x04, 0x4E, 0x00, 0x00, 0x00, 0x00, 0xFF],
-                                         argument_lambda=exposure_command)
-    commands["ex ae comp on"] = Command([0x81, 0x01, 0x04, 0x03E, 0x02, 0xFF])
-    commands["ex ae comp off"] = Command([0x81, 0x01, 0x04, 0x3E, 0x03, 0xFF])
-
-    # ex_ae_comp
-    # gain         8x 01 04 4C 00 00 0p 0q FF
-    # shutter      8x 01 04 4A 00 00 0p 0q FF
-    # fstop        8x 01 04 4B 00 00 0p 0q FF
-
-    def __init__(self, address="192.168.0.100", port=52381, sequence_callback=None):
-        super(Camera, self).__init__()
-        self.address = address
-        self.port = port
-        self.sequence_callback = sequence_callback
-
-        self.receive_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.receive_socket.bind(("0.0.0.0", self.port))
-
-        # self.send_command([0x01], prep_cmd=[0x02, 0x01])
-        # socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(bytes(prep_cmd), (self.address, self.port))
-        self.reset()
-
-    def reset(self):
-        self.current_sequence_number = 0
-        self.send_control_command([0x01])
-        self.current_sequence_number = 0
-
-    def increment_sequence(self):
-        self.current_sequence_number = self.current_sequence_number + 1
-        if self.sequence_callback is not None:
-            self.sequence_callback(self.current_sequence_number)
-        # self.current_sequence_number = 0xFFFFFFFF
-
-    def send_control_command(self, cmd):
-        buffy = bytearray([0x02, 0x00])
-        buffy.extend(bytearray(len(cmd).to_bytes(length=2, byteorder="little", signed=False)))
-        self.current_sequence_number = (self.current_sequence_number + 1) % 0xFFFFFFFF
-        buffy.extend(bytearray(self.current_sequence_number.to_bytes(length=4, byteorder="little", signed=False)))
-        buffy.extend(bytearray(cmd))
-
-        socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(bytes(buffy), (self.address, self.port))
-
-    def send_command(self, command, header=[0x01, 0x00]):
-        self.increment_sequence()
-        prep_cmd = copy.deepcopy(header)
-        prep_cmd.extend(bytearray([0x00, int(len(command))]))  # payload type (2), followed by command length
-        prep_cmd.extend(bytearray(self.current_sequence_number.to_bytes(length=4, byteorder="little", signed=False)))
-        prep_cmd.extend(command)
-        socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(bytes(prep_cmd), (self.address, self.port))
-
-    def run(self):
-        while True:
-            data, addr = self.receive_socket.recvfrom(1024)
-            # bad command response 0200 0002ba 0000000f01
-            # good cmmand response 0111 0003d3 0000009041ff
-            data = bytearray(data)
-            curr_seq_num = int.from_bytes(data[2:5], "big", signed=False)
-            print("SEQ " + str(curr_seq_num))
-            print(binascii.hexlify(data[2:5]))
-            # self.current_sequence_number = curr_seq_num
-            print(binascii.hexlify(data))
-            print(self.current_sequence_number)
-            time.sleep(0.1)
+HERE = os.path.dirname(os.path.abspath(__file__))
+UI_FILE = os.path.join(HERE, "main.ui")
+# main.ui compiled to Python, parsing the XML on every start is most of the time spent before the first frame
+UI_CACHE = os.path.join(HERE, "main_ui.py")
+# Macros bound to keys, PTZ_MACROS names another file
+MACROS_FILE = os.path.join(HERE, "macros.json")
+# Named shots, PTZ_PRESETS names another library
+PRESETS_FILE = os.path.join(HERE, "presets.db")
+# Named looks (exposure, white balance, focus), PTZ_SCENES names another file
+SCENES_FILE = os.path.join(HERE, "scenes.json")
+
+PRESET_BUTTONS = ("zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven",
+                  "twelve", "thirteen", "fourteen", "fifteen")
+
+# Keys held for motion: arrows as (x, y), two at once go diagonally, and + and - zoom
+ARROWS = {Qt.Key_Up: (0, 1), Qt.Key_Down: (0, -1), Qt.Key_Left: (-1, 0), Qt.Key_Right: (1, 0)}
+COMPASS = {(0, 1): "up", (0, -1): "down", (-1, 0): "left", (1, 0): "right",
+           (-1, 1): "up-left", (1, 1): "up-right", (-1, -1): "down-left", (1, -1): "down-right"}
+ZOOM_KEYS = {Qt.Key_Plus: "zoom tele var", Qt.Key_Minus: "zoom wide var"}
+
+
+class CameraSignals(QObject):
+    # method, result, error of every intent the command worker ran
+    done = pyqtSignal(str, object, object)
+    # addresses of cameras discovery turned up, then how many it found in all
+    found = pyqtSignal(str)
+    searched = pyqtSignal(int)
+
+
+class HoldKeys(QObject):
+    """An application event filter handing ``keys`` pressed in ``window`` to ``pressed(key)``, auto-repeats
+    included, and their releases to ``released(key)``. Keys typed into text fields are left alone."""
+
+    def __init__(self, window, keys, pressed, released):
+        super(HoldKeys, self).__init__()
+        self.window = window
+        self.keys = keys
+        self.pressed = pressed
+        self.released = released
+
+    def eventFilter(self, target, event):
+        if event.type() not in (QEvent.KeyPress, QEvent.KeyRelease) or event.key() not in self.keys:
+            return False
+        if not isinstance(target, QWidget) or target.window() is not self.window:
+            return False
+        if isinstance(QApplication.focusWidget(), (QLineEdit, QPlainTextEdit, QAbstractSpinBox)):
+            return False
+
+        if event.type() == QEvent.KeyPress:
+            self.pressed(event.key())
+        elif not event.isAutoRepeat():
+            # Some platforms send a release before every repeated press
+            self.released(event.key())
+        return True
+
+
+def compile_ui():
+    try:
+        with open(UI_CACHE + ".tmp", "w") as cache:
+            uic.compileUi(UI_FILE, cache)
+        os.replace(UI_CACHE + ".tmp", UI_CACHE)
+    except OSError:
+        pass
+
+
+def load_ui():
+    """Build the main window, from the compiled cache when it's no older than main.ui."""
+    try:
+        fresh = os.path.getmtime(UI_CACHE) >= os.path.getmtime(UI_FILE)
+    except OSError:
+        fresh = False
+
+    if not fresh:
+        # Compile once the window is up rather than holding up this start
+        QTimer.singleShot(0, compile_ui)
+        return uic.loadUi(UI_FILE)
+
+    spec = importlib.util.spec_from_file_location("main_ui", UI_CACHE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    window = type("MainWindow", (QMainWindow, module.Ui_MainWindow), {})()
+    window.setupUi(window)
+    return window
 
 
 class App(QApplication):
 
-    def __init__(self):
+    def __init__(self, addresses=("192.168.0.100",)):
         super(App, self).__init__([])
-        self.ui = uic.loadUi("main.ui")
-        cam = Camera()
-        self.cam = cam
+        self.ui = load_ui()
+        self.cameras = CameraPool()
+        self.signals = CameraSignals()
+        # PTZ_JOURNAL=show.ptzj records every datagram sent, for "python3 -m ptz replay show.ptzj"
+        if os.environ.get("PTZ_JOURNAL"):
+            from ptz.journal import JournalWriter
+            self.cameras.journal = JournalWriter(os.environ["PTZ_JOURNAL"])
+        for address in addresses:
+            self.cameras.add(address)
 
     def event(self, event):
-        print(event.type())
         if event.type() == 20:
+            self.cameras.close()
+            if self.cameras.journal is not None:
+                self.cameras.journal.close()
             os._exit(0)
 
         return False
 
     def main(self):
         ui = self.ui
-        ui = self.ui
-        cam = self.cam
-        cam.ui = ui
-
-        # QThreadPool.globalInstance().setMaxThreadCount(50)
-        QThreadPool.globalInstance().start(cam)
-
-        # Presets
-        ui.setzero.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(0)))
-        ui.getzero.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(0)))
-        ui.setone.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(1)))
-        ui.getone.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(1)))
-        ui.settwo.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(2)))
-        ui.gettwo.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(2)))
-        ui.setthree.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(3)))
-        ui.getthree.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(3)))
-        ui.setfour.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(4)))
-        ui.getfour.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(4)))
-        ui.setfive.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(5)))
-        ui.getfive.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(5)))
-        ui.setsix.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(6)))
-        ui.getsix.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(6)))
-        ui.setseven.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(7)))
-        ui.getseven.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(7)))
-        ui.seteight.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(8)))
-        ui.geteight.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(8)))
-        ui.setnine.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(9)))
-        ui.getnine.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(9)))
-        ui.setten.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(10)))
-        ui.getten.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(10)))
-        ui.seteleven.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(11)))
-        ui.geteleven.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(11)))
-        ui.settwelve.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(12)))
-        ui.gettwelve.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(12)))
-        ui.setthirteen.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(13)))
-        ui.getthirteen.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(13)))
-        ui.setfourteen.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(14)))
-        ui.getfourteen.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(14)))
-        ui.setfifteen.clicked.connect(lambda: cam.send_command(cam.commands["set preset x"].get_command(15)))
-        ui.getfifteen.clicked.connect(lambda: cam.send_command(cam.commands["recall preset x"].get_command(15)))
-
-        ui.ae_mode.currentTextChanged.connect(
-            lambda: cam.send_command(cam.commands["ae mode"].get_command(ui.ae_mode.currentText())))
-
-        ui.brighter.clicked.connect(lambda: cam.send_command(cam.commands["brighter"].get_command(None)))
-        ui.darker.clicked.connect(lambda: cam.send_command(cam.commands["darker"].get_command(None)))
-        ui.wb_trigger.clicked.connect(lambda: cam.send_command(cam.commands["wb mode trigger"].get_command(None)))
-        ui.wb_mode.currentTextChanged.connect(
-            lambda: cam.send_command(cam.commands["wb mode"].get_command(ui.wb_mode.currentText())))
-
-        ui.red_gain_more.clicked.connect(lambda: cam.send_command(cam.commands["red gain up"].get_command(None)))
-        ui.red_gain_less.clicked.connect(lambda: cam.send_command(cam.commands["red gain down"].get_command(None)))
-        ui.red_gain_reset.clicked.connect(lambda: cam.send_command(cam.commands["red gain reset"].get_command(None)))
-
-        ui.blue_gain_more.clicked.connect(lambda: cam.send_command(cam.commands["blue gain up"].get_command(None)))
-        ui.blue_gain_less.clicked.connect(lambda: cam.send_command(cam.commands["blue gain down"].get_command(None)))
-        ui.blue_gain_reset.clicked.connect(lambda: cam.send_command(cam.commands["blue gain reset"].get_command(None)))
+        # Widgets talk to the pool, which forwards to whichever camera is selected
+        cam = self.cameras
+        cam.start()
+
+        # No socket work on this thread: widgets post intents to the worker, which runs them against the pool
+        worker = self.worker = CommandWorker(cam, done=self.signals.done.emit)
+        worker.start()
+
+        def send(name, args=None):
+            worker.post("send", name, args)
+
+        def submit(name, args=None, issued_at=None, key=None, urgent=False):
+            worker.post("submit", name, args, issued_at, key=key, urgent=urgent)
+
+        def apply(name, args, key, value=None):
+            # A quick scroll through a combo box only sends where it stopped
+            worker.post("apply", name, args, key, value, key=key)
+
+        camera_select = QComboBox()
+        camera_select.addItems(address for address, port in cam.cameras)
+        camera_select.currentTextChanged.connect(lambda address: worker.post("select", address))
+        ui.statusbar.addPermanentWidget(camera_select)
+
+        # Broadcasts the discovery enquiry and probes the first camera's /24, cameras are added as they answer
+        find_cameras = QPushButton("Find cameras")
+        ui.statusbar.addPermanentWidget(find_cameras)
+
+        def search():
+            from ptz.discovery import local_network, scan
+
+            network = local_network(next(iter(cam.cameras))[0])
+            try:
+                found = scan(network, lambda camera: self.signals.found.emit(camera.address))
+            except OSError:
+                found = ()
+            self.signals.searched.emit(len(found))
+
+        def find():
+            find_cameras.setEnabled(False)
+            threading.Thread(target=search, name="discovery", daemon=True).start()
+
+        adding = set()
+
+        def camera_found(address):
+            if (address, 52381) not in cam.cameras and address not in adding:
+                adding.add(address)
+                worker.post("add", address)
+
+        def search_done(count):
+            find_cameras.setEnabled(True)
+            ui.statusbar.showMessage("Found %d camera(s)" % count, 5000)
+
+        find_cameras.clicked.connect(find)
+        self.signals.found.connect(camera_found)
+        self.signals.searched.connect(search_done)
+
+        # The preset library recalls through its own worker, so a recall never waits behind the pool's intents
+        from ptz.presets import PresetLibrary
+        self.presets = PresetLibrary(os.environ.get("PTZ_PRESETS", PRESETS_FILE))
+        shots = self.shots = CommandWorker(self.presets, done=self.signals.done.emit)
+        shots.start()
+
+        def store_preset(number):
+            send("set preset x", number)
+            # Stored by hand, the library mustn't mirror a shot over it
+            shots.post("reserve", cam.active.address, number)
+
+        # Presets, buttons setzero/getzero ... setfifteen/getfifteen
+        for number, name in enumerate(PRESET_BUTTONS):
+            getattr(ui, "set" + name).clicked.connect(
+                lambda checked=False, number=number: store_preset(number))
+            getattr(ui, "get" + name).clicked.connect(
+                lambda checked=False, number=number: send("recall preset x", number))
+
+        # Named shots: typing searches the active camera's (a #word narrows to a tag), Enter recalls the
+        # shot named, "Save shot" stores where the camera is now under that name and the #tags
+        shot_name = QLineEdit()
+        shot_name.setPlaceholderText("Shot, #tag")
+        shot_names = QStringListModel()
+        completer = QCompleter(shot_names, shot_name)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        shot_name.setCompleter(completer)
+        save_shot = QPushButton("Save shot")
+        ui.statusbar.addPermanentWidget(shot_name)
+        ui.statusbar.addPermanentWidget(save_shot)
+
+        def parse_shot(text):
+            words = text.split()
+            name = " ".join(word for word in words if not word.startswith("#"))
+            return name, [word[1:] for word in words if word.startswith("#") and len(word) > 1]
+
+        def search_shots(text):
+            name, tags = parse_shot(text)
+            shot_names.setStringList(
+                [found.name for found in self.presets.search(name, tags, camera=cam.active.address, limit=50)])
+
+        def recall_done(recall):
+            # A recall superseded by the next one isn't worth a message
+            if recall.failed == "timed out":
+                status["message"] = "Recall of %s timed out" % recall.shot.name
+
+        def recall_shot():
+            name, tags = parse_shot(shot_name.text())
+            if name:
+                shots.post("recall", cam.active, name, 1.0, recall_done)
+
+        def capture_shot():
+            name, tags = parse_shot(shot_name.text())
+            if name:
+                shots.post("capture", cam.active, name, tags)
+
+        shot_name.textEdited.connect(search_shots)
+        shot_name.returnPressed.connect(recall_shot)
+        save_shot.clicked.connect(capture_shot)
+
+        # Scenes: picking one sends the active camera just the settings it doesn't have yet, "Save scene"
+        # stores the camera's current look under a name
+        from ptz.scenes import SceneLibrary
+        try:
+            self.scenes = SceneLibrary(os.environ.get("PTZ_SCENES", SCENES_FILE))
+        except ValueError as error:
+            ui.statusbar.showMessage(str(error), 10000)
+            self.scenes = SceneLibrary()
+
+        def scene_done(method, result, error):
+            if error is not None:
+                status["message"] = "Scene failed: %s" % error
+            elif result is None:
+                status["message"] = "No such scene"
+
+        looks = self.looks = CommandWorker(self.scenes, done=scene_done)
+        looks.start()
+        scene_select = QComboBox()
+        scene_select.addItem("Scene")
+        scene_select.addItems(self.scenes.names())
+        save_scene = QPushButton("Save scene")
+        ui.statusbar.addPermanentWidget(scene_select)
+        ui.statusbar.addPermanentWidget(save_scene)
+
+        def apply_scene(index):
+            if index > 0:
+                looks.post("apply", cam.active, scene_select.itemText(index),
+                           lambda run: status.update(message=run.summary()))
+
+        def capture_scene():
+            name, accepted = QInputDialog.getText(ui, "Save scene", "Scene name:")
+            name = name.strip()
+            if accepted and name:
+                self.scenes.capture(cam.active, name)
+                if scene_select.findText(name) < 0:
+                    scene_select.addItem(name)
+                scene_select.setCurrentText(name)
+                status["message"] = "Scene saved"
+
+        scene_select.activated.connect(apply_scene)
+        save_scene.clicked.connect(capture_scene)
+
+        ui.brighter.clicked.connect(lambda: send("brighter"))
+        ui.darker.clicked.connect(lambda: send("darker"))
+        ui.wb_trigger.clicked.connect(lambda: send("wb mode trigger"))
+
+        ui.red_gain_more.clicked.connect(lambda: send("red gain up"))
+        ui.red_gain_less.clicked.connect(lambda: send("red gain down"))
+        ui.red_gain_reset.clicked.connect(lambda: send("red gain reset"))
+
+        ui.blue_gain_more.clicked.connect(lambda: send("blue gain up"))
+        ui.blue_gain_less.clicked.connect(lambda: send("blue gain down"))
+        ui.blue_gain_reset.clicked.connect(lambda: send("blue gain reset"))
+
+        # label -> (command, the af mode the camera reports once it's applied)
+        af_modes = {
+            "On": ("af mode auto", 0x02),
+            "Manual": ("af mode manual", 0x03),
+            "Auto/Manual": ("af mode auto/manual", 0x10),
+            "One Push Trigger": ("af mode one push trigger", None)
+        }
 
         def af_mode():
-            modeFuncs = {
-                "On": cam.commands["af mode auto"].get_command(None),
-                "Manual": cam.commands["af mode manual"].get_command(None),
-                "Auto/Manual": cam.commands["af mode auto/manual"].get_command(None),
-                "One Push Trigger": cam.commands["af mode one push trigger"].get_command(None)
-            }
-
-            cam.send_command(modeFuncs[ui.af_mode.currentText()])
+            name, value = af_modes[ui.af_mode.currentText()]
+            if value is None:
+                submit(name)
+            else:
+                apply(name, None, "af mode", value)
 
         ui.af_mode.currentTextChanged.connect(af_mode)
 
-        fstop = {
-            "f/1.8": cam.commands["fstop set"].get_command(0x11),
-            "f/2.0": cam.commands["fstop set"].get_command(0x10),
-            "f/2.4": cam.commands["fstop set"].get_command(0x0F),
-            "f/2.8": cam.commands["fstop set"].get_command(0x0E),
-            "f/3.4": cam.commands["fstop set"].get_command(0x0D),
-            "f/4.0": cam.commands["fstop set"].get_command(0x0C),
-            "f/4.8": cam.commands["fstop set"].get_command(0x0B),
-            "f/5.6": cam.commands["fstop set"].get_command(0x0A),
-            "f/6.8": cam.commands["fstop set"].get_command(0x09),
-            "f/8.0": cam.commands["fstop set"].get_command(0x08),
-            "f/9.6": cam.commands["fstop set"].get_command(0x07),
-            "f/11.0": cam.commands["fstop set"].get_command(0x06),
-            "f/14.0": cam.commands["fstop set"].get_command(0x05),
-            "Closed": cam.commands["fstop set"].get_command(0x00),
-        }
-
-        ui.fstop.clear()
-        ui.fstop.addItems(fstop.keys())
-        ui.fstop.currentTextChanged.connect(lambda: cam.send_command(fstop[ui.fstop.currentText()]))
-
-        shutter = {
-            "1/250 | 1/215": cam.commands["shutter set"].get_command(0x0B),
-            "1/180 | 1/150": cam.commands["shutter set"].get_command(0x0A),
-            "1/125 | 1/120": cam.commands["shutter set"].get_command(0x09),
-            "1/100 | 1/100": cam.commands["shutter set"].get_command(0x08),
-            "1/90 | 1/75": cam.commands["shutter set"].get_command(0x07),
-            "1/60 | 1/50": cam.commands["shutter set"].get_command(0x06),
-            "1/30 | 1/25": cam.commands["shutter set"].get_command(0x05),
-        }
-
-        ui.shutter.clear()
-        ui.shutter.addItems(shutter.keys())
-        ui.shutter.currentTextChanged.connect(lambda: cam.send_command(shutter[ui.shutter.currentText()]))
-
-        ex_gain = {
-            "0dB": cam.commands["gain set"].get_command(0x01),
-            "3dB": cam.commands["gain set"].get_command(0x02),
-            "6dB": cam.commands["gain set"].get_command(0x03),
-            "9dB": cam.commands["gain set"].get_command(0x04),
-            "12dB": cam.commands["gain set"].get_command(0x05),
-            "15dB": cam.commands["gain set"].get_command(0x06),
-            "18dB": cam.commands["gain set"].get_command(0x07),
-            "21dB": cam.commands["gain set"].get_command(0x08),
-            "24dB": cam.commands["gain set"].get_command(0x09),
-            "27dB": cam.commands["gain set"].get_command(0x0A),
-            "30dB": cam.commands["gain set"].get_command(0x0B),
-            "33dB": cam.commands["gain set"].get_command(0x0C),
-            "36dB": cam.commands["gain set"].get_command(0x0D),
-            "39dB": cam.commands["gain set"].get_command(0x0E),
-            "43dB": cam.commands["gain set"].get_command(0x0F),
-        }
-
-        ui.gain.clear()
-        ui.gain.addItems(ex_gain.keys())
-        ui.gain.currentTextChanged.connect(lambda: cam.send_command(ex_gain[ui.gain.currentText()]))
-
-        ex_ae_comps = {
-            "-10.5dB": cam.commands["ex_ae_comp set"].get_command(0x00),
-            "-9dB": cam.commands["ex_ae_comp set"].get_command(0x01),
-            "-7.5dB": cam.commands["ex_ae_comp set"].get_command(0x02),
-            "-6dB": cam.commands["ex_ae_comp set"].get_command(0x03),
-            "-4.5dB": cam.commands["ex_ae_comp set"].get_command(0x04),
-            "-3dB": cam.commands["ex_ae_comp set"].get_command(0x05),
-            "-1.5dB": cam.commands["ex_ae_comp set"].get_command(0x06),
-            "0dB": cam.commands["ex_ae_comp set"].get_command(0x07),
-            "+1.5dB": cam.commands["ex_ae_comp set"].get_command(0x08),
-            "+3dB": cam.commands["ex_ae_comp set"].get_command(0x09),
-            "+4.5dB": cam.commands["ex_ae_comp set"].get_command(0x0A),
-            "+6dB": cam.commands["ex_ae_comp set"].get_command(0x0B),
-            "+7.5dB": cam.commands["ex_ae_comp set"].get_command(0x0C),
-            "+9dB": cam.commands["ex_ae_comp set"].get_command(0x0D),
-            "+10.5dB": cam.commands["ex_ae_comp set"].get_command(0x0E),
-        }
-
-        ui.ex_comp.clear()
-        ui.ex_comp.addItems(ex_ae_comps.keys())
-        ui.ex_comp.currentTextChanged.connect(lambda: cam.send_command(ex_ae_comps[ui.ex_comp.currentText()]))
-
-        def seq_callback(seq):
-            ui.seq_number.display(seq)
-
-        cam.sequence_callback = seq_callback
+        # Combo box -> the setting it controls
+        setting_widgets = [
+            (ui.ae_mode, SETTINGS["ae mode"]),
+            (ui.wb_mode, SETTINGS["wb mode"]),
+            (ui.fstop, SETTINGS["fstop"]),
+            (ui.shutter, SETTINGS["shutter"]),
+            (ui.gain, SETTINGS["gain"]),
+            (ui.ex_comp, SETTINGS["ex_ae_comp"]),
+        ]
+
+        def setting_changed(setting, label):
+            value = setting.value(label)
+            apply(setting.command, value, setting.key)
+
+        for widget, setting in setting_widgets:
+            widget.clear()
+            widget.addItems(setting.labels)
+            widget.currentTextChanged.connect(
+                lambda label, setting=setting: setting_changed(setting, label))
 
         def osd_func():
             if ui.osd.checkState():
-                cam.send_command(cam.commands["osd on"].get_command(None))
+                send("osd on")
             else:
-                cam.send_command(cam.commands["osd off"].get_command(None))
+                send("osd off")
 
         ui.osd.clicked.connect(osd_func)
 
         def ex_ae_enabled_func():
             if ui.ex_ae_comp_on.checkState():
-                cam.send_command(cam.commands["ex ae comp on"].get_command(None))
+                apply("ex ae comp on", None, "ex ae comp", True)
             else:
-                cam.send_command(cam.commands["ex ae comp off"].get_command(None))
+                apply("ex ae comp off", None, "ex ae comp", False)
 
         ui.ex_ae_comp_on.clicked.connect(ex_ae_enabled_func)
 
         def digital_zoom_func():
             if ui.digital_zoom.checkState():
-                cam.send_command(cam.commands["digital zoom on"].get_command(None))
+                apply("digital zoom on", None, "digital zoom", True)
             else:
-                cam.send_command(cam.commands["digital zoom off"].get_command(None))
+                apply("digital zoom off", None, "digital zoom", False)
 
         ui.digital_zoom.clicked.connect(digital_zoom_func)
 
         def low_latency_func():
             if ui.low_latency.checkState():
-                cam.send_command(cam.commands["low latency on"].get_command(None))
+                apply("low latency on", None, "low latency", True)
             else:
-                cam.send_command(cam.commands["low latency off"].get_command(None))
+                apply("low latency off", None, "low latency", False)
 
         ui.low_latency.clicked.connect(low_latency_func)
 
-        ui.up.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x03, 0x01, 0xFF],
-
-                }
-            )))
-        ui.down.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x03, 0x02, 0xFF],
-
-                }
-            )))
-        ui.left.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x01, 0x03, 0xFF],
-
-                }
-            )))
-        ui.right.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x02, 0x03, 0xFF],
-
-                }
-            )))
-        ui.ul.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x01, 0x01, 0xFF],
-
-                }
-            )))
-        ui.ur.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x02, 0x01, 0xFF],
-
-                }
-            )))
-        ui.dl.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x01, 0x02, 0xFF],
-
-                }
-            )))
-        ui.dr.clicked.connect(
-            lambda: cam.send_command(cam.commands["move"].get_command(
-                {
-                    "speed": ui.speed_bar.value() / 100,
-                    "postfix": [0x02, 0x02, 0xFF],
-
-                }
-            )))
-
-        ui.focus_far.clicked.connect(
-            lambda: cam.send_command(cam.commands["focus far var"].get_command(
-                {
-                    "speed": ui.focus_speed.value() / 100,
-                }
-            )))
-        ui.focus_near.clicked.connect(
-            lambda: cam.send_command(cam.commands["focus near var"].get_command(
-                {
-                    "speed": ui.focus_speed.value() / 100,
-                }
-            )))
-        ui.focus_stop.clicked.connect(lambda: cam.send_command(cam.commands["focus stop"].get_command(None)))
+        # Continuous motion is press-and-hold: a button or key going down sends one move, its auto-repeat
+        # only keeps the hold alive and letting go sends the stop. The watchdog stops an axis whose release
+        # got lost. Slider drags re-issue a held move at the new speed, the scheduler coalesces the excess.
+        def hold_submit(name, args, axis):
+            if commands[name].priority == PRIORITY_STOP:
+                # Jumps the worker's queue, and drops motion on the axis that's still waiting in it
+                submit(name, issued_at=time.perf_counter(), key=axis, urgent=True)
+            else:
+                submit(name, args, key=axis)
+
+        hold = self.hold = HoldMotion(hold_submit)
+        hold.start()
+
+        def move(postfix, source):
+            hold.press(PAN_TILT, "move", {"speed": ui.speed_bar.value() / 100, "postfix": postfix}, source)
+
+        def zoom(name, source):
+            hold.press(ZOOM, name, {"speed": ui.zoom_bar.value() / 100}, source)
+
+        def focus(name, source):
+            hold.press(FOCUS, name, {"speed": ui.focus_speed.value() / 100}, source)
+
+        def halt(axis, name):
+            issued_at = time.perf_counter()
+            hold.forget(axis)
+            submit(name, issued_at=issued_at, key=axis, urgent=True)
+
+        def emergency_stop():
+            issued_at = time.perf_counter()
+            hold.forget()
+            # The worker stops every axis, the macros mustn't start anything again
+            for run in self.macros.running():
+                self.macros.cancel(run, stop=False)
+            worker.discard(PAN_TILT, ZOOM, FOCUS)
+            worker.post("emergency_stop", issued_at, urgent=True)
+
+        def speed_changed(axis, resume):
+            held = hold.held().get(axis)
+            if held is not None:
+                name, args, source = held
+                resume(args["postfix"] if axis == PAN_TILT else name, source)
+
+        holding = [(ui.up, PAN_TILT, "up"), (ui.down, PAN_TILT, "down"), (ui.left, PAN_TILT, "left"),
+                   (ui.right, PAN_TILT, "right"), (ui.ul, PAN_TILT, "up-left"), (ui.ur, PAN_TILT, "up-right"),
+                   (ui.dl, PAN_TILT, "down-left"), (ui.dr, PAN_TILT, "down-right"),
+                   (ui.tele_var, ZOOM, "zoom tele var"), (ui.wide_var, ZOOM, "zoom wide var"),
+                   (ui.focus_far, FOCUS, "focus far var"), (ui.focus_near, FOCUS, "focus near var")]
+        start_motion = {PAN_TILT: lambda direction, source: move(DIRECTIONS[direction], source), ZOOM: zoom,
+                        FOCUS: focus}
+        for button, axis, what in holding:
+            button.pressed.connect(lambda button=button, axis=axis, what=what: start_motion[axis](what, button))
+            button.released.connect(lambda button=button, axis=axis: hold.release(axis, button))
+        ui.speed_bar.valueChanged.connect(lambda: speed_changed(PAN_TILT, move))
+        ui.zoom_bar.valueChanged.connect(lambda: speed_changed(ZOOM, zoom))
+        ui.focus_speed.valueChanged.connect(lambda: speed_changed(FOCUS, focus))
+
+        # The arrow keys (two at once go diagonally) and +/- are held like the buttons rather than clicking
+        # them through their shortcuts, which would send a move per auto-repeat
+        for button in (ui.up, ui.down, ui.left, ui.right, ui.tele_var, ui.wide_var):
+            button.setShortcut(QKeySequence())
+        arrows_down = set()
+
+        def steer():
+            x = sum(ARROWS[key][0] for key in arrows_down)
+            y = sum(ARROWS[key][1] for key in arrows_down)
+            if (x, y) == (0, 0):
+                hold.release(PAN_TILT, "arrows")
+            else:
+                move(DIRECTIONS[COMPASS[(x, y)]], "arrows")
+
+        def key_pressed(key):
+            if key in ZOOM_KEYS:
+                zoom(ZOOM_KEYS[key], key)
+            else:
+                arrows_down.add(key)
+                steer()
+
+        def key_released(key):
+            if key in ZOOM_KEYS:
+                hold.release(ZOOM, key)
+            else:
+                arrows_down.discard(key)
+                steer()
+
+        self.hold_keys = HoldKeys(ui, set(ARROWS) | set(ZOOM_KEYS), key_pressed, key_released)
+        self.installEventFilter(self.hold_keys)
+
+        def check_holds():
+            # Held buttons keep their holds alive, a button that's up without a release gets one now
+            held = hold.held()
+            for axis, (name, args, source) in held.items():
+                if isinstance(source, QPushButton):
+                    if source.isDown():
+                        hold.refresh(axis, source)
+                    else:
+                        hold.release(axis, source)
+            if held.get(PAN_TILT, (None, None, None))[2] != "arrows":
+                # The watchdog or a button took over, whatever arrows were down are forgotten
+                arrows_down.clear()
+
+        self.hold_timer = QTimer()
+        self.hold_timer.timeout.connect(check_holds)
+        self.hold_timer.start(100)
+
+        ui.focus_stop.clicked.connect(lambda: halt(FOCUS, "focus stop"))
         ui.trigger_af.clicked.connect(
-            lambda: cam.send_command(cam.commands["af mode one push trigger"].get_command(None)))
-
-        ui.tele_var.clicked.connect(
-            lambda: cam.send_command(cam.commands["zoom tele var"].get_command(
-                {
-                    "speed": ui.zoom_bar.value() / 100,
-                }
-            )))
-        ui.wide_var.clicked.connect(
-            lambda: cam.send_command(cam.commands["zoom wide var"].get_command(
-                {
-                    "speed": ui.zoom_bar.value() / 100,
-                }
-            )))
-        ui.zoom_stop.clicked.connect(lambda: cam.send_command(cam.commands["zoom stop"].get_command(None)))
-        ui.tele_std.clicked.connect(lambda: cam.send_command(cam.commands["zoom tele std"].get_command(None)))
-        ui.wide_std.clicked.connect(lambda: cam.send_command(cam.commands["zoom wide std"].get_command(None)))
-
-        ui.home.clicked.connect(lambda: cam.send_command(cam.commands["home"].get_command(None)))
-        ui.stop.clicked.connect(lambda: cam.send_command(cam.commands["stop"].get_command(None)))
+            lambda: send("af mode one push trigger"))
+
+        ui.zoom_stop.clicked.connect(lambda: halt(ZOOM, "zoom stop"))
+        ui.tele_std.clicked.connect(lambda: halt(ZOOM, "zoom tele std"))
+        ui.wide_std.clicked.connect(lambda: halt(ZOOM, "zoom wide std"))
+
+        ui.home.clicked.connect(lambda: halt(PAN_TILT, "home"))
+        ui.stop.clicked.connect(lambda: halt(PAN_TILT, "stop"))
+        QShortcut(QKeySequence("Esc"), ui, emergency_stop)
+
+        # A macro's key starts it on the selected camera (or the one it names), pressing it again cancels it
+        from ptz.macros import MacroScheduler, load_macros
+        self.macros = MacroScheduler(cam, done=lambda run: status.update(
+            message="%s: %s" % (run.macro.name, run.error or ("cancelled" if run.cancelled else "done"))))
+        self.macros.start()
+        macros_file = os.environ.get("PTZ_MACROS", MACROS_FILE)
+        macros = dict()
+        if os.path.exists(macros_file):
+            try:
+                macros = load_macros(macros_file)
+            except ValueError as error:
+                ui.statusbar.showMessage(str(error), 10000)
+
+        def toggle_macro(macro):
+            running = self.macros.running(macro)
+            for run in running:
+                self.macros.cancel(run)
+            if not running:
+                self.macros.start_macro(macro)
+
+        for macro in macros.values():
+            if macro.key:
+                QShortcut(QKeySequence(macro.key), ui, lambda macro=macro: toggle_macro(macro))
+
+        # Widgets show what the camera reports, not just what was last clicked
+        af_labels = {value: label for label, (name, value) in af_modes.items()}
+        combos = [(widget, setting.key, setting.label) for widget, setting in setting_widgets]
+        combos.append((ui.af_mode, "af mode", af_labels.get))
+        checkboxes = [(ui.ex_ae_comp_on, "ex ae comp"), (ui.digital_zoom, "digital zoom")]
+        shown = dict(state=None, version=-1)
+
+        def refresh_from_state():
+            state = cam.active.state
+            if state is shown["state"] and state.version == shown["version"]:
+                return
+            shown["state"], shown["version"] = state, state.version
+
+            for widget, key, label_for in combos:
+                label = label_for(state.get(key))
+                if label is not None and label != widget.currentText():
+                    widget.blockSignals(True)
+                    widget.setCurrentText(label)
+                    widget.blockSignals(False)
+            for widget, key in checkboxes:
+                value = state.get(key)
+                if value is not None and value != bool(widget.checkState()):
+                    widget.blockSignals(True)
+                    widget.setChecked(value)
+                    widget.blockSignals(False)
+
+        self.poller = InquiryPoller(cam.cameras.values())
+        self.poller.start()
+        # Resets and restores the settings of a camera that rebooted or lost count of our sequence numbers
+        from ptz.recovery import SessionRecovery
+        self.recovery = SessionRecovery(cam.cameras.values())
+        self.recovery.start()
+        self.state_timer = QTimer()
+        self.state_timer.timeout.connect(refresh_from_state)
+        self.state_timer.start(250)
+
+        # F12 toggles per-command timings for the selected camera
+        debug_panel = QPlainTextEdit()
+        debug_panel.setReadOnly(True)
+        debug_panel.setWindowTitle("Command metrics")
+        debug_panel.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        debug_panel.resize(900, 300)
+        self.debug_panel = debug_panel
+
+        def refresh_debug_panel():
+            if debug_panel.isVisible():
+                metrics = cam.active.metrics
+                debug_panel.setPlainText(format_table(metrics.snapshot(), metrics.session()))
+
+        QShortcut(QKeySequence("F12"), ui, lambda: debug_panel.setVisible(not debug_panel.isVisible()))
+        self.state_timer.timeout.connect(refresh_debug_panel)
+
+        # PTZ_METRICS_PORT=9105 serves the same numbers for monitoring at /metrics and /metrics.json
+        self.metrics_server = None
+        if os.environ.get("PTZ_METRICS_PORT"):
+            from ptz.metrics import MetricsServer
+            self.metrics_server = MetricsServer(cam.metrics, port=int(os.environ["PTZ_METRICS_PORT"]))
+            self.metrics_server.start()
+
+        # PTZ_SERVER_PORT=52400 lets other controllers share these cameras' sessions, see ptz/server.py
+        self.control_server = None
+        if os.environ.get("PTZ_SERVER_PORT"):
+            from ptz.server import ControlServer
+            self.control_server = ControlServer(cam, port=int(os.environ["PTZ_SERVER_PORT"]))
+            self.control_server.start()
+
+        # The sequence LCD and the status bar are redrawn at most once per frame, however fast commands go out
+        status = dict(message=None, sequence_number=None)
+
+        def intent_done(method, result, error):
+            if error is not None:
+                status["message"] = "%s failed: %s" % (method, error)
+            elif method == "add":
+                # A discovered camera, watched like the ones given on the command line
+                self.poller.add(result)
+                self.recovery.add(result)
+                if self.control_server is not None:
+                    self.control_server.add(result)
+                camera_select.addItem(result.address)
+            elif method == "recall" and result is None:
+                status["message"] = "No such shot"
+            elif method == "capture":
+                status["message"] = "Shot saved"
+
+        def refresh_display():
+            sequence_number = cam.active.current_sequence_number
+            if sequence_number != status["sequence_number"]:
+                status["sequence_number"] = sequence_number
+                ui.seq_number.display(sequence_number)
+            if status["message"] is not None:
+                ui.statusbar.showMessage(status["message"], 5000)
+                status["message"] = None
+
+        self.signals.done.connect(intent_done)
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(refresh_display)
+        self.display_timer.start(max(1, int(1000 / (self.primaryScreen().refreshRate() or 60))))
 
         ui.speed_plus.clicked.connect(lambda: ui.speed_bar.setValue(ui.speed_bar.value() + 1))
         ui.speed_minus.clicked.connect(lambda: ui.speed_bar.setValue(ui.speed_bar.value() - 1))
@@ -549,10 +612,27 @@ class App(QApplication):
 
         ui.show()
 
-        sys.exit(self.exec_())
+        result = self.exec_()
+        # Stop the receive loop so the thread pool can wind down
+        self.hold.stop()
+        self.worker.close()
+        self.shots.close()
+        self.presets.close()
+        self.looks.close()
+        self.macros.stop()
+        self.recovery.stop()
+        self.poller.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.control_server is not None:
+            self.control_server.close()
+        self.cameras.close()
+        if self.cameras.journal is not None:
+            self.cameras.journal.close()
+        sys.exit(result)
 
 
 if __name__ == '__main__':
     # app = QApplication(sys.argv)
-    ex = App()
+    ex = App(sys.argv[1:] or ("192.168.0.100",))
     ex.main()
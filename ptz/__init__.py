@@ -0,0 +1,51 @@
+"""Qt-free control of Sony PTZ cameras over VISCA-over-IP.
+
+Nothing heavier than the standard library is imported, and submodules load on first use, so
+``import ptz`` stays cheap for scripts and the command line tool (``python3 -m ptz``).
+"""
+import importlib
+
+_exports = {
+    "Command": "commands",
+    "commands": "commands",
+    "Reply": "protocol",
+    "parse_reply": "protocol",
+    "Transport": "transport",
+    "SharedTransport": "transport",
+    "Camera": "camera",
+    "CameraPool": "camera",
+    "MotionScheduler": "scheduler",
+    "LatencyStats": "scheduler",
+    "StateCache": "state",
+    "InquiryPoller": "state",
+    "ViscaEngine": "engine",
+    "ViscaError": "engine",
+    "ViscaTimeout": "engine",
+    "CommandSuperseded": "engine",
+    "SimulatedCamera": "simulator",
+    "Metrics": "metrics",
+    "MetricsServer": "metrics",
+    "CommandWorker": "worker",
+    "SessionRecovery": "recovery",
+    "scan": "discovery",
+    "JournalWriter": "journal",
+    "JournalReader": "journal",
+    "Replay": "journal",
+    "MacroScheduler": "macros",
+    "load_macros": "macros",
+    "plan_move": "planner",
+    "PresetLibrary": "presets",
+    "ControlServer": "server",
+    "SceneLibrary": "scenes",
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module 'ptz' has no attribute %r" % name)
+
+    value = getattr(importlib.import_module("." + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,314 @@
+"""Cameras, and the pool that drives many of them from one socket."""
+import selectors
+import socket
+import threading
+import time
+import traceback
+
+from .commands import commands
+from .metrics import Metrics
+from .protocol import CONTROL_COMMAND, HEADER, MAX_PAYLOAD, VISCA_COMMAND, parse_reply
+from .scheduler import MotionScheduler
+from .state import StateCache
+from .transport import SharedTransport, Transport
+
+
+class Camera:
+    address = "192.168.0.100"
+    port = 52381
+    current_sequence_number = 0
+    sequence_callback = None
+    transport = None
+    send_buffer = None
+    send_view = None
+    subscribers = None
+    metrics = None
+    intended = None
+    last_sent_at = 0.0
+    journal = None
+    stopping = False
+    commands = commands
+
+    def __init__(self, address="192.168.0.100", port=52381, sequence_callback=None, local_port=None,
+                 transport=None, journal=None):
+        self.address = address
+        self.port = port
+        self.sequence_callback = sequence_callback
+        # A JournalWriter recording every datagram sent, the reset below included
+        self.journal = journal
+
+        if transport is None:
+            transport = Transport(self.address, self.port, local_port=local_port)
+        self.transport = transport
+        self.send_buffer = bytearray(HEADER.size + MAX_PAYLOAD)
+        self.send_view = memoryview(self.send_buffer)
+        # Sends come from the UI thread and, for coalesced motion, from the receive loop
+        self.send_lock = threading.Lock()
+        self.subscribers = []
+        self.metrics = Metrics()
+        self.subscribe(self.metrics.reply_received)
+        self.motion = MotionScheduler(self)
+        self.state = StateCache()
+        # state key -> (name, args) of the last apply, what a session recovery restores
+        self.intended = dict()
+        self.stopped = threading.Event()
+        self.stopped.set()
+        # Writing to wake_send interrupts the receive loop's select() so it can notice a stop. Only
+        # cameras running their own receive loop need one, pooled cameras are served by the pool.
+        self.wake_receive = None
+        self.wake_send = None
+
+        # self.send_command([0x01], prep_cmd=[0x02, 0x01])
+        # socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(bytes(prep_cmd), (self.address, self.port))
+        self.reset()
+
+    def reset(self):
+        # Nothing in flight will be answered under its number any more. Taken before the send lock, which
+        # the scheduler takes under its own.
+        self.motion.reset()
+        self.metrics.reset()
+        # Renumbered under the send lock, a send on another thread mustn't reuse or skip a number
+        with self.send_lock:
+            self.current_sequence_number = 1
+            self.send_payload(CONTROL_COMMAND, [0x01])
+            self.current_sequence_number = 0
+
+    def increment_sequence(self):
+        self.current_sequence_number = (self.current_sequence_number + 1) & 0xFFFFFFFF
+        if self.sequence_callback is not None:
+            self.sequence_callback(self.current_sequence_number)
+
+    def send_control_command(self, cmd):
+        with self.send_lock:
+            self.current_sequence_number = (self.current_sequence_number + 1) & 0xFFFFFFFF
+            self.send_payload(CONTROL_COMMAND, cmd)
+
+    def send_command(self, command, payload_type=VISCA_COMMAND):
+        with self.send_lock:
+            self.increment_sequence()
+            self.send_payload(payload_type, command)
+            self.last_sent_at = time.perf_counter()
+            return self.current_sequence_number
+
+    def send(self, name, args=None):
+        """Encodes ``commands[name]`` straight into the send buffer and puts it on the wire.
+
+        Returns the sequence number the command went out with.
+        """
+        called_at = time.perf_counter()
+        with self.send_lock:
+            encode_started = time.perf_counter()
+            size = self.commands[name].encode_into(self.send_buffer, HEADER.size, args)
+            encode_time = time.perf_counter() - encode_started
+            self.increment_sequence()
+            HEADER.pack_into(self.send_buffer, 0, VISCA_COMMAND, size, self.current_sequence_number)
+            # Recorded before sending, or the receive loop could see the ACK before its command
+            sent_at = self.last_sent_at = time.perf_counter()
+            self.metrics.sent(name, self.current_sequence_number, encode_time, sent_at - called_at, sent_at)
+            if self.journal is not None:
+                self.journal.record(self.address, self.port, VISCA_COMMAND, self.current_sequence_number,
+                                    self.send_view[HEADER.size:HEADER.size + size])
+            self.transport.send(self.send_view[:HEADER.size + size])
+            return self.current_sequence_number
+
+    def submit(self, name, args=None, issued_at=None):
+        """Like ``send``, but continuous motion is coalesced per axis by the MotionScheduler."""
+        return self.motion.submit(name, args, issued_at)
+
+    def emergency_stop(self, issued_at=None):
+        self.motion.stop_all(issued_at)
+
+    def apply(self, name, args, key, value=None):
+        """Submits ``commands[name]`` unless the state cache says ``key`` already has ``value``
+        (``args`` by default). Returns the sequence number, or None when the send was skipped."""
+        if value is None:
+            value = args
+        self.intended[key] = (name, args)
+        if self.state.get(key) == value:
+            return None
+
+        return self.submit(name, args)
+
+    def send_payload(self, payload_type, payload):
+        size = len(payload)
+        self.send_buffer[HEADER.size:HEADER.size + size] = payload
+        HEADER.pack_into(self.send_buffer, 0, payload_type, size, self.current_sequence_number)
+        if self.journal is not None:
+            self.journal.record(self.address, self.port, payload_type, self.current_sequence_number,
+                                self.send_view[HEADER.size:HEADER.size + size])
+        self.transport.send(self.send_view[:HEADER.size + size])
+
+    def subscribe(self, callback):
+        """Calls ``callback(reply)`` from the receive loop for every reply the camera sends."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def publish(self, reply):
+        for callback in self.subscribers:
+            try:
+                callback(reply)
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self):
+        """Asks the receive loop to return, it finishes the batch it's working on first."""
+        self.stopping = True
+        if self.wake_send is not None:
+            self.wake_send.send(b"\x00")
+
+    def close(self):
+        self.stop()
+        self.stopped.wait(1.0)
+        self.transport.close()
+        if self.wake_send is not None:
+            self.wake_receive.close()
+            self.wake_send.close()
+
+    def start(self):
+        """Runs the receive loop on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="camera %s" % self.address, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        self.stopped.clear()
+        self.wake_receive, self.wake_send = socket.socketpair()
+        selector = selectors.DefaultSelector()
+        selector.register(self.transport.socket, selectors.EVENT_READ)
+        selector.register(self.wake_receive, selectors.EVENT_READ)
+
+        try:
+            while not self.stopping:
+                selector.select()
+                for datagram in self.transport.recv_batch():
+                    reply = parse_reply(datagram)
+                    if reply is not None:
+                        self.publish(reply)
+        finally:
+            selector.close()
+            self.stopped.set()
+
+
+class CameraPool:
+    """Drives any number of cameras from one bound socket and one receive loop.
+
+    Replies are routed to the camera they came from by source address, and every camera keeps its
+    own sequence counter. ``send`` and ``send_command`` go to the active camera, so widgets bound
+    to the pool follow ``select`` without being rewired, and return what the active camera returns.
+    """
+    commands = Camera.commands
+    sequence_callback = None
+    active = None
+    # A JournalWriter every camera added afterwards records its sends to
+    journal = None
+    stopping = False
+
+    def __init__(self, port=52381, bind_address="0.0.0.0"):
+        self.port = port
+        self.cameras = dict()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((bind_address, port))
+        self.socket.setblocking(False)
+
+        self.stopped = threading.Event()
+        self.stopped.set()
+        self.wake_receive, self.wake_send = socket.socketpair()
+
+    def add(self, address, port=52381):
+        """Creates (and resets) a camera sharing the pool socket, the first one becomes active."""
+        # Replies are routed by source address, which is always numeric
+        address = socket.gethostbyname(address)
+        camera = Camera(address, port, transport=SharedTransport(self, address, port), journal=self.journal)
+        camera.sequence_callback = lambda seq, camera=camera: self.sequence_changed(camera, seq)
+        self.cameras[(address, port)] = camera
+
+        if self.active is None:
+            self.active = camera
+
+        return camera
+
+    def remove(self, address, port=52381):
+        camera = self.cameras.pop((address, port))
+        if camera is self.active:
+            self.active = next(iter(self.cameras.values()), None)
+
+    def get(self, address, port=52381):
+        return self.cameras[(address, port)]
+
+    def select(self, address, port=52381):
+        self.active = self.cameras[(address, port)]
+        self.sequence_changed(self.active, self.active.current_sequence_number)
+        return self.active
+
+    def sequence_changed(self, camera, seq):
+        if camera is self.active and self.sequence_callback is not None:
+            self.sequence_callback(seq)
+
+    def send(self, name, args=None):
+        return self.active.send(name, args)
+
+    def send_command(self, command, payload_type=VISCA_COMMAND):
+        return self.active.send_command(command, payload_type)
+
+    def submit(self, name, args=None, issued_at=None):
+        return self.active.submit(name, args, issued_at)
+
+    def emergency_stop(self, issued_at=None):
+        self.active.emergency_stop(issued_at)
+
+    def apply(self, name, args, key, value=None):
+        return self.active.apply(name, args, key, value)
+
+    def stop(self):
+        self.stopping = True
+        self.wake_send.send(b"\x00")
+
+    def metrics(self):
+        """``{"address:port": Metrics}`` for every camera, what MetricsServer serves."""
+        return {"%s:%d" % key: camera.metrics for key, camera in list(self.cameras.items())}
+
+    def close(self):
+        self.stop()
+        self.stopped.wait(1.0)
+        self.socket.close()
+        self.wake_receive.close()
+        self.wake_send.close()
+
+    def start(self):
+        """Runs the shared receive loop on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="camera pool", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        self.stopped.clear()
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        selector.register(self.wake_receive, selectors.EVENT_READ)
+        cameras = self.cameras
+
+        try:
+            while not self.stopping:
+                selector.select()
+                for _ in range(64):
+                    try:
+                        datagram, source = self.socket.recvfrom(1024)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionRefusedError:
+                        continue
+
+                    camera = cameras.get(source)
+                    if camera is None:
+                        continue
+
+                    reply = parse_reply(datagram)
+                    if reply is not None:
+                        camera.publish(reply)
+        finally:
+            selector.close()
+            self.stopped.set()
@@ -0,0 +1,469 @@
+"""Command line control of a single camera, without Qt.
+
+    python3 -m ptz recall 3 --camera 10.0.0.5
+    python3 -m ptz move left --speed 0.4
+    python3 -m ptz discover 10.0.0.0/24
+    python3 -m ptz --camera 127.0.0.2 replay show.ptzj --speed 4
+    python3 -m ptz macro macros.json "sweep left"
+    python3 -m ptz goto --pan 0x800 --tilt -0x200 --zoom 0x2000 --duration 3 --easing ease-in-out
+    python3 -m ptz shot presets.db save "pulpit wide" --tag pulpit
+    python3 -m ptz scene scenes.json apply stage
+    python3 -m ptz serve 10.0.0.5 10.0.0.6 --listen 0.0.0.0
+"""
+import argparse
+import select
+import struct
+import sys
+import time
+
+from .camera import Camera
+from .commands import DIRECTIONS, SETTINGS, commands
+from .planner import EASINGS
+from .protocol import ACK, COMPLETION, ERROR, ERROR_MESSAGES, parse_reply
+from .state import INQUIRIES
+
+# Each subcommand imports what only it needs when it runs, asyncio and sqlite3 alone would double the
+# start-up time of every other command
+
+
+def wait_for(camera, sequence_number, kinds, timeout):
+    """Reads replies until one for ``sequence_number`` has a kind in ``kinds`` (or is an error)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([camera.transport.socket], [], [], remaining)[0]:
+            return None
+
+        for datagram in camera.transport.recv_batch():
+            reply = parse_reply(datagram)
+            if reply is not None and reply.sequence_number == sequence_number:
+                if reply.kind in kinds or reply.kind == ERROR:
+                    return reply
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ptz", description="Control a Sony PTZ camera over VISCA-over-IP.")
+    parser.add_argument("--camera", default="192.168.0.100", help="camera address (default %(default)s)")
+    parser.add_argument("--port", type=int, default=52381, help="camera VISCA-over-IP port")
+    parser.add_argument("--local-port", type=int, default=52381, help="local port replies arrive on")
+    parser.add_argument("--wait", choices=("none", "ack", "completion"), default="ack",
+                        help="what to wait for before exiting (default %(default)s)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="seconds to wait (default %(default)s)")
+
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    recall = subparsers.add_parser("recall", help="recall a preset")
+    recall.add_argument("preset", type=int, choices=range(16), metavar="PRESET")
+    store = subparsers.add_parser("store", help="store the current position as a preset")
+    store.add_argument("preset", type=int, choices=range(16), metavar="PRESET")
+
+    move = subparsers.add_parser("move", help="start panning/tilting")
+    move.add_argument("direction", choices=DIRECTIONS)
+    move.add_argument("--speed", type=float, default=0.5, help="0 to 1 (default %(default)s)")
+    subparsers.add_parser("stop", help="stop panning/tilting")
+    subparsers.add_parser("home", help="return to the home position")
+
+    zoom = subparsers.add_parser("zoom", help="zoom tele/wide, or stop zooming")
+    zoom.add_argument("direction", choices=("tele", "wide", "stop"))
+    zoom.add_argument("--speed", type=float, default=0.5, help="0 to 1 (default %(default)s)")
+    focus = subparsers.add_parser("focus", help="focus far/near, or stop focusing")
+    focus.add_argument("direction", choices=("far", "near", "stop"))
+    focus.add_argument("--speed", type=float, default=0.5, help="0 to 1 (default %(default)s)")
+
+    send = subparsers.add_parser("send", help="send any catalog command by name")
+    send.add_argument("name", help="catalog name, see 'list'")
+    send.add_argument("value", nargs="?",
+                      help="integer argument, e.g. 0x0C for 'fstop set', or a label, e.g. Manual for 'ae mode'")
+    subparsers.add_parser("list", help="list the catalog command names")
+
+    discover = subparsers.add_parser("discover", help="find cameras by broadcast and by probing a subnet")
+    discover.add_argument("network", nargs="?",
+                          help="subnet to probe, e.g. 10.0.0.0/24 (default: the /24 on the way to --camera)")
+    discover.add_argument("--parallel", type=int, default=256, help="probes in flight at once (default %(default)s)")
+    discover.add_argument("--probe-timeout", type=float, default=0.25,
+                          help="seconds each probe waits for an answer (default %(default)s)")
+    discover.add_argument("--no-broadcast", action="store_true", help="only probe, skip the discovery broadcast")
+
+    replay = subparsers.add_parser("replay", help="re-send a journal to --camera with its original timing")
+    dump = subparsers.add_parser("dump", help="print the records of a journal")
+    for journal in (replay, dump):
+        journal.add_argument("journal", help="journal file, e.g. written by main.py with PTZ_JOURNAL set")
+        journal.add_argument("--from", dest="start", type=float, help="seconds into the journal to start at")
+        journal.add_argument("--to", dest="end", type=float, help="seconds into the journal to stop at")
+        journal.add_argument("--only", metavar="ADDRESS", help="only the records sent to this camera")
+    replay.add_argument("--speed", type=float, default=1.0, help="2 plays twice as fast (default %(default)s)")
+
+    goto = subparsers.add_parser("goto", help="move to a position, every axis arriving at once")
+    for axis in ("pan", "tilt", "zoom", "focus"):
+        goto.add_argument("--" + axis, type=lambda value: int(value, 0), help="target %s position" % axis)
+    goto.add_argument("--duration", type=float, default=2.0, help="seconds the move takes (default %(default)s)")
+    goto.add_argument("--easing", choices=sorted(EASINGS), default="linear")
+    goto.add_argument("--dry-run", action="store_true", help="print the planned commands, send nothing")
+
+    macro = subparsers.add_parser("macro", help="run a macro from a macro file on --camera")
+    macro.add_argument("file", help="JSON macro file")
+    macro.add_argument("name", nargs="?", help="macro to run, lists them when left out")
+
+    shot = subparsers.add_parser("shot", help="save, recall, search or remove named shots in a preset library")
+    shot.add_argument("library", help="preset library file, created if missing")
+    shot.add_argument("verb", choices=("save", "recall", "list", "remove"))
+    shot.add_argument("name", nargs="?", help="shot name, or the text to search for with 'list'")
+    shot.add_argument("--tag", action="append", default=[], help="tag the shot (save) or search by tag (list)")
+
+    scene = subparsers.add_parser("scene", help="save, apply, list or remove exposure/white balance/focus scenes")
+    scene.add_argument("file", help="JSON scene file, created if missing")
+    scene.add_argument("verb", choices=("save", "apply", "list", "remove"))
+    scene.add_argument("name", nargs="?", help="scene name")
+
+    serve = subparsers.add_parser("serve", help="share cameras with any number of clients over TCP")
+    serve.add_argument("cameras", nargs="*", metavar="CAMERA", help="camera addresses (default: --camera)")
+    serve.add_argument("--listen", default="127.0.0.1", help="address to serve on (default %(default)s)")
+    serve.add_argument("--server-port", type=int, default=52400, help="port to serve on (default %(default)s)")
+
+    return parser
+
+
+def command_for(parser, options):
+    """Maps the parsed command line onto a catalog name and its arguments."""
+    action = options.action
+    if action == "recall":
+        return "recall preset x", options.preset
+    if action == "store":
+        return "set preset x", options.preset
+    if action == "move":
+        return "move", {"speed": options.speed, "postfix": DIRECTIONS[options.direction]}
+    if action in ("stop", "home"):
+        return action, None
+    if action in ("zoom", "focus"):
+        if options.direction == "stop":
+            return action + " stop", None
+        return "%s %s var" % (action, options.direction), {"speed": options.speed}
+
+    return options.name, send_value(parser, options.name, options.value)
+
+
+def send_value(parser, name, text):
+    """The argument ``send`` passes to ``commands[name]``, ``text`` being an integer or a setting's label.
+
+    Anything the command can't take is reported through ``parser``, which exits.
+    """
+    command = commands[name]
+    if command.arg_lambda is None:
+        if text is not None:
+            parser.error("%r takes no value" % name)
+        return None
+    if text is None:
+        parser.error("%r needs a value" % name)
+
+    setting = next((setting for setting in SETTINGS.values() if setting.command == name), None)
+    try:
+        value = int(text, 0)
+    except ValueError:
+        if setting is None or text not in setting.labels:
+            parser.error("%r takes an integer%s, not %r" % (
+                name, "" if setting is None else " or one of " + ", ".join(setting.labels), text))
+        return setting.value(text)
+    if setting is not None and setting.label(value) is None:
+        parser.error("%r takes one of %s, not %s" % (
+            name, ", ".join("%s (0x%02X)" % choice for choice in setting.choices), text))
+
+    try:
+        command.get_command(value)
+    except (AttributeError, TypeError, KeyError, ValueError, OverflowError, struct.error):
+        # Motion and absolute positions take several arguments, see goto
+        parser.error("%r can't be sent with a single value %s" % (name, text))
+    return value
+
+
+def discover(options):
+    from .discovery import local_network, scan
+
+    network = options.network or local_network(options.camera)
+    if network is None:
+        print("ptz: no route towards %s, give a network to probe" % options.camera, file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    found = scan(network, lambda camera: print(camera, flush=True), parallel=options.parallel,
+                 timeout=options.probe_timeout, port=options.port,
+                 broadcast_address=None if options.no_broadcast else "<broadcast>")
+    print("%d camera(s) in %.2fs" % (len(found), time.perf_counter() - started), file=sys.stderr)
+    return 0 if found else 1
+
+
+def play(options):
+    from .journal import JournalReader, Replay
+
+    journal = JournalReader(options.journal)
+    entries = journal.entries(options.start, options.end, options.only)
+    try:
+        if options.action == "dump":
+            for entry in entries:
+                print(entry)
+            return 0
+
+        camera = Camera(options.camera, options.port, local_port=options.local_port)
+        replay = Replay(entries, camera, options.speed)
+        started = time.perf_counter()
+        try:
+            replay.run()
+        finally:
+            camera.close()
+        print("sent %d in %.2fs, at worst %.2fms late" % (replay.sent, time.perf_counter() - started,
+                                                         replay.worst_lateness * 1000), file=sys.stderr)
+        return 0
+    finally:
+        journal.close()
+
+
+def inquire(camera, name, timeout):
+    """Sends an inquiry and returns its decoded values, or an empty dict without an answer."""
+    reply = wait_for(camera, camera.send(name), (COMPLETION,), timeout)
+    if reply is None or reply.kind != COMPLETION:
+        return dict()
+    return INQUIRIES[name](reply.data)
+
+
+def goto(options):
+    from .macros import MacroScheduler
+    from .planner import plan_move
+
+    target = {axis: getattr(options, axis) for axis in ("pan", "tilt", "zoom", "focus")}
+    camera = Camera(options.camera, options.port, local_port=options.local_port)
+    scheduler = None
+    try:
+        pose = dict()
+        for name in ("pan tilt position inquiry", "zoom position inquiry", "focus position inquiry"):
+            pose.update(inquire(camera, name, options.timeout))
+        try:
+            plan = plan_move(pose, target, options.duration, options.easing)
+        except ValueError as error:
+            print("ptz: %s" % error, file=sys.stderr)
+            return 1
+
+        for offset, name, args in plan.commands:
+            print("%6.3fs %-22s %s" % (offset, name, camera.commands[name].get_command(args).hex(" ")))
+        if options.dry_run:
+            return 0
+
+        camera.start()
+        scheduler = MacroScheduler(camera)
+        scheduler.start()
+        run = scheduler.start_macro(plan.macro())
+        run.finished.wait()
+        return 0 if run.error is None else 1
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        camera.close()
+
+
+def shot(options):
+    from .presets import AXES, SETTING_KEYS, PresetLibrary
+
+    library = PresetLibrary(options.library, timeout=max(options.timeout, 10.0))
+    try:
+        if options.verb == "list":
+            for found in library.search(options.name or "", options.tag, limit=1000):
+                print("%-32s %-15s %5d recalls %-7s %s" % (found.name, found.camera, found.recalls,
+                                                           "" if found.slot is None else "slot %d" % found.slot,
+                                                           " ".join(found.tags)))
+            return 0
+        if options.name is None:
+            print("ptz: %s needs a shot name" % options.verb, file=sys.stderr)
+            return 2
+        if options.verb == "remove":
+            library.remove(options.camera, options.name)
+            return 0
+
+        camera = Camera(options.camera, options.port, local_port=options.local_port)
+        try:
+            if options.verb == "save":
+                state = dict()
+                for name in ("pan tilt position inquiry", "zoom position inquiry", "focus position inquiry",
+                             "ae mode inquiry", "wb mode inquiry", "fstop inquiry", "shutter inquiry",
+                             "gain inquiry", "ex_ae_comp inquiry"):
+                    state.update(inquire(camera, name, options.timeout))
+                library.store(camera.address, options.name, {axis: state.get(axis) for axis in AXES},
+                              {key: state.get(key) for key in SETTING_KEYS}, options.tag)
+                return 0
+
+            # The receive loop lets the library see the completions, and mirror the shot into a slot
+            camera.start()
+            recalled = []
+            if library.recall(camera, options.name, done=recalled.append) is None:
+                print("ptz: no shot %r for %s" % (options.name, camera.address), file=sys.stderr)
+                return 1
+            # The library gives up on a completion that doesn't come, so this ends
+            while not recalled:
+                time.sleep(0.05)
+            if recalled[0].failed is not None:
+                print("ptz: recalling %r %s" % (options.name, recalled[0].failed), file=sys.stderr)
+                return 1
+            return 0
+        finally:
+            camera.close()
+    finally:
+        library.close()
+
+
+def scene(options):
+    from .scenes import SCENE_INQUIRIES, SceneLibrary
+
+    try:
+        library = SceneLibrary(options.file)
+    except (OSError, ValueError) as error:
+        print("ptz: %s" % error, file=sys.stderr)
+        return 1
+
+    if options.verb == "list":
+        for name in library.names():
+            print("%-32s %s" % (name, " ".join("%s=%s" % item for item in library.get(name).values.items())))
+        return 0
+    if options.name is None:
+        print("ptz: %s needs a scene name" % options.verb, file=sys.stderr)
+        return 2
+    if options.verb == "remove":
+        return 0 if library.remove(options.name) else 1
+    if options.verb == "apply" and library.get(options.name) is None:
+        print("ptz: no scene %r in %s" % (options.name, options.file), file=sys.stderr)
+        return 1
+
+    camera = Camera(options.camera, options.port, local_port=options.local_port)
+    try:
+        # Both need to know what the camera is set to, to capture it or to send only what differs
+        values = dict()
+        for name in SCENE_INQUIRIES:
+            values.update(inquire(camera, name, options.timeout))
+        camera.state.update(values)
+        if options.verb == "save":
+            library.capture(camera, options.name)
+            return 0
+
+        camera.start()
+        run = library.apply(camera, options.name)
+        run.finished.wait()
+        print(run.summary())
+        return 0 if not run.failed else 1
+    finally:
+        camera.close()
+
+
+def run_macro(options):
+    from .macros import MacroScheduler, load_macros
+
+    try:
+        macros = load_macros(options.file)
+    except (OSError, ValueError) as error:
+        print("ptz: %s" % error, file=sys.stderr)
+        return 2
+    if options.name is None:
+        for macro in macros.values():
+            print("%-24s %3d steps %6.2fs  %s" % (macro.name, len(macro.steps), macro.duration(), macro.key or ""))
+        return 0
+    if options.name not in macros:
+        print("ptz: no macro %r in %s" % (options.name, options.file), file=sys.stderr)
+        return 2
+
+    camera = Camera(options.camera, options.port, local_port=options.local_port)
+    camera.start()
+    scheduler = MacroScheduler(camera)
+    scheduler.start()
+    try:
+        # The macro runs on the camera given on the command line, whatever camera the file names
+        run = scheduler.start_macro(macros[options.name])
+        run.finished.wait()
+    except KeyboardInterrupt:
+        scheduler.cancel(run)
+        run.finished.wait(1.0)
+    finally:
+        scheduler.stop()
+        camera.close()
+
+    lateness = run.lateness.summary()
+    if lateness["count"]:
+        print("%d steps, late by %.2fms at the median, %.2fms at worst" % (
+            lateness["count"], lateness["p50"] * 1000, lateness["max"] * 1000), file=sys.stderr)
+    if run.error is not None:
+        print("ptz: %s: %s" % (run.macro.name, run.error), file=sys.stderr)
+        return 1
+    return 0
+
+
+def serve(options):
+    import asyncio
+
+    from .camera import CameraPool
+    from .recovery import SessionRecovery
+    from .server import ControlServer
+    from .state import InquiryPoller
+
+    pool = CameraPool(options.local_port)
+    for address in options.cameras or [options.camera]:
+        pool.add(address, options.port)
+    pool.start()
+    # The poller keeps the state clients are streamed fresh, recovery keeps the sessions alive
+    poller = InquiryPoller(pool.cameras.values())
+    poller.start()
+    recovery = SessionRecovery(pool.cameras.values())
+    recovery.start()
+    server = ControlServer(pool, options.listen, options.server_port)
+    print("serving %s on %s:%d" % (", ".join(address for address, port in pool.cameras), options.listen,
+                                   options.server_port), file=sys.stderr)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recovery.stop()
+        poller.stop()
+        pool.close()
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    options = parser.parse_args(argv)
+
+    if options.action == "list":
+        print("\n".join(sorted(commands)))
+        return 0
+    if options.action == "discover":
+        return discover(options)
+    if options.action in ("replay", "dump"):
+        return play(options)
+    if options.action == "macro":
+        return run_macro(options)
+    if options.action == "goto":
+        return goto(options)
+    if options.action == "shot":
+        return shot(options)
+    if options.action == "scene":
+        return scene(options)
+    if options.action == "serve":
+        return serve(options)
+    if options.action == "send" and options.name not in commands:
+        print("ptz: unknown command %r, see 'ptz list'" % options.name, file=sys.stderr)
+        return 2
+
+    name, args = command_for(parser, options)
+    camera = Camera(options.camera, options.port, local_port=options.local_port)
+    try:
+        sequence_number = camera.send(name, args)
+        if options.wait == "none":
+            return 0
+
+        kinds = (ACK, COMPLETION) if options.wait == "ack" else (COMPLETION,)
+        reply = wait_for(camera, sequence_number, kinds, options.timeout)
+    finally:
+        camera.close()
+
+    if reply is None:
+        print("ptz: no %s from %s within %.1fs" % (options.wait, options.camera, options.timeout), file=sys.stderr)
+        return 1
+    if reply.kind == ERROR:
+        print("ptz: %s: %s" % (name, ERROR_MESSAGES.get(reply.error, "error 0x%02X" % reply.error)),
+              file=sys.stderr)
+        return 1
+
+    return 0
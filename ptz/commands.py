@@ -0,0 +1,294 @@
+"""The VISCA command catalog, compiled into byte templates at import."""
+import struct
+
+# Axes of continuous motion, each gets its own latest-wins slot in the MotionScheduler
+PAN_TILT = "pan-tilt"
+ZOOM = "zoom"
+FOCUS = "focus"
+
+# Command priorities. Stops skip every queue and cancel the motion still waiting behind them.
+PRIORITY_NORMAL = 0
+PRIORITY_STOP = 1
+
+ARG_BYTE = struct.Struct("B")
+ARG_PAIR = struct.Struct("BB")
+ARG_NIBBLES = struct.Struct("BBBB")
+
+# Speed bytes run from 1 to these, the lambdas map a 0 to 1 speed onto them
+PAN_SPEEDS = 0x18
+TILT_SPEEDS = 0x14
+ZOOM_SPEEDS = 7
+
+AE_MODES = {
+    "Full Auto": 0x00,
+    "Manual": 0x03,
+    "Tv": 0x0A,
+    "Av": 0x0B,
+    "Brightness": 0x0D
+}
+
+WB_MODES = {
+    "Auto": 0x00,
+    "Indoor": 0x01,
+    "Outdoor": 0x02,
+    "One Push": 0x03,  # Mode Set
+    "Auto Tracking": 0x04,
+    "Manual": 0x05
+}
+
+
+class Command:
+    """A VISCA payload compiled once into an immutable byte template.
+
+    Commands that take arguments carry a lambda that patches the argument bytes into an
+    already-copied template at ``argument_offset``, so encoding never builds a list or deep copies.
+    """
+    data = b""
+    arg_lambda = None
+    argument_offset = 0
+    axis = None
+    priority = PRIORITY_NORMAL
+
+    def __init__(self, data, argument_lambda=None, argument_offset=0, axis=None, priority=PRIORITY_NORMAL):
+        self.data = bytes(data)
+        self.size = len(self.data)
+        self.arg_lambda = argument_lambda
+        self.argument_offset = argument_offset
+        # Continuous motion commands name the axis they drive, see MotionScheduler
+        self.axis = axis
+        self.priority = priority
+
+    def encode_into(self, buffer, offset, args=None):
+        """Writes the command into ``buffer`` at ``offset`` and returns its length."""
+        buffer[offset:offset + self.size] = self.data
+        if self.arg_lambda is not None:
+            self.arg_lambda(buffer, offset + self.argument_offset, args)
+
+        return self.size
+
+    def get_command(self, args=None):
+        if self.arg_lambda is None:
+            return self.data
+
+        buffer = bytearray(self.size)
+        self.encode_into(buffer, 0, args)
+        return bytes(buffer)
+
+
+def preset(buffer, offset, args):
+    ARG_BYTE.pack_into(buffer, offset, args)
+
+
+def pan_tilt_speeds(buffer, offset, args):
+    # VV WW, from "speed" or, when the axes move at different speeds, "pan_speed" and "tilt_speed"
+    speed_pan = int(args.get("pan_speed", args.get("speed")) * (PAN_SPEEDS - 1)) + 1
+    speed_tilt = int(args.get("tilt_speed", args.get("speed")) * (TILT_SPEEDS - 1)) + 1
+
+    ARG_PAIR.pack_into(buffer, offset, speed_pan, speed_tilt)  # between 0x01 and 0x18, 0x01 and 0x14
+
+
+def position_into(buffer, offset, value):
+    # A 16 bit position, negative ones in two's complement, as 0p 0q 0r 0s
+    value &= 0xFFFF
+    ARG_NIBBLES.pack_into(buffer, offset, value >> 12, (value >> 8) & 0x0F, (value >> 4) & 0x0F, value & 0x0F)
+
+
+def pan_tilt_position_lambda(buffer, offset, args):
+    # VV WW 0Y 0Y 0Y 0Y 0Z 0Z 0Z 0Z FF, absolute or relative depending on the command
+    pan_tilt_speeds(buffer, offset, args)
+    position_into(buffer, offset + 2, args["pan"])
+    position_into(buffer, offset + 6, args["tilt"])
+
+
+def position_lambda(buffer, offset, args):
+    # 0p 0q 0r 0s FF, zoom and focus direct
+    position_into(buffer, offset, args)
+
+
+def oneshot_ptz_lambda(buffer, offset, args):
+    # VV WW XX YY FF, where XX/YY are the pan/tilt directions from the postfix
+    postfix = args["postfix"]
+
+    pan_tilt_speeds(buffer, offset, args)
+    ARG_PAIR.pack_into(buffer, offset + 2, postfix[0], postfix[1])
+
+
+def zoom_tele_variable(buffer, offset, args):
+    speed = int(args["speed"] * (ZOOM_SPEEDS - 1)) + 1
+    ARG_BYTE.pack_into(buffer, offset, 0x20 + speed)
+
+
+def zoom_wide_variable(buffer, offset, args):
+    speed = int(args["speed"] * (ZOOM_SPEEDS - 1)) + 1
+    ARG_BYTE.pack_into(buffer, offset, 0x30 + speed)
+
+
+def exposure_command(buffer, offset, args):
+    ARG_PAIR.pack_into(buffer, offset, args >> 4, args & 0x0F)
+
+
+def ae_mode_lambda(buffer, offset, args):
+    # Either a mode name or its raw value
+    ARG_BYTE.pack_into(buffer, offset, AE_MODES.get(args, args))
+
+
+def wb_mode_lambda(buffer, offset, args):
+    ARG_BYTE.pack_into(buffer, offset, WB_MODES.get(args, args))
+
+
+commands = dict()
+
+commands["backlight on"] = Command([0x81, 0x01, 0x04, 0x33, 0x03, 0xFF])
+commands["backlight off"] = Command([0x81, 0x01, 0x04, 0x33, 0x02, 0xFF])
+commands["set preset x"] = Command([0x81, 0x01, 0x04, 0x3F, 0x01, 0x00, 0xFF], argument_lambda=preset,
+                                   argument_offset=5)
+commands["recall preset x"] = Command([0x81, 0x01, 0x04, 0x3F, 0x02, 0x00, 0xFF], argument_lambda=preset,
+                                      argument_offset=5)
+commands["home"] = Command([0x81, 0x01, 0x06, 0x04, 0xFF], axis=PAN_TILT)
+# {"pan": ..., "tilt": ..., "speed": 0 to 1}, positions in the camera's own units
+commands["pan absolute position"] = Command(
+    [0x81, 0x01, 0x06, 0x02, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xFF],
+    argument_lambda=pan_tilt_position_lambda, argument_offset=4, axis=PAN_TILT)
+commands["pan relative position"] = Command(
+    [0x81, 0x01, 0x06, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xFF],
+    argument_lambda=pan_tilt_position_lambda, argument_offset=4, axis=PAN_TILT)
+commands["move"] = Command([0x81, 0x01, 0x06, 0x01, 0x00, 0x00, 0x03, 0x03, 0xFF],
+                           argument_lambda=oneshot_ptz_lambda, argument_offset=4, axis=PAN_TILT)
+commands["stop"] = Command([0x81, 0x01, 0x06, 0x01, 0x01, 0x01, 0x03, 0x03, 0xFF], axis=PAN_TILT,
+                           priority=PRIORITY_STOP)
+commands["osd on"] = Command([0x81, 0x01, 0x7E, 0x01, 0x18, 0x02, 0xFF])
+commands["osd off"] = Command([0x81, 0x01, 0x7E, 0x01, 0x18, 0x03, 0xFF])
+commands["low latency on"] = Command([0x81, 0x01, 0x7E, 0x01, 0x5A, 0x02, 0xFF])
+commands["low latency off"] = Command([0x81, 0x01, 0x7E, 0x01, 0x5A, 0x03, 0xFF])
+commands["zoom stop"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF], axis=ZOOM, priority=PRIORITY_STOP)
+commands["digital zoom on"] = Command([0x81, 0x01, 0x04, 0x06, 0x02, 0xFF])
+commands["digital zoom off"] = Command([0x81, 0x01, 0x04, 0x06, 0x03, 0xFF])
+commands["zoom tele std"] = Command([0x81, 0x01, 0x04, 0x07, 0x02, 0xFF], axis=ZOOM)
+commands["zoom wide std"] = Command([0x81, 0x01, 0x04, 0x07, 0x03, 0xFF], axis=ZOOM)
+commands["zoom tele var"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF], argument_lambda=zoom_tele_variable,
+                                    argument_offset=4, axis=ZOOM)
+commands["zoom direct"] = Command([0x81, 0x01, 0x04, 0x47, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                                  argument_lambda=position_lambda, argument_offset=4, axis=ZOOM)
+commands["zoom wide var"] = Command([0x81, 0x01, 0x04, 0x07, 0x00, 0xFF], argument_lambda=zoom_wide_variable,
+                                    argument_offset=4, axis=ZOOM)
+commands["ae mode"] = Command([0x81, 0x01, 0x04, 0x39, 0x00, 0xFF],
+                              argument_lambda=ae_mode_lambda, argument_offset=4)
+commands["brighter"] = Command([0x81, 0x01, 0x04, 0x0D, 0x02, 0xFF])
+commands["darker"] = Command([0x81, 0x01, 0x04, 0x0D, 0x03, 0xFF])
+
+commands["af mode auto"] = Command([0x81, 0x01, 0x04, 0x38, 0x02, 0xFF])
+commands["af mode manual"] = Command([0x81, 0x01, 0x04, 0x38, 0x03, 0xFF])
+commands["af mode auto/manual"] = Command([0x81, 0x01, 0x04, 0x38, 0x10, 0xFF])
+commands["af mode one push trigger"] = Command([0x81, 0x01, 0x04, 0x18, 0x01, 0xFF])
+commands["focus far var"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF], argument_lambda=zoom_tele_variable,
+                                    argument_offset=4, axis=FOCUS)
+commands["focus near var"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF], argument_lambda=zoom_wide_variable,
+                                     argument_offset=4, axis=FOCUS)
+commands["focus direct"] = Command([0x81, 0x01, 0x04, 0x48, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                                   argument_lambda=position_lambda, argument_offset=4, axis=FOCUS)
+commands["focus stop"] = Command([0x81, 0x01, 0x04, 0x08, 0x00, 0xFF], axis=FOCUS, priority=PRIORITY_STOP)
+commands["wb mode"] = Command([0x81, 0x01, 0x04, 0x35, 0x00, 0xFF], argument_lambda=wb_mode_lambda,
+                              argument_offset=4)
+commands["wb mode trigger"] = Command([0x81, 0x01, 0x04, 0x10, 0x05, 0xFF])
+commands["red gain up"] = Command([0x81, 0x01, 0x04, 0x03, 0x02, 0xFF])
+commands["red gain down"] = Command([0x81, 0x01, 0x04, 0x03, 0x03, 0xFF])
+commands["red gain reset"] = Command([0x81, 0x01, 0x04, 0x03, 0x00, 0xFF])
+commands["blue gain up"] = Command([0x81, 0x01, 0x04, 0x04, 0x02, 0xFF])
+commands["blue gain down"] = Command([0x81, 0x01, 0x04, 0x04, 0x03, 0xFF])
+commands["blue gain reset"] = Command([0x81, 0x01, 0x04, 0x04, 0x00, 0xFF])
+commands["gain set"] = Command([0x81, 0x01, 0x04, 0x4C, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                               argument_lambda=exposure_command, argument_offset=6)
+commands["shutter set"] = Command([0x81, 0x01, 0x04, 0x4A, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                                  argument_lambda=exposure_command, argument_offset=6)
+commands["fstop set"] = Command([0x81, 0x01, 0x04, 0x4B, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                                argument_lambda=exposure_command, argument_offset=6)
+commands["ex_ae_comp set"] = Command([0x81, 0x01, 0x04, 0x4E, 0x00, 0x00, 0x00, 0x00, 0xFF],
+                                     argument_lambda=exposure_command, argument_offset=6)
+commands["ex ae comp on"] = Command([0x81, 0x01, 0x04, 0x03E, 0x02, 0xFF])
+commands["ex ae comp off"] = Command([0x81, 0x01, 0x04, 0x3E, 0x03, 0xFF])
+
+# Inquiries, answered with a completion carrying the value (y0 50 ... FF)
+commands["zoom position inquiry"] = Command([0x81, 0x09, 0x04, 0x47, 0xFF])
+commands["focus position inquiry"] = Command([0x81, 0x09, 0x04, 0x48, 0xFF])
+commands["pan tilt position inquiry"] = Command([0x81, 0x09, 0x06, 0x12, 0xFF])
+commands["ae mode inquiry"] = Command([0x81, 0x09, 0x04, 0x39, 0xFF])
+commands["wb mode inquiry"] = Command([0x81, 0x09, 0x04, 0x35, 0xFF])
+commands["af mode inquiry"] = Command([0x81, 0x09, 0x04, 0x38, 0xFF])
+commands["gain inquiry"] = Command([0x81, 0x09, 0x04, 0x4C, 0xFF])
+commands["shutter inquiry"] = Command([0x81, 0x09, 0x04, 0x4A, 0xFF])
+commands["fstop inquiry"] = Command([0x81, 0x09, 0x04, 0x4B, 0xFF])
+commands["ex_ae_comp inquiry"] = Command([0x81, 0x09, 0x04, 0x4E, 0xFF])
+commands["ex ae comp inquiry"] = Command([0x81, 0x09, 0x04, 0x3E, 0xFF])
+commands["digital zoom inquiry"] = Command([0x81, 0x09, 0x04, 0x06, 0xFF])
+commands["device type inquiry"] = Command([0x81, 0x09, 0x00, 0x02, 0xFF])
+
+# ex_ae_comp
+# gain         8x 01 04 4C 00 00 0p 0q FF
+# shutter      8x 01 04 4A 00 00 0p 0q FF
+# fstop        8x 01 04 4B 00 00 0p 0q FF
+
+# Pan/tilt direction bytes of the "move" postfix
+DIRECTIONS = {
+    "up": [0x03, 0x01, 0xFF],
+    "down": [0x03, 0x02, 0xFF],
+    "left": [0x01, 0x03, 0xFF],
+    "right": [0x02, 0x03, 0xFF],
+    "up-left": [0x01, 0x01, 0xFF],
+    "up-right": [0x02, 0x01, 0xFF],
+    "down-left": [0x01, 0x02, 0xFF],
+    "down-right": [0x02, 0x02, 0xFF],
+}
+
+
+class Setting:
+    """A camera setting offered as a list of labelled values, like the iris f-stops.
+
+    ``command`` sets it and ``key`` is where the state cache keeps what the camera reports. The
+    label/value lookups are only built the first time they're needed.
+    """
+
+    def __init__(self, key, command, choices):
+        self.key = key
+        self.command = command
+        self.choices = choices
+        self._values = None
+        self._labels = None
+
+    @property
+    def labels(self):
+        return [label for label, value in self.choices]
+
+    def value(self, label):
+        if self._values is None:
+            self._values = dict(self.choices)
+        return self._values[label]
+
+    def label(self, value):
+        if self._labels is None:
+            self._labels = {value: label for label, value in self.choices}
+        return self._labels.get(value)
+
+
+SETTINGS = {
+    "ae mode": Setting("ae mode", "ae mode", tuple(AE_MODES.items())),
+    "wb mode": Setting("wb mode", "wb mode", tuple(WB_MODES.items())),
+    "fstop": Setting("fstop", "fstop set", (
+        ("f/1.8", 0x11), ("f/2.0", 0x10), ("f/2.4", 0x0F), ("f/2.8", 0x0E), ("f/3.4", 0x0D), ("f/4.0", 0x0C),
+        ("f/4.8", 0x0B), ("f/5.6", 0x0A), ("f/6.8", 0x09), ("f/8.0", 0x08), ("f/9.6", 0x07), ("f/11.0", 0x06),
+        ("f/14.0", 0x05), ("Closed", 0x00),
+    )),
+    "shutter": Setting("shutter", "shutter set", (
+        ("1/250 | 1/215", 0x0B), ("1/180 | 1/150", 0x0A), ("1/125 | 1/120", 0x09), ("1/100 | 1/100", 0x08),
+        ("1/90 | 1/75", 0x07), ("1/60 | 1/50", 0x06), ("1/30 | 1/25", 0x05),
+    )),
+    "gain": Setting("gain", "gain set", (
+        ("0dB", 0x01), ("3dB", 0x02), ("6dB", 0x03), ("9dB", 0x04), ("12dB", 0x05), ("15dB", 0x06), ("18dB", 0x07),
+        ("21dB", 0x08), ("24dB", 0x09), ("27dB", 0x0A), ("30dB", 0x0B), ("33dB", 0x0C), ("36dB", 0x0D),
+        ("39dB", 0x0E), ("43dB", 0x0F),
+    )),
+    "ex_ae_comp": Setting("ex_ae_comp", "ex_ae_comp set", (
+        ("-10.5dB", 0x00), ("-9dB", 0x01), ("-7.5dB", 0x02), ("-6dB", 0x03), ("-4.5dB", 0x04), ("-3dB", 0x05),
+        ("-1.5dB", 0x06), ("0dB", 0x07), ("+1.5dB", 0x08), ("+3dB", 0x09), ("+4.5dB", 0x0A), ("+6dB", 0x0B),
+        ("+7.5dB", 0x0C), ("+9dB", 0x0D), ("+10.5dB", 0x0E),
+    )),
+}
@@ -0,0 +1,256 @@
+"""Finding cameras: the Sony discovery broadcast, and concurrent VISCA-over-IP probes of a subnet.
+
+    python3 -m ptz discover 192.168.0.0/24
+
+Both run on asyncio and stream their results as they come in, ``scan`` wraps them for callers
+that aren't async (the UI runs it on a thread). A probe is a VISCA device type inquiry
+(``81 09 00 02 FF``); anything that answers it, even with an error, speaks VISCA-over-IP.
+"""
+import asyncio
+import collections
+import ipaddress
+import socket
+import time
+
+from .commands import commands
+from .protocol import COMPLETION, HEADER, VISCA_COMMAND, parse_reply
+
+DISCOVERY_PORT = 52380
+# STX "ENQ:network" FF ETX, answered by every Sony camera on the segment
+ENQUIRY = b"\x02ENQ:network\xff\x03"
+VENDORS = {0x0020: "Sony"}
+
+
+class Found:
+    """A camera that answered a probe or the discovery broadcast.
+
+    ``info`` holds the broadcast reply's fields (``MAC``, ``MODEL``, ``NAME``, ``IPADR``...), the
+    device type fields come from a probe's completion.
+    """
+    __slots__ = ("address", "port", "how", "rtt", "vendor", "model", "rom", "info")
+
+    def __init__(self, address, port, how, rtt=None):
+        self.address = address
+        self.port = port
+        self.how = how
+        self.rtt = rtt
+        self.vendor = None
+        self.model = None
+        self.rom = None
+        self.info = dict()
+
+    def __repr__(self):
+        details = []
+        if self.vendor is not None:
+            details.append("%s model %04X rom %04X" % (VENDORS.get(self.vendor, "vendor %04X" % self.vendor),
+                                                       self.model, self.rom))
+        for field in ("MODEL", "NAME", "MAC"):
+            if field in self.info:
+                details.append("%s %s" % (field.lower(), self.info[field]))
+        if self.rtt is not None:
+            details.append("%.1f ms" % (self.rtt * 1000))
+        return "%s:%d (%s) %s" % (self.address, self.port, self.how, ", ".join(details))
+
+
+def parse_enquiry_reply(datagram):
+    """The ``KEY:value`` fields between STX and ETX of a discovery reply, or None for anything else."""
+    if len(datagram) < 3 or datagram[0] != 0x02 or datagram[-1] != 0x03:
+        return None
+
+    info = dict()
+    for field in datagram[1:-1].split(b"\xff"):
+        key, separator, value = field.partition(b":")
+        if separator:
+            info[key.decode("ascii", "replace")] = value.decode("ascii", "replace")
+
+    if "ENQ" in info:
+        # Our own broadcast, looped back
+        return None
+    return info
+
+
+class Listener(asyncio.DatagramProtocol):
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait((data, addr, time.perf_counter()))
+
+    def error_received(self, exc):
+        pass
+
+
+async def probe(hosts, port=52381, parallel=256, timeout=0.25, local_port=0, bind_address="0.0.0.0"):
+    """Sends a device type inquiry to each of ``hosts`` and yields a Found for each one that answers.
+
+    No more than ``parallel`` probes are outstanding at once, each gets ``timeout`` seconds and a
+    new one goes out as soon as one is answered or given up on. They all share one socket, so a
+    /24 takes a single ``timeout``.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    transport, _ = await loop.create_datagram_endpoint(lambda: Listener(queue),
+                                                       local_addr=(bind_address, local_port))
+    inquiry = commands["device type inquiry"].get_command()
+    datagram = HEADER.pack(VISCA_COMMAND, len(inquiry), 1) + inquiry
+
+    hosts = iter(hosts)
+    # (address, port) -> sent at, oldest first
+    outstanding = collections.OrderedDict()
+    try:
+        while True:
+            while len(outstanding) < parallel:
+                host = next(hosts, None)
+                if host is None:
+                    break
+                target = (str(host), port)
+                outstanding[target] = time.perf_counter()
+                transport.sendto(datagram, target)
+            if not outstanding:
+                return
+
+            received = None
+            remaining = next(iter(outstanding.values())) + timeout - time.perf_counter()
+            if not queue.empty():
+                received = queue.get_nowait()
+            elif remaining > 0:
+                try:
+                    received = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            if received is not None:
+                data, source, received_at = received
+                reply = parse_reply(data)
+                if reply is not None and source[:2] in outstanding:
+                    found = Found(source[0], source[1], "probe", received_at - outstanding.pop(source[:2]))
+                    if reply.kind == COMPLETION and len(reply.data) >= 6:
+                        found.vendor = (reply.data[0] << 8) | reply.data[1]
+                        found.model = (reply.data[2] << 8) | reply.data[3]
+                        found.rom = (reply.data[4] << 8) | reply.data[5]
+                    yield found
+
+            now = time.perf_counter()
+            while outstanding and now - next(iter(outstanding.values())) >= timeout:
+                outstanding.popitem(last=False)
+    finally:
+        transport.close()
+
+
+async def broadcast(address="<broadcast>", port=DISCOVERY_PORT, wait=0.5, local_port=DISCOVERY_PORT,
+                    bind_address="0.0.0.0"):
+    """Sends the Sony discovery enquiry to ``address`` and yields a Found per reply for ``wait`` seconds.
+
+    Cameras may answer by broadcast to the discovery port, which is why that's bound (shared) by
+    default.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind((bind_address, local_port))
+        transport, _ = await loop.create_datagram_endpoint(lambda: Listener(queue), sock=sock)
+    except BaseException:
+        # The transport owns the socket once it exists, until then it's ours to close
+        sock.close()
+        raise
+
+    seen = set()
+    try:
+        sent_at = time.perf_counter()
+        transport.sendto(ENQUIRY, (address, port))
+        deadline = sent_at + wait
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            try:
+                data, source, received_at = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+            info = parse_enquiry_reply(data)
+            if info is None:
+                continue
+            # Replies broadcast by the camera come from its own address, IPADR says the same
+            found_address = info.get("IPADR") or source[0]
+            if found_address in seen:
+                continue
+            seen.add(found_address)
+            found = Found(found_address, 52381, "broadcast", received_at - sent_at)
+            found.info = info
+            yield found
+    finally:
+        transport.close()
+
+
+async def discover(network=None, broadcast_address="<broadcast>", port=52381, parallel=256, timeout=0.25,
+                   wait=0.5, local_port=0):
+    """Runs the broadcast and the probe of ``network`` (an ip_network or a string like "10.0.0.0/24")
+    together, yielding each camera the first time either finds it."""
+    queue = asyncio.Queue()
+
+    async def pump(results):
+        try:
+            async for found in results:
+                await queue.put(found)
+        except OSError:
+            # No broadcast route, port taken... the other search may still turn something up
+            pass
+        finally:
+            await queue.put(None)
+
+    searches = []
+    if broadcast_address is not None:
+        searches.append(broadcast(broadcast_address, wait=wait))
+    if network is not None:
+        hosts = ipaddress.ip_network(network, strict=False).hosts()
+        searches.append(probe(hosts, port, parallel, timeout, local_port))
+
+    tasks = [asyncio.ensure_future(pump(search)) for search in searches]
+    seen = set()
+    running = len(tasks)
+    try:
+        while running:
+            found = await queue.get()
+            if found is None:
+                running -= 1
+            elif found.address not in seen:
+                seen.add(found.address)
+                yield found
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def scan(network=None, callback=None, **kwargs):
+    """``discover`` for synchronous callers: calls ``callback(found)`` as cameras turn up and returns
+    them all once the search is over."""
+
+    async def collect():
+        results = []
+        async for found in discover(network, **kwargs):
+            results.append(found)
+            if callback is not None:
+                callback(found)
+        return results
+
+    return asyncio.run(collect())
+
+
+def local_network(towards="192.168.0.100", prefix=24):
+    """The /``prefix`` around the local address used to reach ``towards``, None without a route."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting a UDP socket sends nothing, it only picks the route and the local address
+        sock.connect((towards, 52381))
+        address = sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    return ipaddress.ip_network("%s/%d" % (address, prefix), strict=False)
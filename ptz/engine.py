@@ -0,0 +1,311 @@
+"""An asyncio VISCA-over-IP engine that tracks every command to completion."""
+import asyncio
+import time
+
+from .commands import FOCUS, PAN_TILT, PRIORITY_STOP, ZOOM
+from .commands import commands as catalog
+from .metrics import Metrics
+from .protocol import (ACK, COMPLETION, CONTROL, CONTROL_COMMAND, ERROR, ERROR_MESSAGES, HEADER, VISCA_COMMAND,
+                       parse_reply)
+
+
+class ViscaError(Exception):
+    """The camera answered a command with a VISCA error reply (``90 6y EE FF``)."""
+
+    def __init__(self, code, name=None):
+        self.code = code
+        self.name = name
+        super(ViscaError, self).__init__("%s: %s (0x%02X)" % (name, ERROR_MESSAGES.get(code, "unknown error"), code))
+
+
+class ViscaTimeout(asyncio.TimeoutError):
+    """A command ran out of retransmissions waiting for its ACK, or never completed."""
+
+
+class CommandSuperseded(Exception):
+    """A stop went out on the command's axis while it was still waiting for a slot, so it was dropped
+    without being sent."""
+
+
+class PendingCommand:
+    """A datagram on the wire, waiting for the camera to ACK and complete it."""
+    __slots__ = ("name", "sequence_number", "datagram", "future", "attempts", "acked", "probes", "renumbers", "timer",
+                 "sent_at", "encode_time", "created_at")
+
+    def __init__(self, name, sequence_number, datagram, future):
+        self.name = name
+        self.sequence_number = sequence_number
+        self.datagram = datagram
+        self.future = future
+        self.attempts = 0
+        self.acked = False
+        # Retransmissions after the ACK, asking for a completion that may have been lost
+        self.probes = 0
+        # Times it went out again under a new sequence number, each starts the ACK retries afresh
+        self.renumbers = 0
+        self.timer = None
+        self.sent_at = 0.0
+        self.encode_time = 0.0
+        self.created_at = 0.0
+
+
+class ViscaProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, addr):
+        self.engine.reply_received(data)
+
+    def error_received(self, exc):
+        # ICMP port unreachable and friends, the ACK timeout takes care of the lost datagram.
+        pass
+
+
+class ViscaEngine:
+    """Pipelines VISCA-over-IP commands to one camera and tracks each one to completion.
+
+    Replies are matched to requests by sequence number. ``send`` resolves once the camera reports
+    completion, with the completion ``Reply`` (whose ``data`` holds inquiry results, if any), or
+    with the ``0F 01`` control reply when a lost completion can't be had again (see ``settle``).
+    A command that isn't ACKed within ``ack_timeout`` is retransmitted with the same sequence
+    number up to ``retries`` times, and so is one that was ACKed but hasn't completed within
+    ``completion_timeout``: the camera answers a retransmission with the replies it already sent
+    rather than running it again. No more than ``max_in_flight`` commands are outstanding at once,
+    matching the camera's command buffer.
+
+    A retransmission the camera answers with ``0F 01`` was overtaken by a newer command, the
+    original having been lost, so it goes out again under a new sequence number, up to ``retries``
+    times, and gets its ACK retries afresh. The engine doesn't reset the session by itself: a camera
+    that rejects everything has rebooted and wants ``reset``.
+    """
+
+    def __init__(self, address="192.168.0.100", port=52381, local_port=None, commands=None, max_in_flight=2,
+                 ack_timeout=0.2, completion_timeout=10.0, retries=3):
+        self.address = address
+        self.port = port
+        self.local_port = port if local_port is None else local_port
+        self.commands = catalog if commands is None else commands
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.completion_timeout = completion_timeout
+        self.retries = retries
+
+        self.current_sequence_number = 0
+        self.pending = dict()
+        self.metrics = Metrics(ack_timeout * (retries + 1), completion_timeout)
+        # Bumped by every stop on an axis, motion that was queued before the stop is never sent
+        self.generations = dict.fromkeys((PAN_TILT, ZOOM, FOCUS), 0)
+        self.loop = None
+        self.transport = None
+        self.slots = None
+        self.control_future = None
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: ViscaProtocol(self), local_addr=("0.0.0.0", self.local_port),
+            remote_addr=(self.address, self.port))
+        await self.reset()
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for pending in self.pending.values():
+            self.cancel_timer(pending)
+            if not pending.future.done():
+                pending.future.cancel()
+        self.pending.clear()
+
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def next_sequence_number(self):
+        self.current_sequence_number = (self.current_sequence_number + 1) & 0xFFFFFFFF
+        return self.current_sequence_number
+
+    async def reset(self, timeout=1.0):
+        """Sends the ``02 00`` reset control command and waits for the camera to acknowledge it.
+
+        Whatever is still outstanding fails, its sequence number means nothing to the camera afterwards.
+        """
+        for pending in list(self.pending.values()):
+            self.cancel_timer(pending)
+            if not pending.future.done():
+                pending.future.set_exception(ViscaTimeout("%s: the session was reset" % pending.name))
+        self.pending.clear()
+
+        # Numbered like Camera.reset's, the counter restarts either way
+        self.control_future = self.loop.create_future()
+        datagram = bytearray(HEADER.size + 1)
+        HEADER.pack_into(datagram, 0, CONTROL_COMMAND, 1, 1)
+        datagram[HEADER.size] = 0x01
+
+        for _ in range(self.retries + 1):
+            self.transport.sendto(datagram)
+            try:
+                await asyncio.wait_for(asyncio.shield(self.control_future), timeout)
+                break
+            except asyncio.TimeoutError:
+                continue
+        else:
+            raise ViscaTimeout("camera at %s didn't acknowledge the reset" % self.address)
+
+        self.current_sequence_number = 0
+
+    async def send(self, name, args=None):
+        """Sends ``commands[name]`` and waits for its completion, returning the completion reply.
+
+        Stop priority commands bypass the in-flight limit, and any motion on the same axis that's
+        still waiting for a slot raises CommandSuperseded instead of being sent.
+        """
+        command = self.commands[name]
+        axis = command.axis
+        if command.priority == PRIORITY_STOP:
+            if axis is not None:
+                self.generations[axis] += 1
+            return await self.transmit_and_wait(name, command, args)
+
+        generation = self.generations.get(axis)
+        async with self.slots:
+            if axis is not None and self.generations[axis] != generation:
+                raise CommandSuperseded(name)
+            return await self.transmit_and_wait(name, command, args)
+
+    async def transmit_and_wait(self, name, command, args):
+        created_at = time.perf_counter()
+        sequence_number = self.next_sequence_number()
+        datagram = bytearray(HEADER.size + command.size)
+        command.encode_into(datagram, HEADER.size, args)
+        HEADER.pack_into(datagram, 0, VISCA_COMMAND, command.size, sequence_number)
+
+        pending = PendingCommand(name, sequence_number, datagram, self.loop.create_future())
+        pending.created_at = created_at
+        pending.encode_time = time.perf_counter() - created_at
+        self.pending[sequence_number] = pending
+        self.transmit(pending)
+        try:
+            return await pending.future
+        finally:
+            self.cancel_timer(pending)
+            # It may have been renumbered, or its number gone to a newer command after a reset
+            if self.pending.get(pending.sequence_number) is pending:
+                del self.pending[pending.sequence_number]
+
+    def transmit(self, pending):
+        pending.attempts += 1
+        pending.sent_at = self.loop.time()
+        self.transport.sendto(pending.datagram)
+        sent_at = time.perf_counter()
+        if pending.attempts == 1:
+            self.metrics.sent(pending.name, pending.sequence_number, pending.encode_time, sent_at - pending.created_at,
+                              sent_at)
+        else:
+            self.metrics.retransmitted(pending.name, pending.sequence_number, sent_at)
+        pending.timer = self.loop.call_later(self.ack_timeout, self.ack_timed_out, pending)
+
+    def ack_timed_out(self, pending):
+        if pending.future.done():
+            return
+
+        if pending.attempts - pending.renumbers <= self.retries:
+            self.transmit(pending)
+        else:
+            self.metrics.timed_out(pending.sequence_number)
+            pending.future.set_exception(
+                ViscaTimeout("%s: no ACK after %d attempts" % (pending.name, pending.attempts)))
+
+    def completion_timed_out(self, pending):
+        if pending.future.done():
+            return
+
+        if pending.probes < self.retries:
+            # The completion may just have been lost, the camera repeats it for the same sequence number
+            pending.probes += 1
+            self.transport.sendto(pending.datagram)
+            self.metrics.retransmitted(pending.name, pending.sequence_number, time.perf_counter())
+            pending.timer = self.loop.call_later(self.ack_timeout, self.completion_timed_out, pending)
+        else:
+            self.metrics.timed_out(pending.sequence_number)
+            pending.future.set_exception(ViscaTimeout("%s: ACKed but never completed" % pending.name))
+
+    def settle(self, pending, reply):
+        """Settles a command whose completion was lost and can't be had again: the camera answered a
+        probe with ``0F 01`` (``reply``), it has moved on too far to remember the command. It was
+        ACKed long ago, so it ran; an inquiry, whose answer is what matters, is asked again."""
+        self.cancel_timer(pending)
+        if pending.datagram[HEADER.size + 1] != 0x09:
+            pending.future.set_result(reply)
+            return
+
+        pending.acked = False
+        pending.probes = 0
+        self.renumber(pending)
+
+    def renumber(self, pending):
+        """Sends ``pending`` again under a new sequence number, the camera rejects its old one."""
+        self.cancel_timer(pending)
+        del self.pending[pending.sequence_number]
+        sequence_number, pending.sequence_number = pending.sequence_number, self.next_sequence_number()
+        HEADER.pack_into(pending.datagram, 0, VISCA_COMMAND, len(pending.datagram) - HEADER.size,
+                         pending.sequence_number)
+        self.pending[pending.sequence_number] = pending
+        self.metrics.renumbered(sequence_number, pending.sequence_number)
+        pending.renumbers += 1
+        self.transmit(pending)
+
+    @staticmethod
+    def cancel_timer(pending):
+        if pending.timer is not None:
+            pending.timer.cancel()
+            pending.timer = None
+
+    def reply_received(self, data):
+        reply = parse_reply(data)
+        if reply is None:
+            return
+
+        self.metrics.reply_received(reply)
+        if reply.kind == CONTROL:
+            rejected = self.pending.get(reply.sequence_number)
+            if reply.error == 0x01 and rejected is not None and not rejected.future.done():
+                if rejected.acked:
+                    self.settle(rejected, reply)
+                elif rejected.renumbers < self.retries:
+                    # The first transmission was lost and a newer command got to the camera ahead of this one
+                    self.renumber(rejected)
+                else:
+                    self.cancel_timer(rejected)
+                    self.metrics.timed_out(rejected.sequence_number)
+                    rejected.future.set_exception(
+                        ViscaTimeout("%s: sequence error after %d renumbers" % (rejected.name, rejected.renumbers)))
+            elif reply.error != 0x01 and self.control_future is not None and not self.control_future.done():
+                self.control_future.set_result(reply)
+            return
+
+        pending = self.pending.get(reply.sequence_number)
+        if pending is None or pending.future.done():
+            return
+
+        kind = reply.kind
+        if kind == ACK:
+            pending.acked = True
+            self.cancel_timer(pending)
+            pending.timer = self.loop.call_later(self.completion_timeout, self.completion_timed_out, pending)
+        elif kind == COMPLETION:
+            pending.future.set_result(reply)
+        elif kind == ERROR:
+            code = reply.error
+            self.cancel_timer(pending)
+            if code == 0x03 and pending.attempts <= self.retries:
+                # Command buffer full, give the camera an ACK timeout's worth of time and try again
+                pending.timer = self.loop.call_later(self.ack_timeout, self.transmit, pending)
+            else:
+                pending.future.set_exception(ViscaError(code, pending.name))
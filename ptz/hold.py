@@ -0,0 +1,127 @@
+"""Press-and-hold motion: a move when a control goes down, its stop when it comes back up.
+
+Held keys auto-repeat, 30 or so presses a second that would each send the same ``move``; a
+repeat of what an axis is already doing only pushes its watchdog deadline back. If the release
+never arrives (focus moved to another window, a dropped event, a UI that stopped responding),
+the watchdog stops the axis once ``timeout`` passes without a press or ``refresh``.
+"""
+import threading
+import time
+
+from .scheduler import MotionScheduler
+
+
+class Hold:
+    """An axis being held: the command it's running, who holds it and when it's stopped unless refreshed."""
+    __slots__ = ("name", "args", "source", "deadline")
+
+    def __init__(self, name, args, source, deadline):
+        self.name = name
+        self.args = args
+        self.source = source
+        self.deadline = deadline
+
+
+class HoldMotion:
+    """Turns presses and releases into one move and one stop per axis.
+
+    ``submit(name, args, axis)`` sends, e.g. by posting to a CommandWorker; it's called with the
+    lock held, so moves and stops reach it in the order they were decided. ``source`` identifies
+    what's holding the axis (a key, a button), a release only counts when it comes from whatever
+    made the hold. Keys prove they're still down by auto-repeating, anything that doesn't should
+    call ``refresh`` more often than every ``timeout`` seconds.
+    """
+
+    def __init__(self, submit, timeout=1.0):
+        self.submit = submit
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.holds = dict()  # axis -> Hold
+        self.stopping = False
+        self.thread = None
+
+        self.sent = 0
+        self.suppressed = 0
+        self.released = 0
+        self.expired = 0
+
+    def press(self, axis, name, args=None, source=None):
+        """Starts ``name`` on ``axis``, unless that's what the axis is already doing. Returns whether
+        anything was sent."""
+        with self.lock:
+            deadline = time.monotonic() + self.timeout
+            hold = self.holds.get(axis)
+            if hold is not None and hold.name == name and hold.args == args:
+                hold.deadline = deadline
+                hold.source = source
+                self.suppressed += 1
+                return False
+
+            self.holds[axis] = Hold(name, args, source, deadline)
+            self.sent += 1
+            self.submit(name, args, axis)
+            self.condition.notify()
+            return True
+
+    def refresh(self, axis, source=None):
+        """Keeps a hold going without sending anything."""
+        with self.lock:
+            hold = self.holds.get(axis)
+            if hold is not None and (source is None or hold.source == source):
+                hold.deadline = time.monotonic() + self.timeout
+
+    def release(self, axis, source=None):
+        """Stops ``axis`` if ``source`` (any source when None) is what holds it. Returns whether it did."""
+        with self.lock:
+            hold = self.holds.get(axis)
+            if hold is None or (source is not None and hold.source != source):
+                return False
+            del self.holds[axis]
+            self.released += 1
+            self.submit(MotionScheduler.stop_commands[axis], None, axis)
+            return True
+
+    def forget(self, *axes):
+        """Drops the holds on ``axes`` (every axis without any) without sending anything, for when the
+        axis has been stopped or given something else to do some other way."""
+        with self.lock:
+            for axis in axes or list(self.holds):
+                self.holds.pop(axis, None)
+
+    def held(self):
+        """{axis: (name, args, source)} of the axes being held."""
+        with self.lock:
+            return {axis: (hold.name, hold.args, hold.source) for axis, hold in self.holds.items()}
+
+    def stats(self):
+        with self.lock:
+            return {"sent": self.sent, "suppressed": self.suppressed, "released": self.released,
+                    "expired": self.expired}
+
+    def run(self):
+        with self.lock:
+            while not self.stopping:
+                now = time.monotonic()
+                for axis, hold in list(self.holds.items()):
+                    if hold.deadline <= now:
+                        # The release got lost, or whatever was holding stopped responding
+                        del self.holds[axis]
+                        self.expired += 1
+                        self.submit(MotionScheduler.stop_commands[axis], None, axis)
+
+                deadlines = [hold.deadline for hold in self.holds.values()]
+                self.condition.wait(min(deadlines) - now if deadlines else None)
+
+    def start(self):
+        """Runs the watchdog on a daemon thread."""
+        self.thread = threading.Thread(target=self.run, name="hold watchdog", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
@@ -0,0 +1,278 @@
+"""An append-only binary journal of every datagram sent to cameras, and timed replay of one.
+
+    PTZ_JOURNAL=show.ptzj python3 main.py 192.168.0.100
+    python3 -m ptz dump show.ptzj
+    python3 -m ptz --camera 127.0.0.2 replay show.ptzj --speed 4
+
+The file is a 16 byte header followed by fixed size 40 byte records, so the reader can mmap it
+and binary search by time without an index: a 24 byte record header (timestamp, camera address
+and port, payload type, sequence number, payload length) and the VISCA payload, zero padded to
+the 16 bytes a payload can take at most.
+"""
+import bisect
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+
+from .protocol import CONTROL_COMMAND, MAX_PAYLOAD
+
+MAGIC = b"PTZJ"
+VERSION = 1
+# magic, version, record size, wall clock time the file was created (ns since the epoch)
+FILE_HEADER = struct.Struct("<4sHHq")
+# timestamp (ns since the epoch), IPv4 address, port, payload type, sequence number, payload length
+RECORD_HEADER = struct.Struct("<q4sHHIB3x")
+RECORD_SIZE = RECORD_HEADER.size + MAX_PAYLOAD
+TIMESTAMP = struct.Struct("<q")
+
+
+class JournalWriter:
+    """Appends a record per datagram to ``path`` through a buffered file.
+
+    ``record`` packs into a preallocated buffer and hands it to the file's buffer, so it costs
+    a few microseconds and never touches the disk itself; the buffer is written out when it
+    fills or when ``flush_interval`` seconds have passed since the last flush, whichever comes
+    first. Timestamps are the wall clock at ``open`` plus the monotonic time since, so they never
+    go backwards within a file even if the clock is adjusted. Safe to share between cameras and
+    threads.
+    """
+
+    def __init__(self, path, flush_interval=1.0, buffer_size=1 << 16):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.record_buffer = bytearray(RECORD_SIZE)
+        self.padding = bytes(MAX_PAYLOAD)
+        # address -> packed IPv4 address
+        self.packed = dict()
+        self.records = 0
+
+        self.file = open(path, "ab", buffering=buffer_size)
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, RECORD_SIZE, time.time_ns()))
+        else:
+            check_header(path)
+            # A torn record at the end (the process died mid-write) would misalign everything after it
+            torn = (self.file.tell() - FILE_HEADER.size) % RECORD_SIZE
+            if torn:
+                self.file.truncate(self.file.tell() - torn)
+                self.file.seek(0, os.SEEK_END)
+
+        self.wall_clock = time.time_ns()
+        self.monotonic = time.perf_counter_ns()
+        self.last_flush = time.monotonic()
+
+    def record(self, address, port, payload_type, sequence_number, payload):
+        with self.lock:
+            if self.file is None:
+                return
+            packed = self.packed.get(address)
+            if packed is None:
+                packed = self.packed[address] = socket.inet_aton(address)
+
+            buffer = self.record_buffer
+            size = len(payload)
+            timestamp = self.wall_clock + time.perf_counter_ns() - self.monotonic
+            RECORD_HEADER.pack_into(buffer, 0, timestamp, packed, port, payload_type, sequence_number, size)
+            buffer[RECORD_HEADER.size:RECORD_HEADER.size + size] = payload
+            buffer[RECORD_HEADER.size + size:] = self.padding[size:]
+            self.file.write(buffer)
+            self.records += 1
+
+            now = time.monotonic()
+            if now - self.last_flush > self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def check_header(path):
+    """Returns the creation time from the header of the journal at ``path``, ValueError if it isn't one."""
+    with open(path, "rb") as journal:
+        header = journal.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise ValueError("%s: not a journal, too short" % path)
+    magic, version, record_size, created = FILE_HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError("%s: not a version %d journal" % (path, VERSION))
+    return created
+
+
+class Entry:
+    """One journal record."""
+    __slots__ = ("timestamp", "address", "port", "payload_type", "sequence_number", "payload")
+
+    def __init__(self, timestamp, address, port, payload_type, sequence_number, payload):
+        self.timestamp = timestamp
+        self.address = address
+        self.port = port
+        self.payload_type = payload_type
+        self.sequence_number = sequence_number
+        self.payload = payload
+
+    def __repr__(self):
+        seconds, nanoseconds = divmod(self.timestamp, 1000000000)
+        clock = time.strftime("%H:%M:%S", time.localtime(seconds))
+        return "%s.%06d %s:%d %04X %10d %s" % (clock, nanoseconds // 1000, self.address, self.port,
+                                                self.payload_type, self.sequence_number, self.payload.hex(" "))
+
+
+class Timestamps:
+    """The records' timestamps as a read-only sequence, what ``bisect`` searches."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, index):
+        return TIMESTAMP.unpack_from(self.reader.map, FILE_HEADER.size + index * RECORD_SIZE)[0]
+
+
+class JournalReader:
+    """A journal mapped into memory. Records are read on demand, so opening a large file is instant.
+
+    A record still being written by a live JournalWriter is left out until it's complete; ``refresh``
+    maps whatever has been flushed since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.created = check_header(path)
+        self.file = open(path, "rb")
+        self.map = None
+        self.count = 0
+        self.refresh()
+
+    def refresh(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        self.count = (size - FILE_HEADER.size) // RECORD_SIZE
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("journal record out of range")
+        offset = FILE_HEADER.size + index * RECORD_SIZE
+        timestamp, address, port, payload_type, sequence_number, size = RECORD_HEADER.unpack_from(self.map, offset)
+        offset += RECORD_HEADER.size
+        return Entry(timestamp, socket.inet_ntoa(address), port, payload_type, sequence_number,
+                     self.map[offset:offset + size])
+
+    def __iter__(self):
+        return self.entries()
+
+    def seek(self, timestamp):
+        """The index of the first record at or after ``timestamp`` (ns since the epoch)."""
+        return bisect.bisect_left(Timestamps(self), timestamp)
+
+    def start(self):
+        """Timestamp of the first record, or of the file's creation when it has none."""
+        return self[0].timestamp if self.count else self.created
+
+    def entries(self, start=None, end=None, address=None):
+        """Records from ``start`` up to ``end`` (seconds into the journal, both optional), optionally
+        only those sent to ``address``."""
+        first = 0 if start is None else self.seek(self.start() + int(start * 1e9))
+        last = self.count if end is None else self.seek(self.start() + int(end * 1e9))
+        for index in range(first, last):
+            entry = self[index]
+            if address is None or entry.address == address:
+                yield entry
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class Replay:
+    """Re-sends journal entries to cameras with the timing they were recorded with.
+
+    ``target`` is a Camera, which gets every entry whatever camera it was recorded for (e.g. a
+    local simulator), or a CameraPool, which gets each entry sent to the pooled camera with the
+    recorded address, skipping cameras it doesn't have. Sequence numbers are the target camera's
+    own. ``speed`` 2 plays twice as fast. Every send is scheduled from the start of the replay
+    rather than from the previous one, so a late send (a slow wakeup) doesn't push the rest back.
+    """
+
+    def __init__(self, entries, target, speed=1.0):
+        self.entries = entries
+        self.target = target
+        self.speed = speed
+        self.stopping = threading.Event()
+        self.sent = 0
+        self.skipped = 0
+        self.worst_lateness = 0.0
+        self.thread = None
+
+    def camera_for(self, entry):
+        cameras = getattr(self.target, "cameras", None)
+        if cameras is None:
+            return self.target
+        return cameras.get((entry.address, entry.port))
+
+    def send(self, camera, entry):
+        if entry.payload_type != CONTROL_COMMAND:
+            camera.send_command(entry.payload, entry.payload_type)
+        elif entry.payload == b"\x01":
+            # The reset also restarts the target's sequence numbers
+            camera.reset()
+        else:
+            camera.send_control_command(entry.payload)
+
+    def run(self):
+        """Plays the entries, returns False when stopped before the end."""
+        started = first = None
+        for entry in self.entries:
+            if first is None:
+                started, first = time.perf_counter(), entry.timestamp
+            due = started + (entry.timestamp - first) / 1e9 / self.speed
+            remaining = due - time.perf_counter()
+            if remaining > 0 and self.stopping.wait(remaining):
+                return False
+            if self.stopping.is_set():
+                return False
+
+            camera = self.camera_for(entry)
+            if camera is None:
+                self.skipped += 1
+                continue
+            self.send(camera, entry)
+            self.sent += 1
+            self.worst_lateness = max(self.worst_lateness, time.perf_counter() - due)
+
+        return True
+
+    def start(self):
+        """Runs the replay on a daemon thread."""
+        self.thread = threading.Thread(target=self.run, name="journal replay", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(1.0)
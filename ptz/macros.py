@@ -0,0 +1,291 @@
+"""Macros: timed sequences of catalog commands, run by a scheduler that keeps many going at once.
+
+A macro file is JSON, macro name -> macro::
+
+    {
+        "sweep left": {
+            "key": "Ctrl+1",
+            "camera": "192.168.0.100",
+            "steps": [
+                {"send": "move", "args": {"direction": "left", "speed": 0.3}},
+                {"delay": 2.5},
+                {"send": "stop"},
+                {"send": "zoom tele std"},
+                {"send": "recall preset x", "args": 4, "wait": "completion", "timeout": 5}
+            ]
+        }
+    }
+
+``key`` and ``camera`` are optional, without a camera the macro runs on whichever is selected
+when it starts, and a step can name its own ``camera`` too. A camera is the pool's at that
+address, ``port`` tells apart several on one address. ``args`` are the command's arguments
+as ``Camera.send`` takes them, with a ``direction`` from DIRECTIONS standing in for the ``move``
+postfix.
+"""
+import heapq
+import json
+import threading
+import time
+
+from .commands import DIRECTIONS, commands
+from .protocol import COMPLETION, ERROR
+from .scheduler import LatencyStats, MotionScheduler
+
+
+class Step:
+    """A ``delay`` in seconds, or a command to send and maybe wait for the completion of."""
+    __slots__ = ("name", "args", "delay", "wait", "timeout", "camera")
+
+    def __init__(self, name=None, args=None, delay=0.0, wait=False, timeout=10.0, camera=None):
+        self.name = name
+        self.args = args
+        self.delay = delay
+        self.wait = wait
+        self.timeout = timeout
+        self.camera = camera
+
+
+class Macro:
+
+    def __init__(self, name, steps, key=None, camera=None, port=None):
+        self.name = name
+        self.steps = steps
+        self.key = key
+        self.camera = camera
+        self.port = port
+
+    def duration(self):
+        """The sum of the delays, what the macro takes without waits for completion."""
+        return sum(step.delay for step in self.steps)
+
+
+def parse_step(macro, number, definition):
+    where = "macro %r step %d" % (macro, number)
+    if "delay" in definition:
+        delay = float(definition["delay"])
+        if delay < 0:
+            raise ValueError("%s: negative delay" % where)
+        return Step(delay=delay)
+
+    name = definition.get("send")
+    if name not in commands:
+        raise ValueError("%s: unknown command %r" % (where, name))
+
+    args = definition.get("args")
+    if isinstance(args, dict) and "direction" in args:
+        args = dict(args)
+        direction = args.pop("direction")
+        if direction not in DIRECTIONS:
+            raise ValueError("%s: unknown direction %r" % (where, direction))
+        args["postfix"] = DIRECTIONS[direction]
+
+    wait = definition.get("wait")
+    if wait not in (None, "completion"):
+        raise ValueError("%s: can only wait for the completion, not %r" % (where, wait))
+    return Step(name, args, wait=wait is not None, timeout=float(definition.get("timeout", 10.0)),
+                camera=definition.get("camera"))
+
+
+def load_macros(path):
+    """Reads a macro file into ``{name: Macro}``, ValueError naming the step for anything invalid."""
+    with open(path) as file:
+        definitions = json.load(file)
+
+    macros = dict()
+    for name, definition in definitions.items():
+        steps = [parse_step(name, number, step) for number, step in enumerate(definition.get("steps", ()), 1)]
+        macros[name] = Macro(name, steps, definition.get("key"), definition.get("camera"), definition.get("port"))
+    return macros
+
+
+class MacroRun:
+    """One macro running, on the camera it started with.
+
+    ``due`` is when the next step should run on the macro's own timeline: delays add to it rather
+    than to the time the previous step actually ran, so lateness doesn't accumulate. A completion
+    restarts the timeline from when it arrived, a wait timing out ends the run with an error.
+    """
+
+    def __init__(self, macro, camera):
+        self.macro = macro
+        self.camera = camera
+        self.index = 0
+        self.due = 0.0
+        # Bumped whenever the run is rescheduled, so stale heap entries can be told apart
+        self.generation = 0
+        # (camera, sequence number) of the command being waited for
+        self.waiting = None
+        # Cameras and axes moved, stopped if the run is cancelled
+        self.moved = set()
+        self.lateness = LatencyStats()
+        self.error = None
+        self.cancelled = False
+        # Whether cancelling stops the axes it moved
+        self.stop = True
+        self.finished = threading.Event()
+
+
+class MacroScheduler:
+    """Runs macros against a Camera or a CameraPool, all of them from one thread.
+
+    Every run's next step sits in one heap ordered by when it's due, the thread sleeps until the
+    earliest and runs whatever is due then, so a hundred macros cost no more threads than one.
+    Steps run within a wakeup's latency (well under a millisecond on Linux) of their due time, each
+    run's lateness is kept in its ``lateness``. ``done(run)`` is called on the scheduler thread
+    when a run ends, finished, failed or cancelled.
+    """
+
+    def __init__(self, cameras, done=None):
+        self.cameras = cameras
+        self.done = done
+        # Reentrant, so ``done`` may start the next macro
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        # (due, order, run, generation)
+        self.timers = []
+        self.order = 0
+        self.runs = []
+        self.waiting = dict()  # (camera, sequence number) -> run
+        self.subscribed = set()
+        self.stopping = False
+        self.thread = None
+
+    def camera_for(self, address, port=None):
+        """The pool's camera at ``address``, on ``port`` if given, or the active one without an address."""
+        pool = getattr(self.cameras, "cameras", None)
+        if pool is None:
+            return self.cameras
+        if address is None:
+            return self.cameras.active
+        if port is not None:
+            return pool.get((address, port))
+        return next((camera for (found, port), camera in pool.items() if found == address), None)
+
+    def subscribe(self, camera):
+        if camera not in self.subscribed:
+            self.subscribed.add(camera)
+            camera.subscribe(lambda reply, camera=camera: self.reply_received(camera, reply))
+
+    def schedule(self, run, due):
+        run.generation += 1
+        run.due = due
+        self.order += 1
+        heapq.heappush(self.timers, (due, self.order, run, run.generation))
+        self.condition.notify()
+
+    def start_macro(self, macro, camera=None):
+        """Starts ``macro`` now, on ``camera`` (an address) or the macro's own, returns its MacroRun."""
+        with self.lock:
+            run = MacroRun(macro, self.camera_for(camera) if camera else self.camera_for(macro.camera, macro.port))
+            self.runs.append(run)
+            self.schedule(run, time.perf_counter())
+            return run
+
+    def running(self, macro=None):
+        with self.lock:
+            return [run for run in self.runs if macro is None or run.macro is macro]
+
+    def cancel(self, run, stop=True):
+        """Ends ``run`` and, with ``stop``, stops whatever motion it started. The scheduler thread does
+        the sending, so this is safe to call from a UI thread; wait on ``run.finished`` if it matters."""
+        with self.lock:
+            if run.finished.is_set() or run.cancelled:
+                return
+            run.cancelled = True
+            run.stop = stop
+            self.schedule(run, time.perf_counter())
+
+    def finish(self, run, error=None):
+        run.error = error
+        run.generation += 1
+        if run.waiting is not None:
+            self.waiting.pop(run.waiting, None)
+            run.waiting = None
+        self.runs.remove(run)
+        run.finished.set()
+        if self.done is not None:
+            self.done(run)
+
+    def reply_received(self, camera, reply):
+        if reply.kind != COMPLETION and reply.kind != ERROR:
+            return
+
+        with self.lock:
+            run = self.waiting.pop((camera, reply.sequence_number), None)
+            if run is None:
+                return
+            run.waiting = None
+            if reply.kind == ERROR:
+                self.finish(run, "%s failed with error 0x%02X" % (run.macro.steps[run.index - 1].name, reply.error))
+            else:
+                self.schedule(run, time.perf_counter())
+
+    def step(self, run, now):
+        """Runs ``run``'s steps from ``run.index`` until one has to wait."""
+        steps = run.macro.steps
+        while run.index < len(steps):
+            step = steps[run.index]
+            run.index += 1
+            if step.delay:
+                run.due += step.delay
+                if run.due > now:
+                    return self.schedule(run, run.due)
+                continue
+
+            camera = run.camera if step.camera is None else self.camera_for(step.camera)
+            if camera is None:
+                return self.finish(run, "no camera %s" % (step.camera or run.macro.camera))
+            axis = commands[step.name].axis
+            if axis is not None:
+                run.moved.add((camera, axis))
+
+            if step.wait:
+                # Registered before the completion can possibly arrive, the receive loop needs this lock
+                self.subscribe(camera)
+                sequence_number = camera.send(step.name, step.args)
+                run.waiting = (camera, sequence_number)
+                self.waiting[run.waiting] = run
+                run.lateness.record(time.perf_counter() - run.due)
+                return self.schedule(run, now + step.timeout)
+
+            camera.send(step.name, step.args)
+            run.lateness.record(time.perf_counter() - run.due)
+
+        self.finish(run)
+
+    def run(self):
+        timers = self.timers
+        with self.lock:
+            while not self.stopping:
+                now = time.perf_counter()
+                while timers and timers[0][0] <= now:
+                    _, _, run, generation = heapq.heappop(timers)
+                    if generation != run.generation or run.finished.is_set():
+                        continue
+                    if run.cancelled:
+                        for camera, axis in run.moved if run.stop else ():
+                            camera.send(MotionScheduler.stop_commands[axis])
+                        self.finish(run)
+                        continue
+                    if run.waiting is not None:
+                        self.finish(run, "no completion within %.1fs" % run.macro.steps[run.index - 1].timeout)
+                        continue
+                    try:
+                        self.step(run, now)
+                    except Exception as exception:
+                        self.finish(run, str(exception))
+
+                self.condition.wait(timers[0][0] - time.perf_counter() if timers else None)
+
+    def start(self):
+        """Runs the scheduler on a daemon thread."""
+        self.thread = threading.Thread(target=self.run, name="macro scheduler", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
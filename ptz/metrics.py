@@ -0,0 +1,361 @@
+"""Per-command timings and counters, and a small HTTP endpoint serving them.
+
+Every command name gets fixed-size histograms of encode time, time to the wire (from the call to
+``send`` until the datagram is handed to the socket, lock waits included), ACK RTT and completion
+RTT, plus counts of sends, errors, timeouts and retransmissions. Recording a sample is a bisect
+and an increment, nothing is allocated per command. Session recoveries (a reset and replay after a
+sequence error or a reboot) are counted by reason and timed as well.
+
+    curl http://127.0.0.1:9105/metrics        # Prometheus text format
+    curl http://127.0.0.1:9105/metrics.json
+"""
+import bisect
+import collections
+import json
+import threading
+import time
+
+from .protocol import ACK, COMPLETION, CONTROL, ERROR
+
+# Histogram bucket upper bounds in seconds: 1us to ~16s, four buckets per doubling
+BOUNDS = tuple(1e-6 * 2 ** (i / 4) for i in range(97))
+TIMINGS = ("encode", "wire", "ack", "completion")
+COUNTERS = ("sent", "acks", "completions", "errors", "timeouts", "retransmits")
+
+
+class Histogram:
+    """Counts per fixed bucket, with the exact count, sum and maximum alongside."""
+    __slots__ = ("counts", "count", "sum", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket holding the ``fraction`` quantile (capped at the maximum)."""
+        if not self.count:
+            return None
+
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BOUNDS[index], self.maximum) if index < len(BOUNDS) else self.maximum
+
+        return self.maximum
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.maximum
+        }
+
+
+class CommandMetrics:
+    __slots__ = TIMINGS + COUNTERS
+
+    def __init__(self):
+        for timing in TIMINGS:
+            setattr(self, timing, Histogram())
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+
+class Metrics:
+    """Timings and counters keyed by command name, for one camera.
+
+    Commands are followed from ``sent`` to their completion by sequence number. One that goes
+    ``ack_timeout`` without an ACK, or ``completion_timeout`` without completing, is counted as a
+    timeout the next time the metrics are read (or when more than ``limit`` are outstanding).
+    """
+
+    def __init__(self, ack_timeout=1.0, completion_timeout=10.0, limit=256):
+        self.ack_timeout = ack_timeout
+        self.completion_timeout = completion_timeout
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.commands = dict()
+        # sequence number -> [command metrics, last sent at, acked at]
+        self.in_flight = collections.OrderedDict()
+        self.recovery = Histogram()
+        self.recoveries = collections.Counter()
+        self.failed_recoveries = collections.Counter()
+
+    def command(self, name):
+        metrics = self.commands.get(name)
+        if metrics is None:
+            metrics = self.commands[name] = CommandMetrics()
+        return metrics
+
+    def sent(self, name, sequence_number, encode_time, wire_time, sent_at=None):
+        if sent_at is None:
+            sent_at = time.perf_counter()
+
+        with self.lock:
+            metrics = self.command(name)
+            metrics.sent += 1
+            metrics.encode.record(encode_time)
+            metrics.wire.record(wire_time)
+            self.in_flight[sequence_number] = [metrics, sent_at, None]
+            if len(self.in_flight) > self.limit:
+                # Nothing's answering, the oldest is as good as timed out
+                self.in_flight.popitem(last=False)[1][0].timeouts += 1
+
+    def retransmitted(self, name, sequence_number, sent_at=None):
+        """RTTs are timed from the latest transmission, which may follow an error (buffer full)."""
+        if sent_at is None:
+            sent_at = time.perf_counter()
+
+        with self.lock:
+            metrics = self.command(name)
+            metrics.retransmits += 1
+            self.in_flight[sequence_number] = [metrics, sent_at, None]
+
+    def renumbered(self, sequence_number, new_sequence_number):
+        """A command re-sent under a new sequence number, after a reset."""
+        with self.lock:
+            entry = self.in_flight.pop(sequence_number, None)
+            if entry is not None:
+                self.in_flight[new_sequence_number] = entry
+
+    def reset(self):
+        """Forgets the commands in flight, their sequence numbers start over with a session reset."""
+        with self.lock:
+            self.in_flight.clear()
+
+    def recovered(self, reason, seconds):
+        with self.lock:
+            self.recoveries[reason] += 1
+            self.recovery.record(seconds)
+
+    def recovery_failed(self, reason):
+        with self.lock:
+            self.failed_recoveries[reason] += 1
+
+    def session(self):
+        """Session recoveries by reason, failed ones by reason and the recovery time summary."""
+        with self.lock:
+            return {"recoveries": dict(self.recoveries), "failed": dict(self.failed_recoveries),
+                    "recovery time": self.recovery.summary()}
+
+    def timed_out(self, sequence_number):
+        with self.lock:
+            entry = self.in_flight.pop(sequence_number, None)
+            if entry is not None:
+                entry[0].timeouts += 1
+
+    def reply_received(self, reply, received_at=None):
+        kind = reply.kind
+        if kind == CONTROL:
+            return
+        if received_at is None:
+            received_at = time.perf_counter()
+
+        with self.lock:
+            entry = self.in_flight.get(reply.sequence_number)
+            if entry is None:
+                return
+
+            metrics, sent_at, acked_at = entry
+            if kind == ACK:
+                if acked_at is None:
+                    metrics.acks += 1
+                    metrics.ack.record(received_at - sent_at)
+                    entry[2] = received_at
+            elif kind == COMPLETION:
+                # Inquiries complete without an ACK
+                metrics.completions += 1
+                metrics.completion.record(received_at - sent_at)
+                del self.in_flight[reply.sequence_number]
+            elif kind == ERROR:
+                metrics.errors += 1
+                del self.in_flight[reply.sequence_number]
+
+    def expire(self, now=None):
+        """Counts and forgets the commands that have been waiting too long, call with the lock held."""
+        if now is None:
+            now = time.perf_counter()
+
+        expired = [sequence_number for sequence_number, (metrics, sent_at, acked_at) in self.in_flight.items()
+                   if (acked_at is None and now - sent_at > self.ack_timeout)
+                   or now - sent_at > self.completion_timeout]
+        for sequence_number in expired:
+            self.in_flight.pop(sequence_number)[0].timeouts += 1
+
+        while len(self.in_flight) > self.limit:
+            self.in_flight.popitem(last=False)[1][0].timeouts += 1
+
+    def snapshot(self):
+        """Per command name, the counters and a summary of each histogram."""
+        with self.lock:
+            self.expire()
+            snapshot = dict()
+            for name, metrics in self.commands.items():
+                entry = {counter: getattr(metrics, counter) for counter in COUNTERS}
+                for timing in TIMINGS:
+                    entry[timing] = getattr(metrics, timing).summary()
+                snapshot[name] = entry
+            return snapshot
+
+    def export(self):
+        """Per command name, the counters and copies of the raw histograms as (bucket counts, count, sum)."""
+        with self.lock:
+            self.expire()
+            export = dict()
+            for name, metrics in self.commands.items():
+                entry = {counter: getattr(metrics, counter) for counter in COUNTERS}
+                for timing in TIMINGS:
+                    histogram = getattr(metrics, timing)
+                    entry[timing] = (list(histogram.counts), histogram.count, histogram.sum)
+                export[name] = entry
+            session = {
+                "recoveries": dict(self.recoveries),
+                "failed": dict(self.failed_recoveries),
+                "recovery": (list(self.recovery.counts), self.recovery.count, self.recovery.sum),
+            }
+            return export, session
+
+
+def format_table(snapshot, session=None):
+    """A fixed width text table of a ``Metrics.snapshot()``, slowest completions first, followed by
+    a line about session recoveries if ``session`` (``Metrics.session()``) is given."""
+
+    def ms(summary, key):
+        return "%8.2f" % (summary[key] * 1000) if summary["count"] else "%8s" % "-"
+
+    lines = ["%-28s %6s %8s %8s %8s %8s %8s %5s %5s %5s" % (
+        "command", "sent", "enc p99", "wire p99", "ack p50", "ack p99", "cmp p99", "err", "t/o", "retx")]
+    rows = sorted(snapshot.items(), key=lambda item: item[1]["completion"].get("p99") or 0, reverse=True)
+    for name, entry in rows:
+        lines.append("%-28s %6d %s %s %s %s %s %5d %5d %5d" % (
+            name[:28], entry["sent"], ms(entry["encode"], "p99"), ms(entry["wire"], "p99"),
+            ms(entry["ack"], "p50"), ms(entry["ack"], "p99"), ms(entry["completion"], "p99"),
+            entry["errors"], entry["timeouts"], entry["retransmits"]))
+
+    if session is not None:
+        recovery_time = session["recovery time"]
+        lines.append("")
+        lines.append("session recoveries: %s, failed: %s, recovery time p99 %s ms" % (
+            ", ".join("%s %d" % item for item in sorted(session["recoveries"].items())) or "none",
+            ", ".join("%s %d" % item for item in sorted(session["failed"].items())) or "none",
+            ms(recovery_time, "p99").strip()))
+    return "\n".join(lines)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def histogram_lines(lines, metric, labels, histogram):
+    buckets, count, total = histogram
+    cumulative = 0
+    for bound, bucket in zip(BOUNDS, buckets):
+        cumulative += bucket
+        if bucket:
+            lines.append('%s_bucket{%s,le="%.9g"} %d' % (metric, labels, bound, cumulative))
+    lines.append('%s_bucket{%s,le="+Inf"} %d' % (metric, labels, count))
+    lines.append("%s_sum{%s} %.9g" % (metric, labels, total))
+    lines.append("%s_count{%s} %d" % (metric, labels, count))
+
+
+def render_text(sources):
+    """Prometheus text exposition of ``{camera label: Metrics}``."""
+    exports = []
+    sessions = []
+    for camera, metrics in sources.items():
+        commands, session = metrics.export()
+        for name, entry in commands.items():
+            labels = 'camera="%s",command="%s"' % (escape_label(camera), escape_label(name))
+            exports.append((labels, entry))
+        sessions.append(('camera="%s"' % escape_label(camera), session))
+
+    lines = []
+    for counter in COUNTERS:
+        lines.append("# TYPE ptz_command_%s_total counter" % counter)
+        for labels, entry in exports:
+            lines.append("ptz_command_%s_total{%s} %d" % (counter, labels, entry[counter]))
+
+    for timing in TIMINGS:
+        lines.append("# TYPE ptz_command_%s_seconds histogram" % timing)
+        for labels, entry in exports:
+            histogram_lines(lines, "ptz_command_%s_seconds" % timing, labels, entry[timing])
+
+    for counter in ("recoveries", "failed"):
+        lines.append("# TYPE ptz_session_%s_total counter" % counter)
+        for labels, session in sessions:
+            for reason, count in session[counter].items():
+                lines.append('ptz_session_%s_total{%s,reason="%s"} %d' % (counter, labels, escape_label(reason), count))
+    lines.append("# TYPE ptz_session_recovery_seconds histogram")
+    for labels, session in sessions:
+        histogram_lines(lines, "ptz_session_recovery_seconds", labels, session["recovery"])
+
+    return "\n".join(lines) + "\n"
+
+
+def render_json(sources):
+    return json.dumps({camera: {"commands": metrics.snapshot(), "session": metrics.session()}
+                       for camera, metrics in sources.items()}, indent=1)
+
+
+class MetricsServer:
+    """Serves ``sources()`` (a callable returning ``{camera label: Metrics}``) over HTTP.
+
+    ``/metrics`` is Prometheus text, ``/metrics.json`` the snapshots as JSON. Binds to localhost
+    unless told otherwise, there's no authentication.
+    """
+
+    def __init__(self, sources, address="127.0.0.1", port=9105):
+        # Imported here, every Camera imports this module and http.server adds tens of milliseconds to start-up
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body, content_type = render_text(sources()), "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body, content_type = render_json(sources()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.address, self.port = self.server.server_address[:2]
+
+    def start(self):
+        """Serves on a daemon thread."""
+        thread = threading.Thread(target=self.server.serve_forever, name="metrics server", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
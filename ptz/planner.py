@@ -0,0 +1,209 @@
+"""Planned moves: per-axis speeds so pan, tilt and zoom arrive together, and eased moves.
+
+    plan = plan_move(current_pose(camera), {"pan": 0x0800, "tilt": 0x0100, "zoom": 0x2000}, 3.0, "ease-in-out")
+    scheduler.start_macro(plan.macro())
+
+The camera only takes a speed byte per axis, so a plan picks the byte whose speed (from the
+axis' AxisModel) best fits what the move needs. A linear move is a single absolute pan/tilt
+command plus a variable zoom landed with zoom direct. An eased move is a profile of ``segments``
+continuous moves whose speeds follow the easing curve, finished with the absolute move that
+corrects whatever the speed quantisation left over. Segments quantising to the same speed
+bytes are merged, so a profile costs a handful of commands. Plans are timed lists of catalog
+commands, run through the MacroScheduler.
+"""
+import math
+
+from .commands import PAN_SPEEDS, TILT_SPEEDS, ZOOM_SPEEDS
+from .macros import Macro, Step
+
+# Position fraction covered at each time fraction
+EASINGS = {
+    "linear": lambda x: x,
+    "ease-in": lambda x: x * x,
+    "ease-out": lambda x: 1 - (1 - x) * (1 - x),
+    "ease-in-out": lambda x: x * x * (3 - 2 * x),
+}
+
+# Pan/tilt direction bytes of the "move" postfix, by the sign of the movement (positions grow to
+# the right and up)
+PAN_DIRECTIONS = {1: 0x02, -1: 0x01, 0: 0x03}
+TILT_DIRECTIONS = {1: 0x01, -1: 0x02, 0: 0x03}
+
+
+class AxisModel:
+    """How fast an axis moves at each speed byte, in position units per second.
+
+    Speeds grow geometrically from ``slowest`` (byte 1) to ``fastest``, which is how Sony's
+    tables go; the defaults below are rough figures for an SRG-300, calibrate for other heads.
+    """
+
+    def __init__(self, slowest, fastest, speeds):
+        self.velocities = [slowest * (fastest / slowest) ** (index / (speeds - 1)) for index in range(speeds)]
+
+    def byte_for(self, velocity):
+        """The speed byte closest to ``velocity`` (on a log scale), 0 when standing still is closer."""
+        if velocity < self.velocities[0] / 2:
+            return 0
+        return min(range(len(self.velocities)), key=lambda index: abs(math.log(self.velocities[index] / velocity))) + 1
+
+    def velocity(self, byte):
+        return self.velocities[byte - 1] if byte else 0.0
+
+    def fraction(self, byte):
+        """The 0 to 1 speed the command lambdas turn back into ``byte``."""
+        return (max(byte, 1) - 0.5) / (len(self.velocities) - 1)
+
+    def fastest(self):
+        return self.velocities[-1]
+
+
+# About 51 units a degree: pan 1.1 to 100 degrees/s, tilt 1.1 to 90, the zoom range in 20 to 2 s
+MODELS = {
+    "pan": AxisModel(56.0, 5120.0, PAN_SPEEDS),
+    "tilt": AxisModel(56.0, 4608.0, TILT_SPEEDS),
+    "zoom": AxisModel(819.0, 8192.0, ZOOM_SPEEDS),
+}
+
+
+class Plan:
+    """Catalog commands to send, as (seconds from the start, name, args) in time order, and when
+    each axis is predicted to arrive."""
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.commands = []
+        self.arrivals = dict()
+
+    def add(self, offset, name, args=None):
+        self.commands.append((offset, name, args))
+
+    def __len__(self):
+        return len(self.commands)
+
+    def macro(self, name="planned move"):
+        """The plan as a Macro, delays between the commands."""
+        steps = []
+        elapsed = 0.0
+        for offset, command, args in self.commands:
+            if offset > elapsed:
+                steps.append(Step(delay=offset - elapsed))
+                elapsed = offset
+            steps.append(Step(command, args))
+        return Macro(name, steps)
+
+
+def current_pose(camera):
+    """The pan, tilt, zoom and focus the camera last reported (the InquiryPoller keeps them fresh)."""
+    return {axis: camera.state.get(axis) for axis in ("pan", "tilt", "zoom", "focus")}
+
+
+def profile(distance, duration, easing, segments, model, tolerance=0.05):
+    """Speed bytes for each of ``segments`` equal slices of ``duration`` covering ``distance``.
+
+    Each slice aims for where the curve says the axis should be at its end, counting from where
+    the bytes chosen so far actually take it, so quantisation errors don't pile up. A slice keeps
+    the previous slice's byte while that stays within ``tolerance`` of the distance, which saves
+    the command a change would cost.
+    """
+    curve = EASINGS[easing]
+    slice_time = duration / segments
+    slack = abs(distance) * tolerance
+    travelled = 0.0
+    speeds = []
+    for index in range(1, segments + 1):
+        wanted = abs(distance) * curve(index / segments)
+        byte = speeds[-1] if speeds else 0
+        if abs(travelled + model.velocity(byte) * slice_time - wanted) > slack:
+            byte = model.byte_for(max(wanted - travelled, 0.0) / slice_time)
+        speeds.append(byte)
+        travelled += model.velocity(byte) * slice_time
+    return speeds
+
+
+def merged(speeds, slice_time):
+    """(offset, speeds) for every slice whose speeds differ from the slice before."""
+    changes = []
+    for index, value in enumerate(speeds):
+        if not changes or changes[-1][1] != value:
+            changes.append((index * slice_time, value))
+    return changes
+
+
+def plan_move(start, target, duration, easing="linear", segments=16, models=MODELS):
+    """Plans the move from pose ``start`` to pose ``target`` (dicts of pan, tilt, zoom and focus
+    positions, any left out of ``target`` stay put) so every axis arrives ``duration`` seconds in.
+
+    When an axis can't make it that fast the whole move is stretched to what the slowest allows,
+    so they still arrive together.
+    """
+    def delta(axis):
+        if target.get(axis) is None:
+            return 0
+        if start.get(axis) is None:
+            raise ValueError("no %s position reported yet" % axis)
+        return target[axis] - start[axis]
+
+    pan, tilt, zoom = delta("pan"), delta("tilt"), delta("zoom")
+    peak = 1.0 if easing == "linear" else max(
+        (EASINGS[easing]((index + 1) / 64) - EASINGS[easing](index / 64)) * 64 for index in range(64))
+    duration = max([duration] + [abs(distance) * peak / models[axis].fastest()
+                                 for axis, distance in (("pan", pan), ("tilt", tilt), ("zoom", zoom))])
+    plan = Plan(duration)
+
+    pan_model, tilt_model, zoom_model = models["pan"], models["tilt"], models["zoom"]
+    if easing == "linear":
+        pan_byte = max(1, pan_model.byte_for(abs(pan) / duration))
+        tilt_byte = max(1, tilt_model.byte_for(abs(tilt) / duration))
+        zoom_byte = zoom_model.byte_for(abs(zoom) / duration)
+        pan_speeds, tilt_speeds, zoom_speeds = [pan_byte], [tilt_byte], [zoom_byte]
+        slices = 1
+    else:
+        slices = segments
+        pan_speeds = profile(pan, duration, easing, segments, pan_model)
+        tilt_speeds = profile(tilt, duration, easing, segments, tilt_model)
+        zoom_speeds = profile(zoom, duration, easing, segments, zoom_model)
+    slice_time = duration / slices
+
+    if pan or tilt:
+        landing = {axis: start[axis] if target.get(axis) is None else target[axis] for axis in ("pan", "tilt")}
+        if easing == "linear":
+            plan.add(0.0, "pan absolute position", dict(landing, pan_speed=pan_model.fraction(pan_speeds[0]),
+                                                        tilt_speed=tilt_model.fraction(tilt_speeds[0])))
+        else:
+            for offset, (pan_byte, tilt_byte) in merged(list(zip(pan_speeds, tilt_speeds)), slice_time):
+                postfix = [PAN_DIRECTIONS[(pan > 0) - (pan < 0) if pan_byte else 0],
+                           TILT_DIRECTIONS[(tilt > 0) - (tilt < 0) if tilt_byte else 0], 0xFF]
+                if pan_byte or tilt_byte:
+                    plan.add(offset, "move", {"pan_speed": pan_model.fraction(pan_byte),
+                                              "tilt_speed": tilt_model.fraction(tilt_byte), "postfix": postfix})
+                elif offset:
+                    plan.add(offset, "stop")
+            # Lands exactly, at the speed the profile ends with
+            plan.add(duration, "pan absolute position", dict(
+                landing, pan_speed=pan_model.fraction(next((b for b in reversed(pan_speeds) if b), 1)),
+                tilt_speed=tilt_model.fraction(next((b for b in reversed(tilt_speeds) if b), 1))))
+        for axis, distance, model, speeds in (("pan", pan, pan_model, pan_speeds),
+                                              ("tilt", tilt, tilt_model, tilt_speeds)):
+            if distance:
+                plan.arrivals[axis] = abs(distance) / model.velocity(speeds[0]) if easing == "linear" else duration
+
+    if zoom:
+        name = "zoom tele var" if zoom > 0 else "zoom wide var"
+        for offset, zoom_byte in merged(zoom_speeds, slice_time):
+            if zoom_byte:
+                plan.add(offset, name, {"speed": zoom_model.fraction(zoom_byte)})
+            elif offset:
+                plan.add(offset, "zoom stop")
+        arrival = duration
+        if easing == "linear" and zoom_speeds[0]:
+            arrival = min(duration, abs(zoom) / zoom_model.velocity(zoom_speeds[0]))
+        # Zoom direct stops the variable zoom where it should be
+        plan.add(arrival, "zoom direct", target["zoom"])
+        plan.arrivals["zoom"] = arrival
+
+    if target.get("focus") is not None and target.get("focus") != start.get("focus"):
+        plan.add(0.0, "focus direct", target["focus"])
+        plan.arrivals["focus"] = 0.0
+
+    plan.commands.sort(key=lambda entry: entry[0])
+    return plan
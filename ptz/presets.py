@@ -0,0 +1,365 @@
+"""A host-side preset library: thousands of named shots per camera, beyond the 16 hardware slots.
+
+Shots live in an SQLite file, a row each with the position and the exposure/white balance
+settings packed into a few bytes, indexed by camera and name with a separate tag table. Nothing
+is read until it's asked for, so a library of any size opens instantly. Recalling a shot sends
+absolute position commands, or a single ``recall preset x`` when it's mirrored into a hardware
+slot: whenever a shot busy enough to deserve a slot is recalled the long way, it's stored into
+that slot once the camera gets there, so the next recall takes the fast path without ever
+moving the camera for the sake of it.
+"""
+import collections
+import sqlite3
+import struct
+import threading
+import time
+
+from .commands import SETTINGS
+from .protocol import COMPLETION, ERROR
+
+# Which of pan, tilt, zoom, focus are known, then the four positions
+POSITION = struct.Struct("<BhhHH")
+AXES = ("pan", "tilt", "zoom", "focus")
+# One byte per setting, in this order, 0xFF when unknown
+SETTING_KEYS = tuple(SETTINGS)
+UNKNOWN = 0xFF
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS presets (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    position BLOB NOT NULL,
+    settings BLOB NOT NULL,
+    recalls INTEGER NOT NULL DEFAULT 0,
+    recalled_at REAL,
+    UNIQUE (camera, name)
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL COLLATE NOCASE,
+    preset INTEGER NOT NULL REFERENCES presets (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, preset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_by_preset ON tags (preset);
+CREATE TABLE IF NOT EXISTS slots (
+    camera TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    preset INTEGER REFERENCES presets (id) ON DELETE SET NULL,
+    -- stored by hand with the preset buttons, never overwritten
+    reserved INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (camera, slot)
+) WITHOUT ROWID;
+"""
+
+
+def pack_position(pose):
+    mask = 0
+    values = []
+    for bit, axis in enumerate(AXES):
+        value = pose.get(axis)
+        if value is not None:
+            mask |= 1 << bit
+        values.append(value or 0)
+    return POSITION.pack(mask, *values)
+
+
+def unpack_position(blob):
+    mask, *values = POSITION.unpack(blob)
+    return {axis: value for bit, (axis, value) in enumerate(zip(AXES, values)) if mask & (1 << bit)}
+
+
+def pack_settings(settings):
+    return bytes(UNKNOWN if settings.get(key) is None else settings[key] for key in SETTING_KEYS)
+
+
+def unpack_settings(blob):
+    return {key: value for key, value in zip(SETTING_KEYS, blob) if value != UNKNOWN}
+
+
+class Shot:
+    """A stored preset: where the camera points and how it's exposed."""
+    __slots__ = ("id", "camera", "name", "position", "settings", "tags", "recalls", "slot")
+
+    def __init__(self, id, camera, name, position, settings, tags=(), recalls=0, slot=None):
+        self.id = id
+        self.camera = camera
+        self.name = name
+        self.position = position
+        self.settings = settings
+        self.tags = tags
+        self.recalls = recalls
+        self.slot = slot
+
+    def __repr__(self):
+        return "%s on %s%s" % (self.name, self.camera, " (slot %d)" % self.slot if self.slot is not None else "")
+
+
+class Recall:
+    """A recall under way: the commands still to send, those awaiting completion, and the slot the
+    shot is stored into once they've all completed (None to leave the slots alone). ``failed`` says
+    why it ended early, None if it didn't."""
+    __slots__ = ("shot", "slot", "queued", "outstanding", "failed", "timer", "done")
+
+    def __init__(self, shot, slot, queued, done=None):
+        self.shot = shot
+        self.slot = slot
+        self.queued = queued
+        self.outstanding = set()
+        self.failed = None
+        self.timer = None
+        # Called with the Recall once it's over, on the receive loop or the timer's thread
+        self.done = done
+
+
+class PresetLibrary:
+    """Named shots for any number of cameras, in the SQLite file at ``path``.
+
+    ``slots`` are the hardware preset slots the library may mirror shots into, ``timeout`` the
+    longest a recall waits for each completion before it fails. Safe to use from several threads;
+    recalls send through the camera passed in, so do those off the UI thread.
+    """
+
+    # Commands a camera buffers at once, more are rejected
+    buffer_size = 2
+
+    def __init__(self, path, slots=range(16), timeout=10.0):
+        self.path = path
+        self.slots = tuple(slots)
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        # camera -> its Recall under way, (camera, sequence number) -> the Recall that sent it
+        self.recalls = dict()
+        self.waiting = dict()
+        self.subscribed = set()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def shot(self, row):
+        id, camera, name, position, settings, recalls, slot = row
+        tags = tuple(tag for tag, in self.connection.execute("SELECT tag FROM tags WHERE preset = ? ORDER BY tag",
+                                                             (id,)))
+        return Shot(id, camera, name, unpack_position(position), unpack_settings(settings), tags, recalls, slot)
+
+    SELECT = ("SELECT p.id, p.camera, p.name, p.position, p.settings, p.recalls, s.slot FROM presets p "
+              "LEFT JOIN slots s ON s.preset = p.id AND s.camera = p.camera ")
+
+    def store(self, camera, name, position, settings=None, tags=()):
+        """Saves (or overwrites) the shot ``name`` of the camera at address ``camera``."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO presets (camera, name, position, settings) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (camera, name) DO UPDATE SET position = excluded.position, settings = excluded.settings",
+                (camera, name, pack_position(position), pack_settings(settings or dict())))
+            id, = self.connection.execute("SELECT id FROM presets WHERE camera = ? AND name = ?",
+                                          (camera, name)).fetchone()
+            self.connection.execute("DELETE FROM tags WHERE preset = ?", (id,))
+            self.connection.executemany("INSERT OR IGNORE INTO tags (tag, preset) VALUES (?, ?)",
+                                        ((tag, id) for tag in tags))
+            # Whatever a slot held for the old version of the shot is out of date
+            self.connection.execute("UPDATE slots SET preset = NULL WHERE preset = ?", (id,))
+            return id
+
+    def capture(self, camera, name, tags=()):
+        """Stores what ``camera`` (a Camera) last reported as the shot ``name``."""
+        state = camera.state
+        return self.store(camera.address, name, {axis: state.get(axis) for axis in AXES},
+                          {key: state.get(key) for key in SETTING_KEYS}, tags)
+
+    def get(self, camera, name):
+        with self.lock:
+            row = self.connection.execute(self.SELECT + "WHERE p.camera = ? AND p.name = ?", (camera, name)).fetchone()
+            return self.shot(row) if row is not None else None
+
+    def remove(self, camera, name):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM presets WHERE camera = ? AND name = ?", (camera, name))
+
+    def search(self, text="", tags=(), camera=None, limit=100):
+        """Shots whose name contains ``text`` and that carry all of ``tags``, busiest first."""
+        clauses, parameters = [], []
+        if camera is not None:
+            clauses.append("p.camera = ?")
+            parameters.append(camera)
+        if text:
+            clauses.append("p.name LIKE ? ESCAPE '\\'")
+            parameters.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        for tag in tags:
+            clauses.append("p.id IN (SELECT preset FROM tags WHERE tag = ?)")
+            parameters.append(tag)
+
+        query = self.SELECT + ("WHERE " + " AND ".join(clauses) if clauses else "")
+        query += " ORDER BY p.recalls DESC, p.name LIMIT ?"
+        with self.lock:
+            return [self.shot(row) for row in self.connection.execute(query, parameters + [limit]).fetchall()]
+
+    def tags(self, camera=None):
+        """{tag: number of shots}"""
+        query = "SELECT t.tag, COUNT(*) FROM tags t JOIN presets p ON p.id = t.preset "
+        parameters = ()
+        if camera is not None:
+            query += "WHERE p.camera = ? "
+            parameters = (camera,)
+        with self.lock:
+            return dict(self.connection.execute(query + "GROUP BY t.tag ORDER BY t.tag", parameters).fetchall())
+
+    def reserve(self, camera, slot):
+        """Marks a hardware slot as stored by hand, mirroring leaves it alone from now on."""
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO slots (camera, slot, preset, reserved) VALUES (?, ?, NULL, 1) "
+                                    "ON CONFLICT (camera, slot) DO UPDATE SET preset = NULL, reserved = 1",
+                                    (camera, slot))
+
+    def mirror_slot(self, shot):
+        """The slot ``shot`` should be mirrored into, or None when it isn't busy enough for one.
+
+        A free slot if there is one, otherwise the one holding the least recalled shot, provided
+        ``shot`` has been recalled more often.
+        """
+        held = dict(self.connection.execute(
+            "SELECT s.slot, COALESCE(p.recalls, -1) FROM slots s LEFT JOIN presets p ON p.id = s.preset "
+            "WHERE s.camera = ? AND s.reserved = 0", (shot.camera,)).fetchall())
+        reserved = {slot for slot, in self.connection.execute(
+            "SELECT slot FROM slots WHERE camera = ? AND reserved = 1", (shot.camera,))}
+
+        free = [slot for slot in self.slots if slot not in reserved and slot not in held]
+        if free:
+            return free[0]
+        candidates = [(recalls, slot) for slot, recalls in held.items() if slot in self.slots]
+        if not candidates:
+            return None
+        recalls, slot = min(candidates)
+        return slot if shot.recalls > recalls else None
+
+    def subscribe(self, camera):
+        if camera not in self.subscribed:
+            self.subscribed.add(camera)
+            camera.subscribe(lambda reply, camera=camera: self.reply_received(camera, reply))
+
+    def recall(self, camera, name, speed=1.0, done=None):
+        """Sends ``camera`` (a Camera) to its shot ``name``, returns the Shot or None if there's no such shot.
+
+        Position comes first, then the settings, each through ``Camera.apply`` so any the camera
+        already has are skipped. The camera only buffers two commands, so the rest follow as
+        completions free them up; a later recall on the same camera drops what's still queued.
+        ``done`` is called with the Recall once it's over.
+        """
+        with self.lock:
+            shot = self.get(camera.address, name)
+            if shot is None:
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE presets SET recalls = recalls + 1, recalled_at = ? WHERE id = ?",
+                                        (time.time(), shot.id))
+            shot.recalls += 1
+
+            # (name, args, state key), the key for settings only
+            queued = collections.deque()
+            position = shot.position
+            slot = None
+            if shot.slot is not None:
+                queued.append(("recall preset x", shot.slot, None))
+            else:
+                if "pan" in position and "tilt" in position:
+                    queued.append(("pan absolute position",
+                                   {"pan": position["pan"], "tilt": position["tilt"], "speed": speed}, None))
+                if "zoom" in position:
+                    queued.append(("zoom direct", position["zoom"], None))
+                if "focus" in position:
+                    queued.append(("focus direct", position["focus"], None))
+                if queued:
+                    slot = self.mirror_slot(shot)
+            for key, value in shot.settings.items():
+                queued.append((SETTINGS[key].command, value, key))
+
+            self.subscribe(camera)
+            previous = self.recalls.get(camera)
+            if previous is not None:
+                self.finish(camera, previous, "superseded")
+            recall = self.recalls[camera] = Recall(shot, slot, queued, done)
+            while len(recall.outstanding) < self.buffer_size and self.send_next(camera, recall):
+                pass
+            if not recall.outstanding:
+                self.finish(camera, recall)
+            else:
+                self.arm(camera, recall)
+            return shot
+
+    def arm(self, camera, recall):
+        """(Re)starts the wait for the next completion of ``recall``."""
+        if recall.timer is not None:
+            recall.timer.cancel()
+        recall.timer = threading.Timer(self.timeout, self.expire, (camera, recall))
+        recall.timer.daemon = True
+        recall.timer.start()
+
+    def finish(self, camera, recall, failed=None):
+        """Ends ``recall``, early if ``failed`` says why, forgetting whatever it still waits for."""
+        if recall.timer is not None:
+            recall.timer.cancel()
+        if failed is not None:
+            recall.failed = failed
+            recall.slot = None
+            recall.queued.clear()
+            for sequence_number in recall.outstanding:
+                self.waiting.pop((camera, sequence_number), None)
+            recall.outstanding.clear()
+        if self.recalls.get(camera) is recall:
+            del self.recalls[camera]
+        if recall.done is not None:
+            recall.done(recall)
+
+    def expire(self, camera, recall):
+        with self.lock:
+            if recall.outstanding:
+                self.finish(camera, recall, "timed out")
+
+    def send_next(self, camera, recall):
+        """Sends the next queued command of ``recall``, False once there's nothing left to send."""
+        while recall.queued:
+            name, args, key = recall.queued.popleft()
+            if key is None:
+                sequence_number = camera.send(name, args)
+            else:
+                sequence_number = camera.apply(name, args, key)
+                if sequence_number is None:
+                    continue
+            recall.outstanding.add(sequence_number)
+            self.waiting[(camera, sequence_number)] = recall
+            return True
+        return False
+
+    def reply_received(self, camera, reply):
+        if reply.kind != COMPLETION and reply.kind != ERROR:
+            return
+
+        with self.lock:
+            recall = self.waiting.pop((camera, reply.sequence_number), None)
+            if recall is None:
+                return
+            recall.outstanding.discard(reply.sequence_number)
+            if reply.kind == ERROR:
+                # The shot may not have been reached, it isn't worth a slot this time
+                recall.slot = None
+            if self.recalls.get(camera) is not recall:
+                return
+            self.send_next(camera, recall)
+            if recall.outstanding:
+                self.arm(camera, recall)
+                return
+
+            if recall.slot is not None:
+                # Every axis is there, so the slot can be stored without moving the camera
+                shot, slot = recall.shot, recall.slot
+                camera.send("set preset x", slot)
+                with self.connection:
+                    self.connection.execute("UPDATE slots SET preset = NULL WHERE camera = ? AND preset = ?",
+                                            (shot.camera, shot.id))
+                    self.connection.execute("INSERT INTO slots (camera, slot, preset) VALUES (?, ?, ?) "
+                                            "ON CONFLICT (camera, slot) DO UPDATE SET preset = excluded.preset",
+                                            (shot.camera, slot, shot.id))
+            self.finish(camera, recall)
@@ -0,0 +1,70 @@
+"""VISCA-over-IP framing: the datagram header, reply kinds and reply parsing."""
+import struct
+
+# VISCA-over-IP header: payload type, payload length, sequence number (all big endian)
+HEADER = struct.Struct(">HHI")
+VISCA_COMMAND = 0x0100
+VISCA_REPLY = 0x0111
+CONTROL_COMMAND = 0x0200
+CONTROL_REPLY = 0x0201
+MAX_PAYLOAD = 16
+
+# Reply kinds, the high nibble of the second payload byte (90 4y FF, 90 5y FF, 90 6y EE FF), plus replies
+# to control commands
+CONTROL = 0x00
+ACK = 0x40
+COMPLETION = 0x50
+ERROR = 0x60
+
+ERROR_MESSAGES = {
+    0x01: "message length error",
+    0x02: "syntax error",
+    0x03: "command buffer full",
+    0x04: "command cancelled",
+    0x05: "no socket",
+    0x41: "command not executable"
+}
+
+
+class Reply:
+    """A decoded reply datagram.
+
+    ``error`` holds the error code of error replies (and of control errors like ``0F 01``, a
+    sequence number abnormality), ``data`` the bytes between ``90 5y`` and ``FF`` of a completion,
+    which is where inquiry results live.
+    """
+    __slots__ = ("payload_type", "sequence_number", "kind", "socket", "error", "data")
+
+    def __init__(self, payload_type, sequence_number, kind, socket_number=0, error=None, data=b""):
+        self.payload_type = payload_type
+        self.sequence_number = sequence_number
+        self.kind = kind
+        self.socket = socket_number
+        self.error = error
+        self.data = data
+
+
+def parse_reply(datagram):
+    """Decodes a reply datagram, returning None for anything too short to be one."""
+    # bad command response  0200 0002 ba000000 0f01
+    # good command response 0111 0003 d3000000 9041ff
+    if len(datagram) <= HEADER.size:
+        return None
+
+    payload_type, length, sequence_number = HEADER.unpack_from(datagram)
+    payload = datagram[HEADER.size:HEADER.size + length]
+
+    if payload_type == CONTROL_REPLY or payload_type == CONTROL_COMMAND:
+        error = payload[1] if payload[0] == 0x0F and len(payload) > 1 else None
+        return Reply(payload_type, sequence_number, CONTROL, error=error, data=bytes(payload))
+
+    if len(payload) < 3:
+        return None
+
+    kind = payload[1] & 0xF0
+    if kind == ERROR:
+        return Reply(payload_type, sequence_number, kind, payload[1] & 0x0F, error=payload[2])
+    if kind == COMPLETION:
+        return Reply(payload_type, sequence_number, kind, payload[1] & 0x0F, data=bytes(payload[2:-1]))
+
+    return Reply(payload_type, sequence_number, kind, payload[1] & 0x0F)
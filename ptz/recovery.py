@@ -0,0 +1,144 @@
+"""Session recovery: put cameras back in sync after sequence errors, silences and reboots."""
+import threading
+import time
+
+from .protocol import CONTROL
+from .scenes import SceneLibrary
+
+
+class Session:
+    """What the watchdog knows about one camera's session."""
+    __slots__ = ("camera", "last_reply_at", "waiting_since", "silent", "reason", "reset_acknowledged", "quiet_until",
+                 "recovering")
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.last_reply_at = time.perf_counter()
+        # When the watchdog first saw a command go unanswered
+        self.waiting_since = None
+        self.silent = False
+        # Why the session needs recovering, None while it's fine
+        self.reason = None
+        self.reset_acknowledged = threading.Event()
+        # Sequence errors for commands that went out just before a reset are expected, not a new problem
+        self.quiet_until = 0.0
+        # Set from the first reset until the replay is done, whatever the camera says meanwhile is the same outage
+        self.recovering = False
+
+
+class SessionRecovery:
+    """Watches cameras and resynchronises their sessions when something's off.
+
+    Two things trigger a recovery: a ``0F 01`` sequence number error, and replies coming back after
+    ``silence`` seconds without any while commands were going out. The recovery is put down to a
+    reboot if the camera comes back with a sequence error (it has lost its session, and its
+    settings with it), to the silence otherwise. Recovering means sending the ``02 00`` reset
+    until the camera acknowledges it (``attempts`` times, ``reset_timeout`` apart, so it's bounded),
+    which also restarts the sequence counter, then replaying the camera's ``intended`` settings.
+    The replay goes in dependency order, two commands at a time, and a recovery only counts once
+    every setting has completed (``replay_timeout`` is the longest it waits for each completion).
+    Recovery times go to each camera's metrics. One thread serves every camera.
+    """
+
+    def __init__(self, cameras=(), silence=2.0, reset_timeout=0.25, attempts=4, interval=0.1, replay_timeout=2.0):
+        self.silence = silence
+        self.reset_timeout = reset_timeout
+        self.attempts = attempts
+        self.interval = interval
+        self.replay = SceneLibrary(timeout=replay_timeout)
+        self.sessions = []
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        for camera in cameras:
+            self.add(camera)
+
+    def add(self, camera):
+        session = Session(camera)
+        camera.subscribe(lambda reply, session=session: self.reply_received(session, reply))
+        self.sessions.append(session)
+        return session
+
+    def reply_received(self, session, reply):
+        now = time.perf_counter()
+        session.last_reply_at = now
+        session.waiting_since = None
+        if reply.kind == CONTROL and reply.error is None:
+            # A reset went through, whatever the camera went through it's in sync now
+            session.silent = False
+            session.reset_acknowledged.set()
+            return
+
+        if session.recovering:
+            # Errors for what went out before the reset, or the camera coming back from the outage being recovered
+            session.silent = False
+        elif session.silent:
+            session.silent = False
+            session.reason = "reboot" if reply.kind == CONTROL and reply.error == 0x01 else "silence"
+            self.wake.set()
+        elif reply.kind == CONTROL and reply.error == 0x01 and now > session.quiet_until and session.reason is None:
+            session.reason = "sequence error"
+            self.wake.set()
+
+    def check(self, session, now):
+        if session.silent or session.recovering or session.camera.last_sent_at <= session.last_reply_at:
+            return
+        if session.waiting_since is None:
+            session.waiting_since = now
+        elif now - session.waiting_since > self.silence:
+            # Recovered once it answers again, when it's clear what it went through
+            session.silent = True
+
+    def recover(self, session):
+        """Resets the camera and replays its intended settings, returns the recovery time or None."""
+        camera = session.camera
+        reason = session.reason
+        session.recovering = True
+        started = time.perf_counter()
+        try:
+            for _ in range(self.attempts):
+                session.reset_acknowledged.clear()
+                session.quiet_until = time.perf_counter() + self.reset_timeout
+                camera.reset()
+                if session.reset_acknowledged.wait(self.reset_timeout):
+                    break
+            else:
+                camera.metrics.recovery_failed(reason)
+                return None
+
+            # Whatever was cached may be gone with a reboot, don't let apply skip anything on its account
+            camera.state.clear()
+            run = self.replay.restore(camera)
+            run.finished.wait()
+            if run.failed or run.skipped:
+                camera.metrics.recovery_failed(reason)
+                return None
+
+            elapsed = time.perf_counter() - started
+            camera.metrics.recovered(reason, elapsed)
+            return elapsed
+        finally:
+            session.reason = None
+            session.waiting_since = None
+            session.recovering = False
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            now = time.perf_counter()
+            for session in list(self.sessions):
+                self.check(session, now)
+                if session.reason is not None:
+                    self.recover(session)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="session recovery", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(1.0)
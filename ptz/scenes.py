@@ -0,0 +1,366 @@
+"""Scenes: a camera's whole look (exposure, white balance, focus) captured under a name and
+applied as one burst of just the settings that differ.
+
+Scene files are JSON, scene name -> the state cache values it sets::
+
+    {"stage": {"ae mode": 3, "fstop": 12, "shutter": 9, "gain": 2, "wb mode": 1, "af mode": 3,
+               "focus": 4096, "digital zoom": false, "low latency": true}}
+
+Settings go out in dependency order: a setting only means something in some modes (the iris only
+takes in Manual or Av, the focus position only in manual focus), so it waits for the completion
+of the mode it depends on when the scene changes that too, and is left out altogether when the
+scene's mode doesn't use it. Everything else is pipelined as deep as the camera's command buffer
+goes, so a look changes in a few round trips.
+"""
+import json
+import os
+import threading
+import time
+
+from .commands import AE_MODES
+from .protocol import COMPLETION, ERROR, ERROR_MESSAGES
+
+# The exposure modes each exposure setting is used in
+AUTO_EXPOSURE = {AE_MODES["Full Auto"], AE_MODES["Tv"], AE_MODES["Av"], AE_MODES["Brightness"]}
+IRIS_MODES = {AE_MODES["Manual"], AE_MODES["Av"]}
+SHUTTER_MODES = {AE_MODES["Manual"], AE_MODES["Tv"]}
+GAIN_MODES = {AE_MODES["Manual"]}
+AF_COMMANDS = {0x02: "af mode auto", 0x03: "af mode manual", 0x10: "af mode auto/manual"}
+MANUAL_FOCUS = {0x03}
+
+
+class SceneSetting:
+    """One setting a scene holds: the state key it's kept under, ``command(value)`` giving the
+    (name, args) that set it, ``decode(name, args)`` turning an intended command back into the
+    value and ``requires`` {key: values} it only applies with. Settings without an inquiry aren't
+    ``polled``, what they were last set to is the best there is."""
+    __slots__ = ("key", "command", "decode", "requires", "polled")
+
+    def __init__(self, key, command, decode, requires=None, polled=True):
+        self.key = key
+        self.command = command
+        self.decode = decode
+        self.requires = requires or dict()
+        self.polled = polled
+
+
+def value_setting(key, name, requires=None):
+    return SceneSetting(key, lambda value: (name, value), lambda intended, args: args, requires)
+
+
+def switch_setting(key, requires=None, polled=True):
+    return SceneSetting(key, lambda value: ("%s %s" % (key, "on" if value else "off"), None),
+                        lambda name, args: name == key + " on", requires, polled)
+
+
+def af_mode(name, args):
+    for value, command in AF_COMMANDS.items():
+        if command == name:
+            return value
+    return None
+
+
+# In dependency order, whatever a setting requires comes before it
+SCENE_SETTINGS = [
+    value_setting("ae mode", "ae mode"),
+    switch_setting("ex ae comp", {"ae mode": AUTO_EXPOSURE}),
+    value_setting("ex_ae_comp", "ex_ae_comp set", {"ae mode": AUTO_EXPOSURE, "ex ae comp": {True}}),
+    value_setting("fstop", "fstop set", {"ae mode": IRIS_MODES}),
+    value_setting("shutter", "shutter set", {"ae mode": SHUTTER_MODES}),
+    value_setting("gain", "gain set", {"ae mode": GAIN_MODES}),
+    value_setting("wb mode", "wb mode"),
+    SceneSetting("af mode", lambda value: (AF_COMMANDS[value], None), af_mode),
+    value_setting("focus", "focus direct", {"af mode": MANUAL_FOCUS}),
+    switch_setting("digital zoom"),
+    switch_setting("low latency", polled=False),
+]
+SCENE_KEYS = tuple(setting.key for setting in SCENE_SETTINGS)
+
+# What to ask a camera before capturing or diffing against it without an InquiryPoller running
+SCENE_INQUIRIES = ("ae mode inquiry", "ex ae comp inquiry", "ex_ae_comp inquiry", "fstop inquiry",
+                   "shutter inquiry", "gain inquiry", "wb mode inquiry", "af mode inquiry",
+                   "focus position inquiry", "digital zoom inquiry")
+
+
+class Scene:
+    __slots__ = ("name", "values")
+
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+
+    def __repr__(self):
+        return "Scene(%r, %r)" % (self.name, self.values)
+
+
+class SceneStep:
+    """One setting to send: its command, the value it leaves the camera with and the keys of the
+    steps that have to complete before it can go."""
+    __slots__ = ("setting", "name", "args", "value", "after")
+
+    def __init__(self, setting, name, args, value, after):
+        self.setting = setting
+        self.name = name
+        self.args = args
+        self.value = value
+        self.after = after
+
+
+class SceneRun:
+    """A scene being applied. ``finished`` is set once every step has completed, failed or been
+    given up on; then ``completed`` holds the keys that were set, ``failed`` {key: error} those
+    that weren't, ``skipped`` the ones never sent because something they depend on failed (or a
+    later scene took over the camera) and ``elapsed`` the seconds it took."""
+
+    def __init__(self, scene, steps, done=None):
+        self.scene = scene
+        self.steps = steps
+        self.pending = list(steps)
+        self.outstanding = dict()  # sequence number -> SceneStep
+        self.completed = set()
+        self.failed = dict()
+        self.skipped = []
+        self.done = done
+        self.timer = None
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.finished = threading.Event()
+
+    def summary(self):
+        text = "Scene %s: %d of %d settings in %.0fms" % (self.scene.name, len(self.completed), len(self.steps),
+                                                         (self.elapsed or 0.0) * 1000)
+        if self.failed:
+            text += ", failed " + ", ".join("%s (%s)" % item for item in self.failed.items())
+        if self.skipped:
+            text += ", skipped " + ", ".join(self.skipped)
+        return text
+
+
+class SceneLibrary:
+    """Named scenes, kept in the JSON file at ``path`` (nothing is stored without one).
+
+    Applying sends through the camera passed in and finishes from its receive loop, so it can be
+    called from any thread; ``timeout`` is how long a run waits for its next completion before
+    giving up on the settings still out.
+    """
+
+    # Commands a camera buffers at once, more are rejected
+    buffer_size = 2
+
+    def __init__(self, path=None, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.scenes = dict()
+        if path is not None and os.path.exists(path):
+            self.scenes = load_scenes(path)
+        # camera -> its SceneRun under way, (camera, sequence number) -> the SceneRun that sent it
+        self.runs = dict()
+        self.waiting = dict()
+        self.subscribed = set()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.scenes)
+
+    def get(self, name):
+        with self.lock:
+            return self.scenes.get(name)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            definitions = {name: scene.values for name, scene in sorted(self.scenes.items())}
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as file:
+                json.dump(definitions, file, indent=2)
+            os.replace(temporary, self.path)
+
+    def capture(self, camera, name):
+        """Stores what ``camera`` is known to be set to as scene ``name``, returns the Scene."""
+        values = dict()
+        for setting in SCENE_SETTINGS:
+            value = known_value(camera, setting)
+            if value is not None:
+                values[setting.key] = value
+        scene = Scene(name, values)
+        with self.lock:
+            self.scenes[name] = scene
+            self.save()
+        return scene
+
+    def remove(self, name):
+        with self.lock:
+            removed = self.scenes.pop(name, None) is not None
+            if removed:
+                self.save()
+            return removed
+
+    def plan(self, camera, scene):
+        """The SceneSteps taking ``camera`` from what it's known to be set to to ``scene``, in dependency order."""
+        known = {setting.key: known_value(camera, setting) for setting in SCENE_SETTINGS}
+        target = dict(known)
+        target.update(scene.values)
+
+        steps = []
+        planned = set()
+        for setting in SCENE_SETTINGS:
+            value = scene.values.get(setting.key)
+            if value is None or known[setting.key] == value:
+                continue
+            # Unknown modes get the benefit of the doubt, the camera rejects what it can't take
+            if any(target[key] is not None and target[key] not in values for key, values in setting.requires.items()):
+                continue
+            name, args = setting.command(value)
+            steps.append(SceneStep(setting, name, args, value, {key for key in setting.requires if key in planned}))
+            planned.add(setting.key)
+        return steps
+
+    def subscribe(self, camera):
+        if camera not in self.subscribed:
+            self.subscribed.add(camera)
+            camera.subscribe(lambda reply, camera=camera: self.reply_received(camera, reply))
+
+    def apply(self, camera, name, done=None):
+        """Starts sending ``camera`` (a Camera) the settings of scene ``name`` (or a Scene) it doesn't
+        already have. Returns the SceneRun, None if there's no such scene; ``done(run)`` is called
+        once it's finished. A later scene on the same camera drops what this one has yet to send.
+        """
+        with self.lock:
+            scene = name if isinstance(name, Scene) else self.scenes.get(name)
+            if scene is None:
+                return None
+
+            return self.start(camera, SceneRun(scene, self.plan(camera, scene), done))
+
+    def restore(self, camera, done=None):
+        """Sends ``camera`` everything in its ``intended`` settings again, whatever the state cache
+        says, e.g. after a reboot. Settings go in dependency order and only as far as the command
+        buffer takes them, like a scene; those the intended modes don't use are left out. Returns
+        the SceneRun."""
+        with self.lock:
+            intended = dict(camera.intended)
+            values = dict()
+            for setting in SCENE_SETTINGS:
+                if setting.key in intended:
+                    values[setting.key] = setting.decode(*intended[setting.key])
+
+            steps = []
+            planned = set()
+            for setting in SCENE_SETTINGS:
+                value = values.get(setting.key)
+                if value is None:
+                    continue
+                if any(values.get(key) is not None and values[key] not in allowed
+                       for key, allowed in setting.requires.items()):
+                    continue
+                name, args = intended[setting.key]
+                steps.append(SceneStep(setting, name, args, value, {key for key in setting.requires if key in planned}))
+                planned.add(setting.key)
+            # Whatever else was applied has no known dependencies, it goes last
+            for key, (name, args) in intended.items():
+                if key not in SCENE_KEYS:
+                    steps.append(SceneStep(SceneSetting(key, None, None, polled=False), name, args, args, set()))
+
+            return self.start(camera, SceneRun(Scene("restore", values), steps, done))
+
+    def start(self, camera, run):
+        self.subscribe(camera)
+        self.runs[camera] = run
+        self.send_ready(camera, run)
+        self.arm(camera, run)
+        return run
+
+    def arm(self, camera, run):
+        """(Re)starts the wait for the next completion of ``run``, while it has anything out."""
+        if run.timer is not None:
+            run.timer.cancel()
+        if run.outstanding:
+            run.timer = threading.Timer(self.timeout, self.expire, (camera, run))
+            run.timer.daemon = True
+            run.timer.start()
+
+    def send_ready(self, camera, run):
+        """Fills the camera's buffer with the steps of ``run`` that aren't waiting on another, and
+        finishes the run once nothing's left that could still go."""
+        while self.runs.get(camera) is run and len(run.outstanding) < self.buffer_size:
+            step = next((step for step in run.pending if step.after <= run.completed), None)
+            if step is None:
+                break
+            run.pending.remove(step)
+            camera.intended[step.setting.key] = (step.name, step.args)
+            sequence_number = camera.send(step.name, step.args)
+            run.outstanding[sequence_number] = step
+            self.waiting[(camera, sequence_number)] = run
+
+        if not run.outstanding and not run.finished.is_set():
+            self.finish(camera, run)
+
+    def finish(self, camera, run):
+        run.skipped.extend(step.setting.key for step in run.pending)
+        run.pending = []
+        run.elapsed = time.perf_counter() - run.started
+        if run.timer is not None:
+            run.timer.cancel()
+        if self.runs.get(camera) is run:
+            del self.runs[camera]
+        run.finished.set()
+        if run.done is not None:
+            run.done(run)
+
+    def reply_received(self, camera, reply):
+        if reply.kind != COMPLETION and reply.kind != ERROR:
+            return
+
+        with self.lock:
+            run = self.waiting.pop((camera, reply.sequence_number), None)
+            if run is None:
+                return
+            step = run.outstanding.pop(reply.sequence_number)
+            if reply.kind == ERROR:
+                run.failed[step.setting.key] = ERROR_MESSAGES.get(reply.error, "error 0x%02X" % (reply.error or 0))
+            else:
+                run.completed.add(step.setting.key)
+                if step.setting.polled:
+                    # So the next scene diffs against it without waiting for the poller
+                    camera.state.update({step.setting.key: step.value})
+            self.send_ready(camera, run)
+            if not run.finished.is_set():
+                self.arm(camera, run)
+
+    def expire(self, camera, run):
+        with self.lock:
+            if run.finished.is_set():
+                return
+            for sequence_number, step in run.outstanding.items():
+                self.waiting.pop((camera, sequence_number), None)
+                run.failed[step.setting.key] = "timed out"
+            run.outstanding.clear()
+            self.finish(camera, run)
+
+
+def known_value(camera, setting):
+    """What ``camera`` was last known to have ``setting`` at, however long ago, or None."""
+    if setting.polled:
+        value = camera.state.get(setting.key, max_age=float("inf"))
+        if value is not None:
+            return value
+    intended = camera.intended.get(setting.key)
+    if intended is None:
+        return None
+    return setting.decode(*intended)
+
+
+def load_scenes(path):
+    """Reads a scene file into ``{name: Scene}``, ValueError for settings scenes don't have."""
+    with open(path) as file:
+        definitions = json.load(file)
+
+    scenes = dict()
+    for name, values in definitions.items():
+        unknown = set(values) - set(SCENE_KEYS)
+        if unknown:
+            raise ValueError("scene %r: unknown settings %s" % (name, ", ".join(sorted(unknown))))
+        scenes[name] = Scene(name, values)
+    return scenes
@@ -0,0 +1,169 @@
+"""Latest-wins coalescing and stop priority for continuous motion."""
+import collections
+import threading
+import time
+
+from .commands import FOCUS, PAN_TILT, PRIORITY_STOP, ZOOM
+from .protocol import CONTROL
+
+
+class LatencyStats:
+    """A running count and maximum plus a window of recent samples, in seconds."""
+
+    def __init__(self, size=256):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+
+        return {
+            "count": self.count,
+            "last": self.samples[-1],
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": self.maximum
+        }
+
+
+class MotionScheduler:
+    """Latest-wins coalescing for continuous pan/tilt, zoom and focus commands.
+
+    Each axis has at most one command waiting for its ACK. Anything submitted for that axis in the
+    meantime replaces whatever is queued behind it, so only the most recent intent goes out once
+    the camera ACKs, errors, or ``ack_timeout`` passes. Commands without an axis are sent straight
+    away.
+
+    Stop priority commands don't wait for anything: they discard the motion queued on their axis
+    and go out immediately. The time from ``issued_at`` (the button event) to the datagram hitting
+    the wire is kept in ``stop_latency``.
+    """
+    stop_commands = {PAN_TILT: "stop", ZOOM: "zoom stop", FOCUS: "focus stop"}
+
+    def __init__(self, camera, ack_timeout=0.2):
+        self.camera = camera
+        self.ack_timeout = ack_timeout
+        self.lock = threading.Lock()
+        self.in_flight = dict()  # axis -> (sequence number, send time)
+        self.queued = dict()  # axis -> (name, args)
+        self.timers = dict()
+
+        self.submitted = dict.fromkeys((PAN_TILT, ZOOM, FOCUS), 0)
+        self.sent = dict.fromkeys((PAN_TILT, ZOOM, FOCUS), 0)
+        self.coalesced = dict.fromkeys((PAN_TILT, ZOOM, FOCUS), 0)
+        self.cancelled = dict.fromkeys((PAN_TILT, ZOOM, FOCUS), 0)
+        self.stop_latency = LatencyStats()
+
+        camera.subscribe(self.reply_received)
+
+    def submit(self, name, args=None, issued_at=None):
+        if issued_at is None:
+            issued_at = time.perf_counter()
+
+        command = self.camera.commands[name]
+        axis = command.axis
+        if axis is None:
+            return self.camera.send(name, args)
+        if command.priority == PRIORITY_STOP:
+            return self.preempt(axis, name, args, issued_at)
+
+        with self.lock:
+            self.submitted[axis] += 1
+            in_flight = self.in_flight.get(axis)
+            if in_flight is not None:
+                waited = time.monotonic() - in_flight[1]
+                if waited < self.ack_timeout:
+                    if axis in self.queued:
+                        self.coalesced[axis] += 1
+                    self.queued[axis] = (name, args)
+
+                    if axis not in self.timers:
+                        timer = threading.Timer(self.ack_timeout - waited, self.expire, (axis,))
+                        timer.daemon = True
+                        self.timers[axis] = timer
+                        timer.start()
+                    return None
+
+            return self.dispatch(axis, name, args)
+
+    def preempt(self, axis, name, args, issued_at):
+        with self.lock:
+            self.submitted[axis] += 1
+            if self.queued.pop(axis, None) is not None:
+                self.cancelled[axis] += 1
+            timer = self.timers.pop(axis, None)
+            if timer is not None:
+                timer.cancel()
+
+            sequence_number = self.dispatch(axis, name, args)
+            self.stop_latency.record(time.perf_counter() - issued_at)
+            return sequence_number
+
+    def stop_all(self, issued_at=None):
+        """Stops every axis at once, pan/tilt first."""
+        if issued_at is None:
+            issued_at = time.perf_counter()
+
+        for axis, name in self.stop_commands.items():
+            self.preempt(axis, name, None, issued_at)
+
+    def reset(self):
+        """Forgets the motion in flight and queued behind it, the session is being reset."""
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.timers.clear()
+            self.in_flight.clear()
+            self.queued.clear()
+
+    def dispatch(self, axis, name, args):
+        sequence_number = self.camera.send(name, args)
+        self.in_flight[axis] = (sequence_number, time.monotonic())
+        self.sent[axis] += 1
+        return sequence_number
+
+    def release(self, axis):
+        del self.in_flight[axis]
+        timer = self.timers.pop(axis, None)
+        if timer is not None:
+            timer.cancel()
+
+        queued = self.queued.pop(axis, None)
+        if queued is not None:
+            self.dispatch(axis, *queued)
+
+    def expire(self, axis):
+        # The ACK never came, don't hold the queued intent hostage to a lost datagram
+        with self.lock:
+            self.timers.pop(axis, None)
+            if axis in self.in_flight:
+                self.release(axis)
+
+    def reply_received(self, reply):
+        if reply.kind == CONTROL:
+            return
+
+        with self.lock:
+            for axis, (sequence_number, sent_at) in self.in_flight.items():
+                if sequence_number == reply.sequence_number:
+                    self.release(axis)
+                    return
+
+    def stats(self):
+        """Per-axis counts of submitted, sent, coalesced (replaced before sending) and cancelled (dropped
+        for a stop) commands, plus the stop latency summary."""
+        with self.lock:
+            stats = {axis: {"submitted": self.submitted[axis], "sent": self.sent[axis],
+                            "coalesced": self.coalesced[axis], "cancelled": self.cancelled[axis]}
+                     for axis in self.submitted}
+            stats["stop latency"] = self.stop_latency.summary()
+            return stats
@@ -0,0 +1,432 @@
+"""A control server: any number of clients sharing one session with each camera, over TCP.
+
+    python3 -m ptz serve 10.0.0.5 10.0.0.6 --listen 0.0.0.0
+
+Clients send a JSON object per line and get one back per request, echoing its ``id``::
+
+    {"id": 1, "op": "send", "camera": "10.0.0.5", "name": "zoom tele var", "args": {"speed": 0.5}}
+    {"id": 1, "result": {"sequence_number": 42}}
+    {"id": 2, "op": "send", "name": "fstop set", "args": 12, "wait": "completion"}
+    {"id": 2, "error": "fstop set failed: command not executable"}
+
+Requests (``camera`` is optional wherever it appears, the pool's active camera by default):
+
+- ``hello`` ``name``: names the client in control events, its address otherwise
+- ``commands``: the catalog, name -> axis (null for commands that don't move anything)
+- ``cameras``: the camera addresses
+- ``state`` ``camera``: the camera's state cache
+- ``send`` ``camera`` ``name`` ``args`` ``wait``: sends a catalog command, ``wait`` "ack" or
+  "completion" answers once the camera has. A ``direction`` in ``args`` stands in for the
+  ``move`` postfix, as in macros
+- ``control`` ``camera`` ``force``, ``release`` ``camera``: takes or gives up motion control
+- ``subscribe`` ``camera``, ``unsubscribe`` ``camera``: starts or stops the camera's events,
+  every camera's without one
+
+Events are pushed as ``{"event": "state", "camera": ..., "values": {...}}`` when a camera's state
+changes (a snapshot first, on subscribing), and ``{"event": "control", "camera": ..., "holder": ...}``
+when motion control changes hands. A client that reads slowly gets the latest values rather
+than every change in between.
+
+Every command goes out through the one Camera per address, so all clients share its session and
+sequence counter and nothing but the server binds the VISCA port. Motion is arbitrated: whoever
+moves a camera first controls its motion, and keeps control while anything it started is still
+moving or for ``lease`` seconds after its last motion command. Anybody can send stops and
+commands that don't move the head; ``force`` takes control away, e.g. for a director's override.
+A client dropping out stops whatever it left moving.
+"""
+import asyncio
+import json
+import threading
+import time
+import traceback
+
+from .commands import DIRECTIONS, PRIORITY_STOP, commands
+from .protocol import ACK, COMPLETION, CONTROL, ERROR, ERROR_MESSAGES
+from .scheduler import MotionScheduler
+
+# Replies a send can wait for, and how long at most
+WAITS = {"ack": ((ACK, COMPLETION), 1.0), "completion": ((COMPLETION,), 10.0)}
+# Subscribed to every camera
+EVERY_CAMERA = "*"
+# Motion that ends by itself rather than with a stop, it only renews the lease
+FINITE_MOTION = {"home", "pan absolute position", "pan relative position", "zoom direct", "focus direct"}
+
+
+class RequestError(Exception):
+    """A request that can't be served, answered with its message."""
+
+
+class Client:
+    """A connected client: what it's subscribed to, and what's waiting to be written to it."""
+
+    def __init__(self, writer, name):
+        self.writer = writer
+        self.name = name
+        self.subscriptions = set()
+        # Responses in order, then events by (event, camera) so a slow reader only gets the latest
+        self.responses = []
+        self.events = dict()
+        self.wakeup = asyncio.Event()
+        # (camera, axis) this client has moving
+        self.moving = set()
+
+    def subscribed(self, address):
+        return address in self.subscriptions or EVERY_CAMERA in self.subscriptions
+
+    def respond(self, message):
+        self.responses.append(message)
+        self.wakeup.set()
+
+    def push(self, event, address, values):
+        """Queues an event, a state event merges into one still queued for the same camera."""
+        queued = self.events.get((event, address))
+        if event != "state":
+            self.events[(event, address)] = dict({"event": event, "camera": address}, **values)
+        elif queued is None:
+            self.events[(event, address)] = {"event": event, "camera": address, "values": dict(values)}
+        else:
+            queued["values"].update(values)
+        self.wakeup.set()
+
+
+class ControlServer:
+    """Serves ``cameras`` (a CameraPool or a single Camera) on ``address``:``port``.
+
+    Runs its own event loop on a daemon thread (``start`` and ``close``), or on the caller's with
+    ``serve``. Cameras added to the pool later are served once ``add`` is called for them.
+    """
+    # Commands a camera buffers at once, more are rejected
+    buffer_size = 2
+
+    def __init__(self, cameras, address="127.0.0.1", port=52400, lease=2.0):
+        self.cameras = cameras
+        self.address = address
+        self.port = port
+        self.lease = lease
+        self.clients = set()
+        # Requests being answered, the loop itself only keeps weak references to tasks
+        self.tasks = set()
+        # address -> [Client in control, monotonic time of its last motion command]
+        self.holders = dict()
+        # (camera, sequence number) -> (future or None, reply kinds it's waiting for, gate or None)
+        self.lock = threading.Lock()
+        self.waiting = dict()
+        # camera -> Semaphore, see gate
+        self.gates = dict()
+        # camera -> its state watcher, so ``close`` can take it off again
+        self.watched = dict()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+
+    def served(self):
+        pool = getattr(self.cameras, "cameras", None)
+        return list(pool.values()) if pool is not None else [self.cameras]
+
+    def camera_for(self, address):
+        pool = getattr(self.cameras, "cameras", None)
+        if pool is None:
+            camera = self.cameras
+            if address is not None and address != camera.address:
+                raise RequestError("no camera %s" % address)
+            return camera
+        camera = pool.get((address, 52381)) if address is not None else self.cameras.active
+        if camera is None:
+            raise RequestError("no camera %s" % address)
+        return camera
+
+    def add(self, camera):
+        """Starts serving ``camera``, safe to call from any thread once the server runs."""
+        self.loop.call_soon_threadsafe(self.watch, camera)
+
+    def watch(self, camera):
+        if camera in self.watched:
+            return
+
+        def state_changed(changes, address=camera.address):
+            try:
+                self.loop.call_soon_threadsafe(self.broadcast, "state", address, changes)
+            except RuntimeError:
+                # The loop has closed
+                pass
+
+        self.watched[camera] = state_changed
+        camera.state.watch(state_changed)
+        camera.subscribe(lambda reply, camera=camera: self.reply_received(camera, reply))
+
+    def broadcast(self, event, address, values):
+        for client in self.clients:
+            if client.subscribed(address):
+                client.push(event, address, values)
+
+    def reply_received(self, camera, reply):
+        if reply.kind == CONTROL:
+            return
+        key = (camera, reply.sequence_number)
+        with self.lock:
+            pending = self.waiting.get(key)
+            if pending is None:
+                return
+            finished = reply.kind == COMPLETION or reply.kind == ERROR
+            if finished:
+                del self.waiting[key]
+            elif reply.kind not in pending[1]:
+                return
+        try:
+            self.loop.call_soon_threadsafe(self.replied, pending, reply, finished)
+        except RuntimeError:
+            pass
+
+    def replied(self, pending, reply, finished):
+        future, kinds, gate = pending
+        if future is not None and not future.done() and (reply.kind in kinds or reply.kind == ERROR):
+            future.set_result(reply)
+        if finished and gate is not None:
+            gate.release()
+
+    def expire(self, key):
+        """Gives up on a command's completion, freeing its buffer slot."""
+        with self.lock:
+            pending = self.waiting.pop(key, None)
+        if pending is not None and pending[2] is not None:
+            pending[2].release()
+
+    def gate(self, camera):
+        """What keeps the commands in flight to ``camera`` within what its buffer takes."""
+        gate = self.gates.get(camera)
+        if gate is None:
+            gate = self.gates[camera] = asyncio.Semaphore(self.buffer_size)
+        return gate
+
+    def holder(self, address):
+        """The client in control of the camera at ``address``, None when nobody is."""
+        held = self.holders.get(address)
+        if held is None:
+            return None
+        client, last_motion = held
+        if not any(camera.address == address for camera, axis in client.moving) and \
+                time.monotonic() - last_motion > self.lease:
+            return None
+        return client
+
+    def take_control(self, client, address):
+        previous = self.holders.get(address)
+        self.holders[address] = [client, time.monotonic()]
+        if previous is None or previous[0] is not client:
+            self.broadcast("control", address, {"holder": client.name})
+
+    def release(self, client, address):
+        held = self.holders.get(address)
+        if held is not None and held[0] is client:
+            del self.holders[address]
+            self.broadcast("control", address, {"holder": None})
+
+    async def send(self, client, request):
+        camera = self.camera_for(request.get("camera"))
+        name = request.get("name")
+        command = commands.get(name)
+        if command is None:
+            raise RequestError("unknown command %r" % name)
+        args = request.get("args")
+        if isinstance(args, dict) and "direction" in args:
+            args = dict(args)
+            direction = args.pop("direction")
+            if direction not in DIRECTIONS:
+                raise RequestError("unknown direction %r" % direction)
+            args["postfix"] = DIRECTIONS[direction]
+        wait = request.get("wait")
+        if wait is not None and wait not in WAITS:
+            raise RequestError("can wait for the ack or the completion, not %r" % wait)
+
+        axis = command.axis
+        if axis is not None:
+            if command.priority == PRIORITY_STOP:
+                # Whoever sends it, the axis has stopped, so it no longer keeps anybody in control
+                for other in self.clients:
+                    other.moving.discard((camera, axis))
+            else:
+                holder = self.holder(camera.address)
+                if holder is not None and holder is not client:
+                    raise RequestError("%s is controlled by %s" % (camera.address, holder.name))
+                self.take_control(client, camera.address)
+                if name not in FINITE_MOTION:
+                    client.moving.add((camera, axis))
+
+        if axis is not None and wait is None:
+            # Continuous motion from many clients is coalesced like the UI's
+            return {"sequence_number": camera.submit(name, args)}
+
+        # Other commands take one of the camera's buffer slots until they complete, so they queue here
+        # for one rather than being turned away by the camera. Inquiries and motion don't wait.
+        gate = None
+        if axis is None and command.data[1] != 0x09:
+            gate = self.gate(camera)
+            await gate.acquire()
+        kinds, timeout = WAITS.get(wait, WAITS["completion"])
+        future = self.loop.create_future() if wait is not None else None
+        # Registered under the lock the receive loop needs, so the reply can't get here first
+        with self.lock:
+            try:
+                sequence_number = camera.send(name, args)
+            except Exception:
+                if gate is not None:
+                    gate.release()
+                raise
+            key = (camera, sequence_number)
+            self.waiting[key] = (future, kinds, gate)
+        self.loop.call_later(WAITS["completion"][1], self.expire, key)
+        if future is None:
+            return {"sequence_number": sequence_number}
+
+        try:
+            reply = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RequestError("no %s for %s within %.1fs" % (wait, name, timeout))
+        if reply.kind == ERROR:
+            raise RequestError("%s failed: %s" % (name, ERROR_MESSAGES.get(reply.error, "error 0x%02X" % reply.error)))
+        return {"sequence_number": sequence_number}
+
+    async def handle(self, client, request):
+        op = request.get("op")
+        if op == "send":
+            return await self.send(client, request)
+        if op == "hello":
+            client.name = str(request.get("name", client.name))
+            return {"name": client.name}
+        if op == "commands":
+            return {name: command.axis for name, command in commands.items()}
+        if op == "cameras":
+            return [camera.address for camera in self.served()]
+        if op == "state":
+            camera = self.camera_for(request.get("camera"))
+            return {key: value for key, (value, timestamp) in camera.state.snapshot().items()}
+        if op == "control":
+            address = self.camera_for(request.get("camera")).address
+            holder = self.holder(address)
+            if holder is not None and holder is not client and not request.get("force"):
+                raise RequestError("%s is controlled by %s" % (address, holder.name))
+            if holder is not None and holder is not client:
+                holder.moving = {(camera, axis) for camera, axis in holder.moving if camera.address != address}
+            self.take_control(client, address)
+            return {"holder": client.name}
+        if op == "release":
+            self.release(client, self.camera_for(request.get("camera")).address)
+            return None
+        if op in ("subscribe", "unsubscribe"):
+            address = request.get("camera") or EVERY_CAMERA
+            if address != EVERY_CAMERA:
+                self.camera_for(address)
+            if op == "unsubscribe":
+                client.subscriptions.discard(address)
+                return None
+            client.subscriptions.add(address)
+            for camera in self.served():
+                if address in (EVERY_CAMERA, camera.address):
+                    self.watch(camera)
+                    client.push("state", camera.address,
+                                {key: value for key, (value, timestamp) in camera.state.snapshot().items()})
+                    holder = self.holder(camera.address)
+                    client.push("control", camera.address, {"holder": holder.name if holder else None})
+            return None
+        raise RequestError("unknown op %r" % op)
+
+    async def answer(self, client, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("not an object")
+        except ValueError as error:
+            client.respond({"error": "bad request: %s" % error})
+            return
+
+        response = {"id": request.get("id")}
+        try:
+            response["result"] = await self.handle(client, request)
+        except RequestError as error:
+            response["error"] = str(error)
+        client.respond(response)
+
+    def answered(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    async def write(self, client):
+        """Writes whatever is queued for ``client`` whenever there's something, until it's gone."""
+        writer = client.writer
+        while True:
+            await client.wakeup.wait()
+            client.wakeup.clear()
+            messages = client.responses + list(client.events.values())
+            client.responses, client.events = [], dict()
+            writer.write("".join(json.dumps(message, default=str) + "\n" for message in messages).encode())
+            await writer.drain()
+
+    async def connected(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        client = Client(writer, "%s:%d" % peer[:2] if peer else "client")
+        self.clients.add(client)
+        writing = asyncio.ensure_future(self.write(client))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    # Answered concurrently, so a request waiting for a completion doesn't hold up the next
+                    task = asyncio.ensure_future(self.answer(client, line))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.answered)
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than the stream's limit
+            pass
+        finally:
+            self.clients.discard(client)
+            writing.cancel()
+            self.disconnected(client)
+            writer.close()
+
+    def disconnected(self, client):
+        for camera, axis in client.moving:
+            camera.submit(MotionScheduler.stop_commands[axis])
+        client.moving.clear()
+        for address, (holder, last_motion) in list(self.holders.items()):
+            if holder is client:
+                self.release(client, address)
+
+    async def serve(self):
+        """Serves until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        for camera in self.served():
+            self.watch(camera)
+        self.server = await asyncio.start_server(self.connected, self.address, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            for camera, state_changed in self.watched.items():
+                camera.state.unwatch(state_changed)
+            self.watched.clear()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        """Serves on a daemon thread, returns once it's listening."""
+        self.thread = threading.Thread(target=self.run, name="control server", daemon=True)
+        self.thread.start()
+        self.started.wait(5.0)
+        return self.thread
+
+    def close(self):
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        if self.thread is not None:
+            self.thread.join(1.0)
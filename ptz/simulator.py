@@ -0,0 +1,406 @@
+"""A stand-in VISCA-over-IP camera on a local UDP port, for testing and benchmarking without hardware.
+
+    python3 -m ptz.simulator 127.0.0.2 --latency 0.005 --jitter 0.002 --loss 0.01
+    python3 main.py 127.0.0.2
+
+It answers the framing Camera and ViscaEngine emit: the ``02 00`` reset control command, commands
+(ACK into one of two command buffer slots, then completion once the command has "run"), inquiries
+(an immediate completion carrying whatever the matching command last set) and cancels. Sequence
+numbers that go backwards get the ``0F 01`` control error, a retransmission of one of the last few
+commands is answered again (with every reply it has had so far) without running it twice.
+``reboot`` goes silent for a while, then forgets its settings and rejects every command with
+``0F 01`` until it's reset. Given a ``discovery_port`` it also answers the Sony discovery enquiry.
+"""
+import argparse
+import collections
+import heapq
+import ipaddress
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+
+from .protocol import CONTROL_COMMAND, CONTROL_REPLY, HEADER, MAX_PAYLOAD, VISCA_COMMAND, VISCA_REPLY
+
+SLOTS = 2
+# How many commands' replies are kept for answering retransmissions
+RECENT = 16
+
+# Inquiries answered from a command with a different id: inquiry (category, id) -> command
+# (category, id), where in that command's arguments the reply starts
+INQUIRY_SOURCES = {
+    (0x06, 0x12): ((0x06, 0x02), 2),    # pan tilt position <- absolute position
+}
+
+# Replies for values nothing has set yet, anything not listed answers a single 00
+INQUIRY_DEFAULTS = {
+    (0x04, 0x47): bytes(4),    # zoom position
+    (0x04, 0x48): bytes(4),    # focus position
+    (0x06, 0x12): bytes(8),    # pan tilt position
+    (0x04, 0x4A): bytes(4),    # shutter
+    (0x04, 0x4B): bytes(4),    # iris
+    (0x04, 0x4C): bytes(4),    # gain
+    (0x04, 0x4E): bytes(4),    # exposure compensation
+    (0x00, 0x02): bytes((0x00, 0x20, 0x05, 0x19, 0x02, 0x00, 0x02)),    # device type: vendor, model, ROM, sockets
+}
+
+ABSOLUTE = (0x06, 0x02)
+RELATIVE = (0x06, 0x03)
+HOME = (0x06, 0x04)
+
+
+def add_nibbles(position, offset):
+    """Two 0p 0q 0r 0s positions added, wrapping at 16 bits as the camera's two's complement does."""
+    value = 0
+    for a, b in zip(position, offset):
+        # Each nibble pair is a digit of both numbers, summing as we go carries correctly
+        value = (value << 4) + (a & 0x0F) + (b & 0x0F)
+    value &= 0xFFFF
+    return bytes((value >> 12, (value >> 8) & 0x0F, (value >> 4) & 0x0F, value & 0x0F))
+
+
+class SimulatedCamera:
+    """A fake camera answering on ``address``:``port`` (port 0 picks a free one, see ``port`` after).
+
+    ``latency`` is added to every reply, give or take up to ``jitter``; replies are never reordered.
+    ``loss`` is the chance of dropping each datagram, independently in both directions. A command
+    holds its buffer slot for ``execution_time`` seconds, a third command while both are busy gets
+    the buffer full error. With ``strict_sequence`` every command must carry the previous sequence
+    number plus one, otherwise gaps (from datagrams lost on the way) are allowed. ``discovery_port``
+    (52380 on a real camera) answers ``ENQ:network`` enquiries with ``name`` and a made up MAC.
+    """
+
+    def __init__(self, address="127.0.0.1", port=52381, latency=0.0, jitter=0.0, loss=0.0, execution_time=0.01,
+                 strict_sequence=False, seed=None, discovery_port=None, name=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.execution_time = execution_time
+        self.strict_sequence = strict_sequence
+        self.random = random.Random(seed)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((address, port))
+        self.socket.setblocking(False)
+        self.address, self.port = self.socket.getsockname()
+
+        self.discovery_socket = None
+        if discovery_port is not None:
+            self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.discovery_socket.bind((address, discovery_port))
+            self.discovery_socket.setblocking(False)
+        self.name = name or "CAM%d" % (ipaddress.ip_address(self.address).packed[-1])
+
+        self.last_sequence_number = 0
+        # sequence number -> the replies sent for it so far, resent when the command is retransmitted
+        self.answered = collections.OrderedDict()
+        # slot -> (sequence number, client address), slots are numbered 1 and 2 as in 90 4y FF
+        self.slots = dict.fromkeys(range(1, SLOTS + 1))
+        # (category, id) -> the arguments of the last command, which is what its inquiry answers
+        self.settings = dict()
+        # (due, order, callback, args), run by the receive loop once due
+        self.timers = []
+        self.timer_order = 0
+        self.last_reply_due = 0.0
+        # Set by reboot (from any thread), the receive loop does the rest
+        self.down_until = 0.0
+        self.rebooting = False
+        self.needs_reset = False
+
+        self.counters = dict.fromkeys(("received", "dropped in", "dropped out", "resets", "acks", "completions",
+                                       "errors", "buffer full", "sequence errors", "retransmissions", "reboots"), 0)
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.stopped = threading.Event()
+        self.stopped.set()
+        self.wake_receive, self.wake_send = socket.socketpair()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def later(self, due, callback, *args):
+        self.timer_order += 1
+        heapq.heappush(self.timers, (due, self.timer_order, callback, args))
+
+    def reply(self, client, payload_type, sequence_number, payload):
+        datagram = HEADER.pack(payload_type, len(payload), sequence_number) + bytes(payload)
+        delay = self.latency
+        if self.jitter:
+            delay = max(0.0, delay + self.random.uniform(-self.jitter, self.jitter))
+        # Later replies never overtake earlier ones
+        due = max(time.monotonic() + delay, self.last_reply_due)
+        self.last_reply_due = due
+        self.later(due, self.transmit, client, datagram)
+
+        replies = self.answered.get(sequence_number)
+        if replies is not None and payload_type == VISCA_REPLY:
+            replies.append(datagram)
+
+    def transmit(self, client, datagram):
+        if self.rebooting:
+            return
+        if self.loss and self.random.random() < self.loss:
+            self.count("dropped out")
+            return
+        try:
+            self.socket.sendto(datagram, client)
+        except OSError:
+            pass
+
+    def error(self, client, sequence_number, slot, code):
+        self.count("errors")
+        if code == 0x03:
+            self.count("buffer full")
+        self.reply(client, VISCA_REPLY, sequence_number, (0x90, 0x60 | slot, code, 0xFF))
+
+    def reboot(self, downtime=1.0):
+        """Stops answering for ``downtime`` seconds, then comes back without settings or session."""
+        self.count("reboots")
+        self.down_until = time.monotonic() + downtime
+        self.rebooting = True
+
+    def datagram_received(self, datagram, client):
+        self.count("received")
+        if self.loss and self.random.random() < self.loss:
+            self.count("dropped in")
+            return
+        if self.rebooting:
+            if time.monotonic() < self.down_until:
+                return
+            self.rebooting = False
+            self.needs_reset = True
+            self.settings.clear()
+            self.answered.clear()
+            self.slots = dict.fromkeys(range(1, SLOTS + 1))
+            self.last_sequence_number = 0
+        if len(datagram) <= HEADER.size:
+            return
+
+        payload_type, length, sequence_number = HEADER.unpack_from(datagram)
+        payload = datagram[HEADER.size:]
+        if length != len(payload):
+            # 0F 02, message length error
+            self.reply(client, CONTROL_REPLY, sequence_number, (0x0F, 0x02))
+            return
+
+        if payload_type == CONTROL_COMMAND:
+            if payload[0] == 0x01:
+                self.count("resets")
+                self.last_sequence_number = 0
+                self.needs_reset = False
+                self.answered.clear()
+                self.reply(client, CONTROL_REPLY, sequence_number, (0x01,))
+            return
+
+        if payload_type != VISCA_COMMAND:
+            return
+
+        if self.needs_reset:
+            self.count("sequence errors")
+            self.reply(client, CONTROL_REPLY, sequence_number, (0x0F, 0x01))
+            return
+
+        if sequence_number in self.answered:
+            self.count("retransmissions")
+            due = max(time.monotonic() + self.latency, self.last_reply_due)
+            for reply in self.answered[sequence_number]:
+                self.later(due, self.transmit, client, reply)
+            return
+
+        expected = (self.last_sequence_number + 1) & 0xFFFFFFFF
+        if sequence_number != expected and (self.strict_sequence or sequence_number < self.last_sequence_number):
+            # 0F 01, sequence number abnormality
+            self.count("sequence errors")
+            self.reply(client, CONTROL_REPLY, sequence_number, (0x0F, 0x01))
+            return
+
+        self.last_sequence_number = sequence_number
+        self.answered[sequence_number] = []
+        if len(self.answered) > RECENT:
+            self.answered.popitem(last=False)
+        self.command_received(payload, sequence_number, client)
+
+    def command_received(self, payload, sequence_number, client):
+        if len(payload) > MAX_PAYLOAD:
+            return self.error(client, sequence_number, 0, 0x01)
+        if len(payload) < 3 or payload[0] & 0xF0 != 0x80 or payload[-1] != 0xFF:
+            return self.error(client, sequence_number, 0, 0x02)
+
+        category = payload[1]
+        if category & 0xF0 == 0x20:
+            return self.cancel(category & 0x0F, sequence_number, client)
+        if len(payload) < 5 or category not in (0x01, 0x09):
+            return self.error(client, sequence_number, 0, 0x02)
+
+        key = (payload[2], payload[3])
+        if category == 0x09:
+            self.count("completions")
+            return self.reply(client, VISCA_REPLY, sequence_number, (0x90, 0x50) + self.inquiry(key) + (0xFF,))
+
+        slot = next((slot for slot, busy in self.slots.items() if busy is None), None)
+        if slot is None:
+            return self.error(client, sequence_number, 0, 0x03)
+
+        if key == HOME:
+            self.settings.pop(ABSOLUTE, None)
+        elif key == RELATIVE and len(payload) == 15:
+            # Lands where the equivalent absolute move would
+            position = self.settings.get(ABSOLUTE, bytes(10))
+            self.settings[ABSOLUTE] = (bytes(payload[4:6]) + add_nibbles(position[2:6], payload[6:10]) +
+                                       add_nibbles(position[6:10], payload[10:14]))
+        else:
+            self.settings[key] = bytes(payload[4:-1])
+
+        self.slots[slot] = (sequence_number, client)
+        self.count("acks")
+        self.reply(client, VISCA_REPLY, sequence_number, (0x90, 0x40 | slot, 0xFF))
+        self.later(time.monotonic() + self.execution_time, self.complete, slot, sequence_number)
+
+    def inquiry(self, key):
+        source, offset = INQUIRY_SOURCES.get(key, (key, 0))
+        default = INQUIRY_DEFAULTS.get(key, b"\x00")
+        if source not in self.settings:
+            return tuple(default)
+        return tuple(self.settings[source][offset:offset + len(default)])
+
+    def complete(self, slot, sequence_number):
+        if self.slots[slot] is None or self.slots[slot][0] != sequence_number:
+            # Cancelled in the meantime
+            return
+
+        client = self.slots[slot][1]
+        self.slots[slot] = None
+        self.count("completions")
+        self.reply(client, VISCA_REPLY, sequence_number, (0x90, 0x50 | slot, 0xFF))
+
+    def cancel(self, slot, sequence_number, client):
+        if self.slots.get(slot) is None:
+            # 05, no socket
+            return self.error(client, sequence_number, slot, 0x05)
+
+        cancelled, cancelled_client = self.slots[slot]
+        self.slots[slot] = None
+        # 04, command cancelled, sent for the cancelled command
+        return self.error(cancelled_client, cancelled, slot, 0x04)
+
+    def enquiry_received(self, datagram, client):
+        if datagram != b"\x02ENQ:network\xff\x03" or self.down_until > time.monotonic():
+            return
+
+        octets = ipaddress.ip_address(self.address).packed
+        fields = ("MAC:02-00-%02X-%02X-%02X-%02X" % tuple(octets), "INFO:SRG-300SE", "MODEL:IPCARD",
+                  "SOFTVERSION:2.10", "IPADR:%s" % self.address, "MASK:255.255.255.0", "GATEWAY:0.0.0.0",
+                  "NAME:%s" % self.name, "WRITE:on")
+        self.discovery_socket.sendto(b"\x02" + b"".join(field.encode("ascii") + b"\xff" for field in fields) + b"\x03",
+                                     client)
+
+    def stop(self):
+        self.stopping = True
+        self.wake_send.send(b"\x00")
+
+    def close(self):
+        self.stop()
+        self.stopped.wait(1.0)
+        self.socket.close()
+        if self.discovery_socket is not None:
+            self.discovery_socket.close()
+        self.wake_receive.close()
+        self.wake_send.close()
+
+    def start(self):
+        """Runs the simulator on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="simulated camera %s:%d" % (self.address, self.port),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        self.stopping = False
+        self.stopped.clear()
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        selector.register(self.wake_receive, selectors.EVENT_READ)
+        if self.discovery_socket is not None:
+            selector.register(self.discovery_socket, selectors.EVENT_READ)
+        timers = self.timers
+
+        try:
+            while not self.stopping:
+                timeout = max(0.0, timers[0][0] - time.monotonic()) if timers else None
+                selector.select(timeout)
+                for _ in range(64):
+                    try:
+                        datagram, client = self.socket.recvfrom(1024)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionRefusedError:
+                        continue
+                    self.datagram_received(datagram, client)
+                while self.discovery_socket is not None:
+                    try:
+                        datagram, client = self.discovery_socket.recvfrom(1024)
+                    except (BlockingIOError, InterruptedError, ConnectionRefusedError):
+                        break
+                    self.enquiry_received(datagram, client)
+
+                now = time.monotonic()
+                while timers and timers[0][0] <= now:
+                    _, _, callback, args = heapq.heappop(timers)
+                    callback(*args)
+        finally:
+            selector.close()
+            self.stopped.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ptz.simulator", description="Run stand-in VISCA-over-IP cameras.")
+    parser.add_argument("address", nargs="?", default="127.0.0.2",
+                        help="address of the first camera (default %(default)s)")
+    parser.add_argument("--port", type=int, default=52381, help="port to answer on (default %(default)s)")
+    parser.add_argument("--count", type=int, default=1,
+                        help="number of cameras, on consecutive addresses from ADDRESS (default %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds on top of the latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="chance of dropping a datagram, 0 to 1")
+    parser.add_argument("--execution-time", type=float, default=0.01,
+                        help="seconds a command holds its buffer slot (default %(default)s)")
+    parser.add_argument("--strict-sequence", action="store_true",
+                        help="answer any gap in sequence numbers with 0F 01")
+    parser.add_argument("--discovery", action="store_true",
+                        help="also answer the discovery enquiry on port 52380")
+    options = parser.parse_args(argv)
+
+    first = ipaddress.ip_address(options.address)
+    cameras = []
+    for index in range(options.count):
+        camera = SimulatedCamera(str(first + index), options.port, options.latency, options.jitter, options.loss,
+                                 options.execution_time, options.strict_sequence,
+                                 discovery_port=52380 if options.discovery else None)
+        camera.start()
+        cameras.append(camera)
+        print("simulated camera on %s:%d" % (camera.address, camera.port), flush=True)
+
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for camera in cameras:
+            print("%s:%d %s" % (camera.address, camera.port, camera.stats()))
+            camera.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
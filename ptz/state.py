@@ -0,0 +1,208 @@
+"""Camera state: inquiry reply decoders, the state cache and the inquiry poller."""
+import threading
+import time
+import traceback
+
+from .protocol import COMPLETION, ERROR
+
+
+def position_nibbles(data):
+    # 0p 0q 0r 0s -> pqrs
+    value = 0
+    for nibble in data:
+        value = (value << 4) | (nibble & 0x0F)
+
+    return value
+
+
+def signed_position(data):
+    value = position_nibbles(data)
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def zoom_position_reply(data):
+    return {"zoom": position_nibbles(data[0:4])}
+
+
+def focus_position_reply(data):
+    return {"focus": position_nibbles(data[0:4])}
+
+
+def pan_tilt_position_reply(data):
+    return {"pan": signed_position(data[0:4]), "tilt": signed_position(data[4:8])}
+
+
+def mode_reply(key):
+    return lambda data: {key: data[0]}
+
+
+def exposure_reply(key):
+    # 00 00 0p 0q
+    return lambda data: {key: position_nibbles(data[2:4])}
+
+
+def switch_reply(key):
+    # 02 on, 03 off
+    return lambda data: {key: data[0] == 0x02}
+
+
+# Inquiry command -> decoder from the completion data to state cache entries
+INQUIRIES = {
+    "zoom position inquiry": zoom_position_reply,
+    "focus position inquiry": focus_position_reply,
+    "pan tilt position inquiry": pan_tilt_position_reply,
+    "ae mode inquiry": mode_reply("ae mode"),
+    "wb mode inquiry": mode_reply("wb mode"),
+    "af mode inquiry": mode_reply("af mode"),
+    "gain inquiry": exposure_reply("gain"),
+    "shutter inquiry": exposure_reply("shutter"),
+    "fstop inquiry": exposure_reply("fstop"),
+    "ex_ae_comp inquiry": exposure_reply("ex_ae_comp"),
+    "ex ae comp inquiry": switch_reply("ex ae comp"),
+    "digital zoom inquiry": switch_reply("digital zoom"),
+}
+
+
+class StateCache:
+    """The last values a camera reported, each with the monotonic time it was reported at.
+
+    ``version`` goes up with every change, so readers can cheaply tell whether there's anything new.
+    """
+
+    def __init__(self, max_age=5.0):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.values = dict()
+        self.version = 0
+        self.watchers = []
+
+    def watch(self, callback):
+        """Calls ``callback({key: value})`` with what changed after every update that changed
+        anything, on the thread doing the update (usually a receive loop), so keep it short."""
+        self.watchers.append(callback)
+
+    def unwatch(self, callback):
+        self.watchers.remove(callback)
+
+    def update(self, values, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        changes = dict()
+        with self.lock:
+            for key, value in values.items():
+                previous = self.values.get(key)
+                if previous is None or previous[0] != value:
+                    self.version += 1
+                    changes[key] = value
+                self.values[key] = (value, timestamp)
+
+        if changes:
+            for callback in self.watchers:
+                try:
+                    callback(changes)
+                except Exception:
+                    traceback.print_exc()
+
+    def get(self, key, default=None, max_age=None):
+        """Returns the cached value of ``key``, or ``default`` if it's unknown or older than
+        ``max_age`` seconds (the cache's own ``max_age`` unless given)."""
+        entry = self.values.get(key)
+        if entry is None:
+            return default
+
+        if max_age is None:
+            max_age = self.max_age
+        if time.monotonic() - entry[1] > max_age:
+            return default
+
+        return entry[0]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def clear(self):
+        """Forgets everything, e.g. after the camera rebooted and may have lost its settings."""
+        with self.lock:
+            self.values.clear()
+            self.version += 1
+
+
+class InquiryPoller:
+    """Polls cameras with VISCA inquiries and feeds the answers into their state caches.
+
+    Every ``interval`` seconds each camera gets its inquiries pipelined in bursts of ``batch_size``:
+    a burst goes out back to back and the next one follows as soon as its replies are in (or
+    ``reply_timeout`` passes). One thread serves every camera.
+    """
+
+    def __init__(self, cameras=(), interval=1.0, batch_size=4, reply_timeout=0.1, inquiries=INQUIRIES):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reply_timeout = reply_timeout
+        self.inquiries = inquiries
+        self.cameras = []
+        self.lock = threading.Lock()
+        self.outstanding = dict()  # (camera, sequence number) -> inquiry name
+        self.burst_done = threading.Condition(self.lock)
+        self.stopping = threading.Event()
+        self.thread = None
+
+        for camera in cameras:
+            self.add(camera)
+
+    def add(self, camera):
+        camera.subscribe(lambda reply, camera=camera: self.reply_received(camera, reply))
+        self.cameras.append(camera)
+
+    def reply_received(self, camera, reply):
+        if reply.kind != COMPLETION and reply.kind != ERROR:
+            return
+
+        with self.lock:
+            name = self.outstanding.pop((camera, reply.sequence_number), None)
+            if name is None:
+                return
+            self.burst_done.notify()
+
+        if reply.kind == COMPLETION:
+            try:
+                camera.state.update(self.inquiries[name](reply.data))
+            except IndexError:
+                # Short reply, the camera doesn't support this inquiry the way we expect
+                pass
+
+    def poll(self, camera):
+        names = list(self.inquiries)
+        for start in range(0, len(names), self.batch_size):
+            with self.lock:
+                for name in names[start:start + self.batch_size]:
+                    self.outstanding[(camera, camera.send(name))] = name
+
+                deadline = time.monotonic() + self.reply_timeout
+                while any(key[0] is camera for key in self.outstanding):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.burst_done.wait(remaining)
+
+                # Whatever didn't answer in time is dropped, the next poll asks again
+                for key in [key for key in self.outstanding if key[0] is camera]:
+                    del self.outstanding[key]
+
+    def run(self):
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            for camera in list(self.cameras):
+                self.poll(camera)
+            self.stopping.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="inquiry poller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(1.0)
@@ -0,0 +1,69 @@
+"""UDP transports: one socket per camera, or a camera's share of a CameraPool socket."""
+import socket
+
+
+class Transport:
+    """A single long-lived UDP socket shared by a camera's send and receive paths."""
+
+    def __init__(self, address, port=52381, local_port=None, bind_address="0.0.0.0"):
+        self.address = address
+        self.port = port
+        self.local_port = port if local_port is None else local_port
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((bind_address, self.local_port))
+        # Non-blocking so the receive loop can drain everything a select() reported in one go
+        self.socket.setblocking(False)
+        # Connecting fixes the peer once, so every send skips the address lookup and the kernel
+        # filters out datagrams from anything other than the camera.
+        self.socket.connect((self.address, self.port))
+
+    def send(self, data):
+        try:
+            return self.socket.send(data)
+        except (ConnectionRefusedError, BlockingIOError):
+            # A connected UDP socket reports an earlier ICMP port unreachable on the next call, and a
+            # full send buffer drops the datagram; it's lost either way, just like the unconnected
+            # sends used to be.
+            return 0
+
+    def recv_batch(self, size=1024, limit=64):
+        """Returns the datagrams already queued on the socket, up to ``limit``, without blocking."""
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.socket.recv(size))
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionRefusedError:
+                continue
+
+        return batch
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class SharedTransport:
+    """A camera's view onto a CameraPool socket: sends go to the camera's address, replies are
+    routed back by the pool."""
+
+    def __init__(self, pool, address, port=52381):
+        self.pool = pool
+        self.destination = (address, port)
+
+    def send(self, data):
+        try:
+            return self.pool.socket.sendto(data, self.destination)
+        except (ConnectionRefusedError, BlockingIOError):
+            return 0
+
+    def close(self):
+        # The socket belongs to the pool
+        pass
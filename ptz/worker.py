@@ -0,0 +1,120 @@
+"""A thread that does the socket work for a UI, fed with intents through a queue."""
+import collections
+import threading
+import traceback
+
+
+class CommandWorker:
+    """Calls methods of ``target`` (a Camera or CameraPool) on its own thread, in the order they were posted.
+
+    ``post("send", "brighter")`` returns straight away. An intent posted with a ``key`` replaces a
+    still queued intent with the same key, so a burst of slider events only leaves the latest
+    speed behind. ``urgent`` intents, stops, skip the queue and discard whatever is queued under
+    their key. ``done(method, result, error)`` is called on the worker thread after each intent
+    runs, e.g. to emit a Qt signal.
+    """
+
+    def __init__(self, target, done=None):
+        self.target = target
+        self.done = done
+        self.condition = threading.Condition()
+        # [method, args, key], method is None once the intent has been replaced or discarded
+        self.queue = collections.deque()
+        self.keyed = dict()
+        self.stopping = False
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+        self.posted = 0
+        self.replaced = 0
+        self.discarded = 0
+        self.executed = 0
+
+    def post(self, method, *args, key=None, urgent=False):
+        with self.condition:
+            self.posted += 1
+            queued = self.keyed.get(key) if key is not None else None
+            if queued is not None:
+                if not urgent:
+                    # Latest wins, in the place the first one was queued
+                    queued[1] = args
+                    self.replaced += 1
+                    return
+                queued[0] = None
+                del self.keyed[key]
+                self.discarded += 1
+
+            intent = [method, args, key]
+            if urgent:
+                self.queue.appendleft(intent)
+            else:
+                self.queue.append(intent)
+                if key is not None:
+                    self.keyed[key] = intent
+            self.condition.notify()
+
+    def discard(self, *keys):
+        """Drops the queued intents posted under any of ``keys``."""
+        with self.condition:
+            for key in keys:
+                queued = self.keyed.pop(key, None)
+                if queued is not None:
+                    queued[0] = None
+                    self.discarded += 1
+
+    def pending(self):
+        with self.condition:
+            return sum(1 for intent in self.queue if intent[0] is not None)
+
+    def stats(self):
+        with self.condition:
+            return {"posted": self.posted, "replaced": self.replaced, "discarded": self.discarded,
+                    "executed": self.executed}
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+
+    def close(self):
+        self.stop()
+        self.stopped.wait(1.0)
+
+    def start(self):
+        """Runs the worker on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="command worker", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        self.stopped.clear()
+        try:
+            while True:
+                with self.condition:
+                    while not self.queue and not self.stopping:
+                        self.condition.wait()
+                    if self.stopping:
+                        return
+                    intent = self.queue.popleft()
+                    method, args, key = intent
+                    if method is None:
+                        continue
+                    if key is not None and self.keyed.get(key) is intent:
+                        del self.keyed[key]
+                    self.executed += 1
+
+                result = error = None
+                try:
+                    result = getattr(self.target, method)(*args)
+                except Exception as exception:
+                    error = exception
+                    if self.done is None:
+                        traceback.print_exc()
+
+                if self.done is not None:
+                    try:
+                        self.done(method, result, error)
+                    except Exception:
+                        traceback.print_exc()
+        finally:
+            self.stopped.set()
@@ -0,0 +1,49 @@
+"""Fixtures: a simulated camera on an ephemeral loopback port and a camera session talking to it.
+
+Run from the repository root: python3 -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ptz.camera import CameraPool  # noqa: E402
+from ptz.simulator import SimulatedCamera  # noqa: E402
+
+
+@pytest.fixture
+def simulator():
+    simulator = SimulatedCamera("127.0.0.1", 0, execution_time=0.005)
+    simulator.start()
+    yield simulator
+    simulator.close()
+
+
+@pytest.fixture
+def pool():
+    pool = CameraPool(port=0)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def camera(simulator, pool):
+    camera = pool.add(simulator.address, simulator.port)
+    pool.start()
+    return camera
+
+
+def poll(condition, timeout=2.0):
+    """Polls ``condition`` until it's true or ``timeout`` passes, returns its last value."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def wait_until():
+    return poll
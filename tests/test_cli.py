@@ -0,0 +1,28 @@
+import pytest
+
+from ptz.cli import build_parser, command_for
+
+
+def parse(*argv):
+    parser = build_parser()
+    return command_for(parser, parser.parse_args(["send"] + list(argv)))
+
+
+def test_send_takes_integers_and_setting_labels():
+    assert parse("fstop set", "0x0C") == ("fstop set", 0x0C)
+    assert parse("ae mode", "Manual") == ("ae mode", 0x03)
+    assert parse("brighter") == ("brighter", None)
+
+
+@pytest.mark.parametrize("argv, error", [
+    (("ae mode", "Bogus"), "'ae mode' takes an integer or one of Full Auto"),
+    (("ae mode", "7"), "'ae mode' takes one of Full Auto (0x00)"),
+    (("pan absolute position", "5"), "can't be sent with a single value 5"),
+    (("brighter", "3"), "'brighter' takes no value"),
+    (("fstop set",), "'fstop set' needs a value"),
+])
+def test_send_reports_values_the_command_cant_take(argv, error, capsys):
+    with pytest.raises(SystemExit) as exit:
+        parse(*argv)
+    assert exit.value.code == 2
+    assert error in capsys.readouterr().err
@@ -0,0 +1,59 @@
+import pytest
+
+from ptz.commands import DIRECTIONS, commands
+from ptz.protocol import HEADER, VISCA_COMMAND
+
+
+@pytest.mark.parametrize("name, args, payload", [
+    ("brighter", None, "81 01 04 0D 02 FF"),
+    ("recall preset x", 4, "81 01 04 3F 02 04 FF"),
+    ("fstop set", 0x0C, "81 01 04 4B 00 00 00 0C FF"),
+    ("ae mode", "Manual", "81 01 04 39 03 FF"),
+    ("ae mode", 0x0B, "81 01 04 39 0B FF"),
+    ("move", {"speed": 0.5, "postfix": DIRECTIONS["left"]}, "81 01 06 01 0C 0A 01 03 FF"),
+    ("move", {"pan_speed": 1.0, "tilt_speed": 0.0, "postfix": DIRECTIONS["up-right"]}, "81 01 06 01 18 01 02 01 FF"),
+    ("pan absolute position", {"pan": -0x200, "tilt": 0x100, "speed": 1.0},
+     "81 01 06 02 18 14 0F 0E 00 00 00 01 00 00 FF"),
+    ("zoom direct", 0x4000, "81 01 04 47 04 00 00 00 FF"),
+    ("zoom tele var", {"speed": 1.0}, "81 01 04 07 27 FF"),
+    ("focus near var", {"speed": 0.0}, "81 01 04 08 31 FF"),
+])
+def test_templates_encode_the_documented_bytes(name, args, payload):
+    assert commands[name].get_command(args) == bytes.fromhex(payload)
+
+
+def test_encoding_leaves_the_template_alone():
+    template = commands["fstop set"].data
+    commands["fstop set"].get_command(0x0C)
+    assert commands["fstop set"].data == template == bytes.fromhex("81 01 04 4B 00 00 00 00 FF")
+
+
+def test_encode_into_writes_after_the_header_in_place():
+    command = commands["gain set"]
+    buffer = bytearray(b"\xAA" * (HEADER.size + command.size + 2))
+    assert command.encode_into(buffer, HEADER.size, 0x05) == command.size
+    HEADER.pack_into(buffer, 0, VISCA_COMMAND, command.size, 7)
+
+    assert bytes(buffer[:HEADER.size]) == bytes.fromhex("0100 0009 00000007")
+    assert bytes(buffer[HEADER.size:HEADER.size + command.size]) == command.get_command(0x05)
+    assert buffer[-2:] == b"\xAA\xAA"
+
+
+def test_camera_frames_each_command_with_its_sequence_number(simulator, camera, wait_until):
+    datagrams = []
+    datagram_received = simulator.datagram_received
+
+    def spy(datagram, client):
+        datagrams.append(bytes(datagram))
+        datagram_received(datagram, client)
+
+    simulator.datagram_received = spy
+    first = camera.send("fstop set", 0x0C)
+    second = camera.send("brighter")
+    assert second == first + 1
+    assert wait_until(lambda: len(datagrams) == 2)
+
+    for datagram, sequence_number, payload in zip(datagrams, (first, second),
+                                                  ("81 01 04 4B 00 00 00 0C FF", "81 01 04 0D 02 FF")):
+        payload = bytes.fromhex(payload)
+        assert datagram == HEADER.pack(VISCA_COMMAND, len(payload), sequence_number) + payload
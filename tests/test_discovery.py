@@ -0,0 +1,61 @@
+import asyncio
+import socket
+
+import pytest
+
+from ptz import discovery
+from ptz.discovery import broadcast, probe
+from ptz.simulator import SimulatedCamera
+
+ADDRESSES = ("127.0.0.31", "127.0.0.32", "127.0.0.33")
+
+
+@pytest.fixture
+def responders():
+    """Simulated cameras on a few loopback addresses, sharing a VISCA port, each with its own discovery port."""
+    first = SimulatedCamera(ADDRESSES[0], 0, discovery_port=0, name="cam1")
+    simulators = [first] + [SimulatedCamera(address, first.port, discovery_port=0, name="cam%d" % number)
+                            for number, address in enumerate(ADDRESSES[1:], 2)]
+    for simulator in simulators:
+        simulator.start()
+    yield simulators
+    for simulator in simulators:
+        simulator.close()
+
+
+async def collect(results):
+    return [found async for found in results]
+
+
+def test_probe_finds_what_answers_and_gives_up_on_the_rest(responders):
+    port = responders[0].port
+    found = asyncio.run(collect(probe(list(ADDRESSES) + ["127.0.0.34", "127.0.0.35"], port=port, timeout=0.1)))
+
+    assert sorted(camera.address for camera in found) == list(ADDRESSES)
+    assert all(camera.how == "probe" and camera.port == port and camera.rtt < 0.1 for camera in found)
+    # The simulator reports a Sony device type
+    assert all(camera.vendor == 0x0020 for camera in found)
+
+
+def test_broadcast_reads_the_enquiry_reply(responders):
+    simulator = responders[1]
+    port = simulator.discovery_socket.getsockname()[1]
+    found, = asyncio.run(collect(broadcast(simulator.address, port, wait=0.2, local_port=0)))
+
+    assert found.address == simulator.address and found.how == "broadcast"
+    assert found.info["NAME"] == "cam2" and found.info["IPADR"] == simulator.address
+
+
+def test_broadcast_closes_its_socket_when_it_cant_bind(monkeypatch):
+    created = []
+
+    class Socket(socket.socket):
+        def __init__(self, *args):
+            super().__init__(*args)
+            created.append(self)
+
+    monkeypatch.setattr(discovery.socket, "socket", Socket)
+    with pytest.raises(OSError):
+        # Not a local address
+        asyncio.run(collect(broadcast(bind_address="192.0.2.1", local_port=0)))
+    assert created and all(sock.fileno() == -1 for sock in created)
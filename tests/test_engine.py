@@ -0,0 +1,100 @@
+import asyncio
+import collections
+
+from ptz.engine import ViscaEngine
+from ptz.protocol import COMPLETION, CONTROL, HEADER, VISCA_COMMAND, VISCA_REPLY
+
+
+def count_runs(simulator):
+    """Counts the commands ``simulator`` actually runs, by payload; retransmissions it recognises aren't run."""
+    runs = collections.Counter()
+    command_received = simulator.command_received
+
+    def spy(payload, sequence_number, client):
+        runs[bytes(payload)] += 1
+        return command_received(payload, sequence_number, client)
+
+    simulator.command_received = spy
+    return runs
+
+
+def drop_completions(simulator, forget=()):
+    """Loses the first completion of every command, and lets the simulator forget the sequence
+    numbers in ``forget`` too, as a camera does once enough newer commands have gone through."""
+    dropped = set()
+    transmit = simulator.transmit
+
+    def lossy(client, datagram):
+        payload_type, _, sequence_number = HEADER.unpack_from(datagram)
+        completion = payload_type == VISCA_REPLY and datagram[HEADER.size + 1] & 0xF0 == COMPLETION
+        if completion and sequence_number not in dropped:
+            dropped.add(sequence_number)
+            if sequence_number in forget:
+                simulator.answered.pop(sequence_number, None)
+            return
+        transmit(client, datagram)
+
+    simulator.transmit = lossy
+    return dropped
+
+
+async def send_all(simulator, names, **options):
+    engine = ViscaEngine(simulator.address, simulator.port, local_port=0, **options)
+    await engine.open()
+    try:
+        return await asyncio.gather(*(engine.send(name) for name in names), return_exceptions=True)
+    finally:
+        engine.close()
+
+
+def test_lost_completion_is_fetched_again_without_rerunning(simulator):
+    runs = count_runs(simulator)
+    dropped = drop_completions(simulator)
+    replies = asyncio.run(send_all(simulator, ["brighter"] * 4, ack_timeout=0.05, completion_timeout=0.1))
+
+    assert len(dropped) == 4
+    assert all(reply.kind == COMPLETION for reply in replies)
+    assert sum(runs.values()) == 4
+
+
+def test_forgotten_command_counts_as_done_on_sequence_error(simulator):
+    runs = count_runs(simulator)
+    drop_completions(simulator, forget={1})
+    replies = asyncio.run(send_all(simulator, ["brighter", "darker"], ack_timeout=0.05, completion_timeout=0.1))
+
+    # The camera moved past "brighter" before the probe, which it answers with 0F 01
+    assert replies[0].kind == CONTROL
+    assert not isinstance(replies[1], Exception)
+    assert sum(runs.values()) == 2
+
+
+def test_overtaken_retransmission_goes_out_under_a_new_number(simulator):
+    runs = count_runs(simulator)
+    datagram_received = simulator.datagram_received
+    lost = []
+
+    def lossy(datagram, client):
+        payload_type, _, sequence_number = HEADER.unpack_from(datagram)
+        if payload_type == VISCA_COMMAND and sequence_number == 1 and not lost:
+            lost.append(sequence_number)
+            return
+        datagram_received(datagram, client)
+
+    simulator.datagram_received = lossy
+    replies = asyncio.run(send_all(simulator, ["brighter", "darker"], ack_timeout=0.05, completion_timeout=0.2))
+
+    # "darker" got there first, so the retransmission of "brighter" was behind it
+    assert all(reply.kind == COMPLETION for reply in replies)
+    assert replies[0].sequence_number == 3
+    assert simulator.stats()["sequence errors"] == 1
+    assert sum(runs.values()) == 2
+
+
+def test_lossy_link_loses_no_commands(simulator):
+    simulator.loss = 0.02
+    simulator.random.seed(1)
+    runs = count_runs(simulator)
+    replies = asyncio.run(send_all(simulator, ["brighter"] * 200, ack_timeout=0.05, completion_timeout=0.2))
+
+    assert [reply for reply in replies if isinstance(reply, Exception)] == []
+    assert sum(runs.values()) == 200
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from ptz.commands import PAN_TILT, ZOOM
+from ptz.hold import HoldMotion
+
+LEFT = {"speed": 0.5, "postfix": [0x01, 0x03, 0xFF]}
+
+
+@pytest.fixture
+def submitted():
+    return []
+
+
+@pytest.fixture
+def hold(submitted):
+    hold = HoldMotion(lambda name, args, axis: submitted.append((name, axis)), timeout=0.2)
+    hold.start()
+    yield hold
+    hold.stop()
+
+
+def test_auto_repeat_sends_one_move_and_one_stop(hold, submitted):
+    for _ in range(30):
+        hold.press(PAN_TILT, "move", LEFT, source="left")
+    assert hold.release(PAN_TILT, source="left")
+
+    assert submitted == [("move", PAN_TILT), ("stop", PAN_TILT)]
+    assert hold.stats() == {"sent": 1, "suppressed": 29, "released": 1, "expired": 0}
+
+
+def test_only_the_holder_releases(hold, submitted):
+    hold.press(ZOOM, "zoom tele", source="button")
+    assert not hold.release(ZOOM, source="key")
+    assert hold.held() == {ZOOM: ("zoom tele", None, "button")}
+    assert hold.release(ZOOM)
+    assert submitted == [("zoom tele", ZOOM), ("zoom stop", ZOOM)]
+
+
+def test_the_watchdog_stops_a_hold_whose_release_got_lost(hold, submitted, wait_until):
+    hold.press(PAN_TILT, "move", LEFT)
+    # Refreshing keeps it going past the timeout
+    for _ in range(4):
+        time.sleep(0.1)
+        hold.refresh(PAN_TILT)
+    assert submitted == [("move", PAN_TILT)]
+
+    assert wait_until(lambda: len(submitted) == 2)
+    assert submitted[1] == ("stop", PAN_TILT)
+    assert hold.stats()["expired"] == 1 and hold.held() == {}
+    # Nothing left to release
+    assert not hold.release(PAN_TILT)
+
+
+def test_forget_drops_a_hold_without_a_stop(hold, submitted):
+    hold.press(PAN_TILT, "move", LEFT)
+    hold.forget()
+    time.sleep(0.3)
+    assert submitted == [("move", PAN_TILT)]
+    assert hold.stats()["expired"] == 0
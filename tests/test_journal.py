@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from ptz.commands import commands
+from ptz.journal import FILE_HEADER, RECORD_SIZE, JournalReader, JournalWriter, Replay
+from ptz.protocol import CONTROL_COMMAND, VISCA_COMMAND
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "show.ptzj")
+
+
+def write(path, records):
+    """Journals ``records`` of (address, payload type, payload), a millisecond apart."""
+    writer = JournalWriter(path)
+    for sequence_number, (address, payload_type, payload) in enumerate(records, 1):
+        writer.record(address, 52381, payload_type, sequence_number, payload)
+        time.sleep(0.001)
+    writer.close()
+
+
+def test_records_read_back_in_order(path):
+    stop = commands["stop"].get_command()
+    write(path, [("10.0.0.1", VISCA_COMMAND, stop), ("10.0.0.2", CONTROL_COMMAND, b"\x01")])
+
+    reader = JournalReader(path)
+    try:
+        assert len(reader) == 2
+        first, second = reader
+        assert (first.address, first.port, first.payload_type, first.sequence_number, first.payload) == \
+            ("10.0.0.1", 52381, VISCA_COMMAND, 1, stop)
+        assert (second.address, second.payload_type, second.payload) == ("10.0.0.2", CONTROL_COMMAND, b"\x01")
+        assert first.timestamp < second.timestamp
+        assert reader[-1].sequence_number == 2
+        with pytest.raises(IndexError):
+            reader[2]
+    finally:
+        reader.close()
+
+
+def test_seek_and_filter_by_time_and_address(path):
+    stop = commands["stop"].get_command()
+    write(path, [("10.0.0.%d" % (index % 2 + 1), VISCA_COMMAND, stop) for index in range(10)])
+
+    reader = JournalReader(path)
+    try:
+        timestamps = [entry.timestamp for entry in reader]
+        assert reader.seek(timestamps[4]) == 4
+        assert reader.seek(timestamps[4] + 1) == 5
+        assert reader.seek(0) == 0
+        assert reader.seek(timestamps[-1] + 1) == 10
+
+        middle = (timestamps[5] - reader.start()) / 1e9
+        assert [entry.sequence_number for entry in reader.entries(start=middle)] == [6, 7, 8, 9, 10]
+        assert [entry.sequence_number for entry in reader.entries(end=middle, address="10.0.0.2")] == [2, 4]
+    finally:
+        reader.close()
+
+
+def test_a_torn_record_is_cut_off_when_writing_resumes(path):
+    stop = commands["stop"].get_command()
+    write(path, [("10.0.0.1", VISCA_COMMAND, stop)] * 2)
+    with open(path, "ab") as journal:
+        journal.write(bytes(RECORD_SIZE // 2))
+
+    write(path, [("10.0.0.1", VISCA_COMMAND, stop)])
+    reader = JournalReader(path)
+    try:
+        assert len(reader) == 3
+        assert [entry.sequence_number for entry in reader] == [1, 2, 1]
+    finally:
+        reader.close()
+    with open(path, "rb") as journal:
+        assert len(journal.read()) == FILE_HEADER.size + 3 * RECORD_SIZE
+
+
+def test_not_a_journal(path):
+    with open(path, "wb") as journal:
+        journal.write(b"not a journal at all")
+    with pytest.raises(ValueError):
+        JournalReader(path)
+
+
+def test_replay_resends_to_the_camera_with_the_recorded_timing(simulator, camera, path, wait_until):
+    stop = commands["stop"].get_command()
+    writer = JournalWriter(path)
+    writer.record("10.0.0.1", 52381, VISCA_COMMAND, 1, stop)
+    time.sleep(0.1)
+    writer.record("10.0.0.1", 52381, VISCA_COMMAND, 2, stop)
+    writer.close()
+    received = simulator.stats()["received"]
+
+    reader = JournalReader(path)
+    try:
+        replay = Replay(reader.entries(), camera, speed=2.0)
+        started = time.perf_counter()
+        assert replay.run()
+        # Half the recorded gap at double speed
+        assert 0.04 < time.perf_counter() - started < 0.2
+    finally:
+        reader.close()
+
+    assert replay.sent == 2 and replay.skipped == 0
+    assert wait_until(lambda: simulator.stats()["received"] == received + 2)
+
+
+def test_replay_through_a_pool_skips_cameras_it_does_not_have(pool, camera, path):
+    stop = commands["stop"].get_command()
+    write(path, [(camera.address, VISCA_COMMAND, stop), ("10.0.0.9", VISCA_COMMAND, stop)])
+    reader = JournalReader(path)
+    entries = list(reader)
+    reader.close()
+    for entry in entries:
+        entry.port = camera.port
+
+    replay = Replay(entries, pool)
+    assert replay.run()
+    assert replay.sent == 1 and replay.skipped == 1
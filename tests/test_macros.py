@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from ptz.macros import Macro, MacroScheduler, Step
+
+
+@pytest.fixture
+def scheduler(pool, camera):
+    scheduler = MacroScheduler(pool)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def arrivals(simulator):
+    """Records when the simulator takes each command."""
+    times = []
+    command_received = simulator.command_received
+
+    def spy(payload, sequence_number, client):
+        times.append(time.perf_counter())
+        return command_received(payload, sequence_number, client)
+
+    simulator.command_received = spy
+    return times
+
+
+def test_delays_run_on_the_macros_own_timeline(simulator, camera, scheduler, wait_until):
+    times = arrivals(simulator)
+    macro = Macro("steps", [Step("brighter"), Step(delay=0.1), Step("darker"), Step(delay=0.1), Step("brighter")],
+                  camera=camera.address, port=camera.port)
+    started = time.perf_counter()
+    run = scheduler.start_macro(macro)
+    assert run.finished.wait(2.0)
+
+    assert run.error is None and run.camera is camera
+    # The last send ends the run, it may not have arrived yet
+    assert wait_until(lambda: len(times) == 3)
+    # Each step is due a whole number of delays after the start, however late the one before it ran
+    for number, arrived in enumerate(times):
+        assert number * 0.1 <= arrived - started < number * 0.1 + 0.05
+    assert run.lateness.summary()["max"] < 0.05
+
+
+def test_a_wait_restarts_the_timeline_from_the_completion(simulator, camera, scheduler):
+    simulator.execution_time = 0.15
+    times = arrivals(simulator)
+    macro = Macro("wait", [Step("brighter", wait=True), Step(delay=0.05), Step("darker")])
+    run = scheduler.start_macro(macro, camera.address)
+    assert run.finished.wait(2.0)
+
+    assert run.error is None
+    assert 0.2 <= times[1] - times[0] < 0.3
+
+
+def test_a_wait_that_times_out_ends_the_run(simulator, camera, scheduler):
+    simulator.loss = 1.0
+    macro = Macro("lost", [Step("brighter", wait=True, timeout=0.1), Step("darker")])
+    run = scheduler.start_macro(macro, camera.address)
+    assert run.finished.wait(2.0)
+
+    assert run.error == "no completion within 0.1s"
+    assert run.index == 1
+
+
+def test_a_camera_the_pool_doesnt_have_ends_the_run(scheduler):
+    run = scheduler.start_macro(Macro("elsewhere", [Step("brighter", camera="127.0.0.99")]))
+    assert run.finished.wait(2.0)
+    assert run.error == "no camera 127.0.0.99"
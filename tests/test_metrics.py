@@ -0,0 +1,92 @@
+import json
+import urllib.request
+
+import pytest
+
+from ptz.metrics import BOUNDS, Histogram, Metrics, MetricsServer, render_text
+from ptz.protocol import ACK, COMPLETION, ERROR, Reply, VISCA_REPLY
+
+
+def reply(kind, sequence_number, error=None):
+    return Reply(VISCA_REPLY, sequence_number, kind, 1, error=error)
+
+
+def test_histogram_percentiles_are_bucket_bounds_capped_at_the_maximum():
+    histogram = Histogram()
+    for milliseconds in range(1, 101):
+        histogram.record(milliseconds / 1000)
+
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["max"] == 0.1
+    assert summary["mean"] == pytest.approx(0.0505)
+    # Four buckets per doubling, so a percentile is within about 19% above the true value
+    assert 0.050 <= summary["p50"] <= 0.050 * 2 ** 0.25
+    assert summary["p99"] == 0.1
+    assert Histogram().summary() == {"count": 0}
+
+
+def test_histogram_counts_beyond_the_last_bound():
+    histogram = Histogram()
+    histogram.record(BOUNDS[-1] * 2)
+    assert histogram.counts[-1] == 1 and histogram.percentile(0.5) == BOUNDS[-1] * 2
+
+
+def test_commands_are_timed_from_send_to_ack_and_completion():
+    metrics = Metrics()
+    metrics.sent("fstop set", 1, 0.000002, 0.00001, sent_at=10.0)
+    metrics.reply_received(reply(ACK, 1), received_at=10.002)
+    metrics.reply_received(reply(ACK, 1), received_at=10.003)
+    metrics.reply_received(reply(COMPLETION, 1), received_at=10.010)
+    metrics.sent("fstop set", 2, 0.000002, 0.00001, sent_at=11.0)
+    metrics.reply_received(reply(ERROR, 2, error=0x41), received_at=11.001)
+
+    entry = metrics.snapshot()["fstop set"]
+    assert (entry["sent"], entry["acks"], entry["completions"], entry["errors"]) == (2, 1, 1, 1)
+    assert entry["ack"]["max"] == pytest.approx(0.002)
+    assert entry["completion"]["max"] == pytest.approx(0.010)
+    assert metrics.in_flight == {}
+
+
+def test_a_retransmission_restarts_the_clock():
+    metrics = Metrics()
+    metrics.sent("brighter", 1, 0.0, 0.0, sent_at=10.0)
+    metrics.retransmitted("brighter", 1, sent_at=10.2)
+    metrics.reply_received(reply(ACK, 1), received_at=10.201)
+
+    entry = metrics.snapshot()["brighter"]
+    assert entry["retransmits"] == 1
+    assert entry["ack"]["max"] == pytest.approx(0.001)
+
+
+def test_unanswered_commands_count_as_timeouts_when_read():
+    metrics = Metrics(ack_timeout=0.1, completion_timeout=1.0, limit=4)
+    metrics.sent("brighter", 1, 0.0, 0.0, sent_at=0.0)
+    assert metrics.snapshot()["brighter"]["timeouts"] == 1
+    for sequence_number in range(2, 8):
+        metrics.sent("darker", sequence_number, 0.0, 0.0)
+    # The oldest go once more than ``limit`` are outstanding
+    assert len(metrics.in_flight) == 4 and metrics.commands["darker"].timeouts == 2
+
+
+def test_the_server_exports_what_the_camera_measured(simulator, camera, wait_until):
+    camera.send("brighter")
+    assert wait_until(lambda: camera.metrics.snapshot().get("brighter", {}).get("completions") == 1)
+    camera.metrics.recovered("reboot", 0.05)
+
+    text = render_text({"cam1": camera.metrics})
+    assert 'ptz_command_sent_total{camera="cam1",command="brighter"} 1' in text
+    assert 'ptz_command_completion_seconds_count{camera="cam1",command="brighter"} 1' in text
+    assert 'ptz_session_recoveries_total{camera="cam1",reason="reboot"} 1' in text
+
+    server = MetricsServer(lambda: {"cam1": camera.metrics}, port=0)
+    server.start()
+    try:
+        url = "http://127.0.0.1:%d" % server.port
+        with urllib.request.urlopen(url + "/metrics.json") as response:
+            exported = json.load(response)
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.read().decode() == render_text({"cam1": camera.metrics})
+    finally:
+        server.close()
+    assert exported["cam1"]["commands"]["brighter"]["completions"] == 1
+    assert exported["cam1"]["session"]["recoveries"] == {"reboot": 1}
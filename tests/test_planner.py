@@ -0,0 +1,74 @@
+import pytest
+
+from ptz.commands import PAN_SPEEDS, TILT_SPEEDS, commands
+from ptz.planner import EASINGS, MODELS, profile, plan_move
+
+START = {"pan": 0, "tilt": 0, "zoom": 0, "focus": 0x1000}
+
+
+def test_speed_bytes_survive_the_command_lambdas():
+    pan, tilt = MODELS["pan"], MODELS["tilt"]
+    for byte in range(1, TILT_SPEEDS + 1):
+        payload = commands["move"].get_command({"pan_speed": pan.fraction(byte), "tilt_speed": tilt.fraction(byte),
+                                               "postfix": [0x01, 0x01, 0xFF]})
+        assert (payload[4], payload[5]) == (byte, byte)
+    assert commands["move"].get_command({"pan_speed": pan.fraction(PAN_SPEEDS), "tilt_speed": 0.0,
+                                         "postfix": [0x01, 0x01, 0xFF]})[4] == PAN_SPEEDS
+
+
+def test_byte_for_is_the_nearest_speed():
+    pan = MODELS["pan"]
+    for byte in range(1, PAN_SPEEDS + 1):
+        assert pan.byte_for(pan.velocity(byte)) == byte
+    assert pan.byte_for(pan.velocity(1) / 3) == 0
+    assert pan.byte_for(pan.fastest() * 10) == PAN_SPEEDS
+
+
+def test_linear_move_arrives_together():
+    plan = plan_move(START, {"pan": 0x0800, "tilt": 0x0100, "zoom": 0x2000}, 3.0)
+
+    assert plan.duration == 3.0
+    names = [name for _, name, _ in plan.commands]
+    assert names == ["pan absolute position", "zoom tele var", "zoom direct"]
+    for axis in ("pan", "tilt", "zoom"):
+        # Within the step between neighbouring speed bytes
+        assert 3.0 * 0.7 < plan.arrivals[axis] < 3.0 * 1.5
+    for _, name, args in plan.commands:
+        commands[name].get_command(args)
+
+
+def test_a_move_too_fast_for_an_axis_is_stretched():
+    distance = MODELS["pan"].fastest() * 2
+    plan = plan_move(START, {"pan": int(distance)}, 0.5)
+    assert plan.duration == pytest.approx(2.0, rel=0.01)
+
+
+@pytest.mark.parametrize("easing", sorted(set(EASINGS) - {"linear"}))
+def test_an_eased_profile_covers_the_distance(easing):
+    distance, duration, segments = 0x0800, 3.0, 16
+    speeds = profile(distance, duration, easing, segments, MODELS["pan"])
+    travelled = sum(MODELS["pan"].velocity(byte) * duration / segments for byte in speeds)
+    assert travelled == pytest.approx(distance, rel=0.1)
+
+
+def test_an_eased_move_lands_exactly_with_a_handful_of_commands():
+    target = {"pan": 0x0800, "tilt": -0x0100, "zoom": 0x2000, "focus": 0x2000}
+    plan = plan_move(START, target, 3.0, "ease-in-out")
+
+    assert len(plan) < 3 * 16
+    offset, name, _ = plan.commands[-1]
+    assert offset == plan.duration
+    assert name in ("pan absolute position", "zoom direct")
+    landing = next(args for _, name, args in plan.commands if name == "pan absolute position")
+    assert (landing["pan"], landing["tilt"]) == (0x0800, -0x0100)
+    assert (0.0, "focus direct", 0x2000) in plan.commands
+    assert plan.arrivals == {"pan": 3.0, "tilt": 3.0, "zoom": 3.0, "focus": 0.0}
+
+    macro = plan.macro()
+    assert sum(step.delay for step in macro.steps) == pytest.approx(plan.duration)
+    assert [step.name for step in macro.steps if step.name] == [name for _, name, _ in plan.commands]
+
+
+def test_an_unreported_axis_cannot_be_planned():
+    with pytest.raises(ValueError):
+        plan_move(dict(START, pan=None), {"pan": 0x0800}, 1.0)
@@ -0,0 +1,62 @@
+import socket
+
+import pytest
+
+from ptz.protocol import COMPLETION, HEADER, VISCA_REPLY
+from ptz.simulator import SimulatedCamera
+
+
+@pytest.fixture
+def cameras(pool):
+    simulators = [SimulatedCamera(address, 0, execution_time=0.005) for address in ("127.0.0.51", "127.0.0.52")]
+    for simulator in simulators:
+        simulator.start()
+    cameras = [pool.add(simulator.address, simulator.port) for simulator in simulators]
+    pool.start()
+    yield list(zip(simulators, cameras))
+    for simulator in simulators:
+        simulator.close()
+
+
+def completions(camera):
+    received = []
+    camera.subscribe(lambda reply: received.append(reply.sequence_number) if reply.kind == COMPLETION else None)
+    return received
+
+
+def test_replies_reach_the_camera_they_came_from(cameras, wait_until):
+    (first_simulator, first), (second_simulator, second) = cameras
+    first_completed, second_completed = completions(first), completions(second)
+
+    sent = [first.send("brighter"), first.send("darker")]
+    assert wait_until(lambda: first_completed == sent)
+    assert second_completed == []
+    assert first_simulator.stats()["completions"] == 2 and second_simulator.stats()["completions"] == 0
+
+    sequence_number = second.send("brighter")
+    assert wait_until(lambda: second_completed == [sequence_number])
+    assert first_completed == sent
+
+
+def test_every_camera_counts_its_own_sequence_numbers(cameras, pool):
+    (_, first), (_, second) = cameras
+    assert [first.send("brighter"), first.send("brighter"), first.send("brighter")] == [1, 2, 3]
+    assert second.send("brighter") == 1
+
+    # The pool sends to the active camera, the first one added until another is selected
+    assert pool.active is first and pool.send("darker") == 4
+    pool.select(second.address, second.port)
+    assert pool.send("darker") == 2
+
+
+def test_datagrams_from_strangers_are_dropped(cameras, pool, wait_until):
+    (_, first), _ = cameras
+    replies = completions(first)
+    stranger = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        stranger.bind(("127.0.0.53", 0))
+        stranger.sendto(HEADER.pack(VISCA_REPLY, 3, 1) + b"\x90\x51\xFF", pool.socket.getsockname())
+        sequence_number = first.send("brighter")
+        assert wait_until(lambda: replies == [sequence_number])
+    finally:
+        stranger.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from ptz.presets import PresetLibrary
+
+POSITION = {"pan": 0x0400, "tilt": -0x0100, "zoom": 0x2000, "focus": 0x1000}
+SETTINGS = {"ae mode": 0x03, "fstop": 0x0C, "shutter": 0x09, "gain": 0x02, "wb mode": 0x01}
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = PresetLibrary(str(tmp_path / "presets.db"), slots=range(2))
+    yield library
+    library.close()
+
+
+def test_recall_paces_commands_into_the_buffer_and_mirrors_the_shot(simulator, camera, library, wait_until):
+    library.store(camera.address, "pulpit", POSITION, SETTINGS)
+    assert library.recall(camera, "pulpit") is not None
+
+    assert wait_until(lambda: not library.recalls)
+    assert wait_until(lambda: library.get(camera.address, "pulpit").slot == 0)
+    # Three moves and five settings, then the slot store
+    assert wait_until(lambda: simulator.stats()["completions"] == 9)
+    assert simulator.stats()["buffer full"] == 0
+
+
+def test_mirrored_shot_recalls_through_its_slot(simulator, camera, library, wait_until):
+    library.store(camera.address, "pulpit", POSITION)
+    library.recall(camera, "pulpit")
+    # Three moves, then the slot store
+    assert wait_until(lambda: simulator.stats()["completions"] == 4)
+    assert library.get(camera.address, "pulpit").slot == 0
+
+    library.recall(camera, "pulpit")
+    assert wait_until(lambda: not library.recalls)
+    assert simulator.stats()["completions"] == 5
+
+
+def test_recall_fails_when_a_completion_never_comes(simulator, camera, library, wait_until):
+    library.timeout = 0.2
+    library.store(camera.address, "pulpit", POSITION, SETTINGS)
+    recalled = []
+    simulator.loss = 1.0
+    library.recall(camera, "pulpit", done=recalled.append)
+    assert wait_until(lambda: recalled)
+
+    recall, = recalled
+    assert recall.failed == "timed out"
+    assert not library.recalls and not library.waiting
+    # Nothing reached, nothing mirrored
+    assert library.get(camera.address, "pulpit").slot is None
@@ -0,0 +1,58 @@
+import pytest
+
+from ptz.protocol import ACK, COMPLETION, CONTROL, CONTROL_REPLY, ERROR, HEADER, VISCA_REPLY, parse_reply
+
+
+def datagram(payload_type, sequence_number, payload):
+    payload = bytes.fromhex(payload)
+    return HEADER.pack(payload_type, len(payload), sequence_number) + payload
+
+
+def test_ack_and_completion_carry_their_socket():
+    ack = parse_reply(datagram(VISCA_REPLY, 0xD3, "90 41 FF"))
+    assert (ack.kind, ack.socket, ack.sequence_number, ack.error) == (ACK, 1, 0xD3, None)
+
+    completion = parse_reply(datagram(VISCA_REPLY, 0xD3, "90 52 FF"))
+    assert (completion.kind, completion.socket, completion.data) == (COMPLETION, 2, b"")
+
+
+def test_inquiry_results_are_the_bytes_of_the_completion():
+    reply = parse_reply(datagram(VISCA_REPLY, 9, "90 50 00 00 01 02 FF"))
+    assert reply.kind == COMPLETION and reply.data == b"\x00\x00\x01\x02"
+
+
+def test_errors_keep_their_code():
+    reply = parse_reply(datagram(VISCA_REPLY, 12, "90 61 41 FF"))
+    assert (reply.kind, reply.socket, reply.error) == (ERROR, 1, 0x41)
+
+
+def test_control_replies():
+    sequence_error = parse_reply(datagram(CONTROL_REPLY, 0xBA, "0F 01"))
+    assert (sequence_error.kind, sequence_error.error, sequence_error.sequence_number) == (CONTROL, 0x01, 0xBA)
+
+    reset = parse_reply(datagram(CONTROL_REPLY, 1, "01"))
+    assert reset.kind == CONTROL and reset.error is None
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    HEADER.pack(VISCA_REPLY, 0, 1),
+    datagram(VISCA_REPLY, 1, "90 41"),
+])
+def test_too_short_for_a_reply(data):
+    assert parse_reply(data) is None
+
+
+def test_the_length_field_bounds_the_payload():
+    # Trailing bytes past the declared length aren't part of the reply
+    reply = parse_reply(datagram(VISCA_REPLY, 3, "90 50 0A FF") + b"\x90\x60\x02\xFF")
+    assert reply.kind == COMPLETION and reply.data == b"\x0A"
+
+
+def test_the_receive_loop_stays_quiet(simulator, camera, wait_until, capsys):
+    replies = []
+    camera.subscribe(replies.append)
+    camera.send("brighter")
+    camera.send("fstop set", 0x0C)
+    assert wait_until(lambda: sum(reply.kind == COMPLETION for reply in replies) == 2)
+    assert capsys.readouterr().out == ""
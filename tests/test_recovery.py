@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from ptz.commands import DIRECTIONS, commands
+from ptz.recovery import SessionRecovery
+
+INTENDED = {
+    "ae mode": ("ae mode", 0x03),
+    "fstop": ("fstop set", 0x0C),
+    "shutter": ("shutter set", 0x09),
+    "gain": ("gain set", 0x02),
+    "wb mode": ("wb mode", 0x01),
+    "ex_ae_comp": ("ex_ae_comp set", 0x07),
+    "af mode": ("af mode manual", None),
+    "digital zoom": ("digital zoom on", None),
+}
+
+
+@pytest.fixture
+def recovery(camera):
+    recovery = SessionRecovery([camera], silence=0.3)
+    recovery.start()
+    yield recovery
+    recovery.stop()
+
+
+def restored(simulator):
+    """The intended commands the simulator holds the settings of, by state key."""
+    settings = set(simulator.settings.items())
+    held = set()
+    for key, (name, args) in INTENDED.items():
+        payload = commands[name].get_command(args)
+        # (category, id) -> the bytes after them, as the simulator keeps them
+        if ((payload[2], payload[3]), bytes(payload[4:-1])) in settings:
+            held.add(key)
+    return held
+
+
+def test_reboot_replays_every_setting_within_the_command_buffer(simulator, camera, recovery, wait_until):
+    camera.intended.update(INTENDED)
+    simulator.reboot(0.2)
+    time.sleep(0.3)
+    camera.send("brighter")
+
+    # Exposure compensation means nothing in Manual, it's left out rather than rejected
+    assert wait_until(lambda: restored(simulator) == set(INTENDED) - {"ex_ae_comp"})
+    assert wait_until(lambda: camera.metrics.session()["recoveries"] == {"sequence error": 1})
+    assert simulator.stats()["buffer full"] == 0
+    assert camera.metrics.session()["failed"] == {}
+
+
+def test_an_outage_is_recovered_once(simulator, camera, recovery, wait_until):
+    camera.intended.update({"ae mode": INTENDED["ae mode"], "gain": INTENDED["gain"]})
+    simulator.reboot(0.8)
+    deadline = time.monotonic() + 1.5
+    while time.monotonic() < deadline:
+        camera.send("brighter")
+        time.sleep(0.05)
+
+    assert wait_until(lambda: restored(simulator) == {"ae mode", "gain"})
+    time.sleep(0.3)
+    session = camera.metrics.session()
+    assert session["recoveries"] == {"reboot": 1}
+    assert session["failed"] == {}
+
+
+def test_a_network_outage_is_put_down_to_silence(simulator, camera, recovery, wait_until):
+    simulator.loss = 1.0
+    deadline = time.monotonic() + 0.6
+    while time.monotonic() < deadline:
+        camera.send("brighter")
+        time.sleep(0.05)
+    simulator.loss = 0.0
+    camera.send("brighter")
+
+    assert wait_until(lambda: camera.metrics.session()["recoveries"] == {"silence": 1})
+
+
+def test_a_reset_forgets_what_was_in_flight(simulator, camera):
+    simulator.loss = 1.0
+    camera.submit("move", {"speed": 0.5, "postfix": DIRECTIONS["left"]})
+    camera.submit("move", {"speed": 0.8, "postfix": DIRECTIONS["left"]})
+    assert camera.motion.in_flight and camera.motion.queued and camera.metrics.in_flight
+
+    camera.reset()
+    assert not camera.motion.in_flight and not camera.motion.queued and not camera.metrics.in_flight
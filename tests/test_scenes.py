@@ -0,0 +1,74 @@
+from ptz.commands import AE_MODES, commands
+from ptz.protocol import COMPLETION, HEADER, VISCA_REPLY
+from ptz.scenes import Scene, SceneLibrary
+
+STAGE = Scene("stage", {"ae mode": AE_MODES["Manual"], "fstop": 0x0C, "shutter": 0x09, "gain": 0x02,
+                        "ex_ae_comp": 0x07, "wb mode": 0x01, "af mode": 0x03, "focus": 0x1000,
+                        "digital zoom": False, "low latency": True})
+AUTO = {"ae mode": AE_MODES["Full Auto"], "ex ae comp": False, "wb mode": 0x00, "af mode": 0x02,
+        "digital zoom": False, "fstop": 0x0C}
+
+
+def trace(simulator):
+    """Logs ("run", sequence number, payload) and ("completion", sequence number) in the order the
+    simulator takes commands and answers them."""
+    events = []
+    command_received, transmit = simulator.command_received, simulator.transmit
+
+    def run(payload, sequence_number, client):
+        events.append(("run", sequence_number, bytes(payload)))
+        return command_received(payload, sequence_number, client)
+
+    def answer(client, datagram):
+        payload_type, _, sequence_number = HEADER.unpack_from(datagram)
+        if payload_type == VISCA_REPLY and datagram[HEADER.size + 1] & 0xF0 == COMPLETION:
+            events.append(("completion", sequence_number))
+        transmit(client, datagram)
+
+    simulator.command_received, simulator.transmit = run, answer
+    return events
+
+
+def test_plan_orders_by_dependency_and_skips_what_is_set(camera):
+    camera.state.update(AUTO)
+    steps = SceneLibrary().plan(camera, STAGE)
+
+    # fstop is already right, ex_ae_comp means nothing in Manual
+    assert [step.name for step in steps] == ["ae mode", "shutter set", "gain set", "wb mode", "af mode manual",
+                                             "focus direct", "low latency on"]
+    after = {step.setting.key: step.after for step in steps}
+    assert after["shutter"] == after["gain"] == {"ae mode"}
+    assert after["focus"] == {"af mode"}
+    assert after["wb mode"] == after["low latency"] == set()
+
+
+def test_dependents_wait_for_the_mode_to_complete(simulator, camera):
+    camera.state.update(AUTO)
+    events = trace(simulator)
+    run = SceneLibrary().apply(camera, STAGE)
+    assert run.finished.wait(2.0)
+
+    assert run.failed == {} and run.skipped == []
+    assert len(run.completed) == 7
+    assert simulator.stats()["buffer full"] == 0
+
+    def ran(name, args=None):
+        payload = commands[name].get_command(args)
+        return next(index for index, event in enumerate(events) if event[0] == "run" and event[2] == payload)
+
+    ae_mode_completed = events.index(("completion", events[ran("ae mode", AE_MODES["Manual"])][1]))
+    assert ran("shutter set", 0x09) > ae_mode_completed
+    assert ran("gain set", 0x02) > ae_mode_completed
+    af_mode_completed = events.index(("completion", events[ran("af mode manual")][1]))
+    assert ran("focus direct", 0x1000) > af_mode_completed
+
+
+def test_applying_again_sends_nothing(simulator, camera):
+    camera.state.update(AUTO)
+    library = SceneLibrary()
+    assert library.apply(camera, STAGE).finished.wait(2.0)
+    received = simulator.stats()["received"]
+
+    run = library.apply(camera, STAGE)
+    assert run.finished.is_set() and run.steps == []
+    assert simulator.stats()["received"] == received
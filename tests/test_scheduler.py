@@ -0,0 +1,45 @@
+from ptz.commands import DIRECTIONS, PAN_TILT, commands
+
+
+def move(speed):
+    return {"speed": speed, "postfix": DIRECTIONS["left"]}
+
+
+def received(simulator):
+    """Records the payloads ``simulator`` runs, in order."""
+    payloads = []
+    command_received = simulator.command_received
+
+    def spy(payload, sequence_number, client):
+        payloads.append(bytes(payload))
+        return command_received(payload, sequence_number, client)
+
+    simulator.command_received = spy
+    return payloads
+
+
+def test_motion_coalesces_to_the_latest_while_waiting_for_the_ack(simulator, camera, wait_until):
+    simulator.latency = 0.05
+    payloads = received(simulator)
+    for step in range(1, 21):
+        camera.submit("move", move(step / 20))
+
+    stats = camera.motion.stats()[PAN_TILT]
+    assert stats["submitted"] == 20
+    assert stats["coalesced"] == 18
+    assert wait_until(lambda: len(payloads) == 2)
+    assert payloads == [commands["move"].get_command(move(0.05)), commands["move"].get_command(move(1.0))]
+
+
+def test_stop_discards_queued_motion_and_goes_out_at_once(simulator, camera, wait_until):
+    simulator.latency = 0.05
+    payloads = received(simulator)
+    camera.submit("move", move(0.5))
+    camera.submit("move", move(0.8))
+    camera.submit("stop")
+
+    stats = camera.motion.stats()
+    assert stats[PAN_TILT]["cancelled"] == 1
+    assert stats["stop latency"]["count"] == 1
+    assert wait_until(lambda: len(payloads) == 2)
+    assert payloads == [commands["move"].get_command(move(0.5)), commands["stop"].get_command()]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from ptz.server import ControlServer
+
+
+@pytest.fixture
+def server(camera):
+    server = ControlServer(camera, port=0, lease=0.2)
+    server.start()
+    yield server
+    server.close()
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+
+    async def request(self, op, **request):
+        self.requests += 1
+        request.update(id=self.requests, op=op)
+        self.writer.write((json.dumps(request) + "\n").encode())
+        while True:
+            message = json.loads(await self.reader.readline())
+            if message.get("id") == self.requests:
+                return message
+
+
+async def connect(server):
+    return Connection(*await asyncio.open_connection("127.0.0.1", server.port))
+
+
+def test_a_stop_from_anybody_ends_the_holders_motion(server):
+    async def run():
+        director, operator = await connect(server), await connect(server)
+        await director.request("hello", name="director")
+        moved = await director.request("send", name="move", args={"speed": 0.5, "direction": "left"})
+        assert "error" not in moved
+
+        refused = await operator.request("send", name="move", args={"speed": 0.5, "direction": "right"})
+        assert refused["error"] == "%s is controlled by director" % server.cameras.address
+
+        assert "error" not in await operator.request("send", name="stop")
+        # Nothing of the director's is moving any more, so control lapses with the lease
+        await asyncio.sleep(server.lease + 0.1)
+        return await operator.request("send", name="move", args={"speed": 0.5, "direction": "right"})
+
+    assert "error" not in asyncio.run(run())
+
+
+def test_a_client_dropping_out_stops_what_it_left_moving(server, camera, wait_until):
+    async def run():
+        client = await connect(server)
+        await client.request("send", name="move", args={"speed": 0.5, "direction": "left"})
+        client.writer.close()
+
+    asyncio.run(run())
+    assert wait_until(lambda: camera.motion.stats()["stop latency"]["count"] == 1)
+    assert wait_until(lambda: server.holder(camera.address) is None)
@@ -0,0 +1,51 @@
+import pytest
+
+from ptz.state import INQUIRIES, InquiryPoller
+
+
+@pytest.fixture
+def poller(camera):
+    return InquiryPoller([camera], reply_timeout=0.5)
+
+
+def test_poll_decodes_every_inquiry_into_the_state_cache(simulator, camera, poller):
+    simulator.settings.update({
+        (0x04, 0x4B): bytes.fromhex("00 00 00 0C"),                          # fstop
+        (0x04, 0x39): b"\x03",                                               # ae mode
+        (0x04, 0x47): bytes.fromhex("02 00 00 00"),                          # zoom
+        (0x06, 0x02): bytes.fromhex("18 14 0F 0E 00 00 00 01 00 00"),        # absolute pan/tilt
+        (0x04, 0x06): b"\x02",                                               # digital zoom
+    })
+    poller.poll(camera)
+
+    state = camera.state
+    assert (state.get("fstop"), state.get("ae mode"), state.get("zoom")) == (0x0C, 0x03, 0x2000)
+    assert (state.get("pan"), state.get("tilt")) == (-0x200, 0x100)
+    assert state.get("digital zoom") is True
+    assert simulator.stats()["completions"] == len(INQUIRIES)
+    assert poller.outstanding == {}
+
+
+def test_poll_gives_up_on_a_silent_camera(simulator, camera):
+    simulator.loss = 1.0
+    poller = InquiryPoller([camera], batch_size=4, reply_timeout=0.05)
+    poller.poll(camera)
+
+    # One burst of four at a time, each given up on after the timeout
+    assert poller.outstanding == {}
+    assert simulator.stats()["received"] == len(INQUIRIES) + 1
+    assert camera.state.snapshot() == {}
+
+
+def test_apply_skips_what_the_camera_already_has(simulator, camera, poller, wait_until):
+    simulator.settings[(0x04, 0x4B)] = bytes.fromhex("00 00 00 0C")
+    poller.poll(camera)
+    received = simulator.stats()["received"]
+
+    assert camera.apply("fstop set", 0x0C, "fstop") is None
+    assert camera.intended["fstop"] == ("fstop set", 0x0C)
+    assert simulator.stats()["received"] == received
+
+    assert camera.apply("fstop set", 0x0A, "fstop") is not None
+    assert wait_until(lambda: simulator.stats()["received"] == received + 1)
+    assert camera.intended["fstop"] == ("fstop set", 0x0A)
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from ptz.worker import CommandWorker
+
+
+class Target:
+    """Records the calls the worker makes, ``hold`` blocks until ``release`` is set."""
+
+    def __init__(self):
+        self.calls = []
+        self.holding = threading.Event()
+        self.release = threading.Event()
+
+    def hold(self):
+        self.holding.set()
+        self.release.wait(2.0)
+
+    def speed(self, value):
+        self.calls.append(("speed", value))
+        return value
+
+    def stop(self):
+        self.calls.append(("stop",))
+
+    def fail(self):
+        raise ValueError("no such command")
+
+
+@pytest.fixture
+def target():
+    return Target()
+
+
+@pytest.fixture
+def finished():
+    return []
+
+
+@pytest.fixture
+def worker(target, finished):
+    worker = CommandWorker(target, done=lambda method, result, error: finished.append((method, result, error)))
+    worker.start()
+    yield worker
+    target.release.set()
+    worker.close()
+
+
+def busy(worker, target):
+    """Keeps the worker busy so what's posted next queues up."""
+    worker.post("hold")
+    assert target.holding.wait(2.0)
+
+
+def test_latest_keyed_intent_wins_in_the_first_ones_place(worker, target, wait_until):
+    busy(worker, target)
+    for value in range(5):
+        worker.post("speed", value, key="zoom")
+    worker.post("stop")
+    target.release.set()
+
+    assert wait_until(lambda: len(target.calls) == 2)
+    assert target.calls == [("speed", 4), ("stop",)]
+    assert worker.stats() == {"posted": 7, "replaced": 4, "discarded": 0, "executed": 3}
+
+
+def test_urgent_intents_skip_the_queue_and_drop_what_they_replace(worker, target, wait_until):
+    busy(worker, target)
+    worker.post("speed", 1, key="zoom")
+    worker.post("speed", 2, key="pan")
+    worker.post("stop", key="zoom", urgent=True)
+    worker.discard("pan")
+    assert worker.pending() == 1
+    target.release.set()
+
+    assert wait_until(lambda: worker.stats()["executed"] == 2)
+    assert target.calls == [("stop",)]
+    assert worker.stats()["discarded"] == 2
+
+
+def test_done_reports_results_and_errors(worker, finished, wait_until):
+    worker.post("speed", 3)
+    worker.post("fail")
+    assert wait_until(lambda: len(finished) == 2)
+
+    assert finished[0] == ("speed", 3, None)
+    method, result, error = finished[1]
+    assert method == "fail" and isinstance(error, ValueError)
+
+
+def test_sends_go_out_on_the_worker_thread(simulator, camera, wait_until):
+    threads = []
+    send = camera.send
+    camera.send = lambda *args: threads.append(threading.current_thread()) or send(*args)
+    worker = CommandWorker(camera)
+    worker.start()
+    try:
+        worker.post("send", "brighter")
+        assert wait_until(lambda: simulator.stats()["completions"] == 1)
+    finally:
+        worker.close()
+    assert threads and threads[0] is not threading.current_thread()